@@ -116,6 +116,8 @@ class DeviceService:
                 "temperature": data.get("temperature"),
                 "status": data.get("status"),
                 "timestamp": datetime.utcnow().isoformat(),
+                # Used by monitoring for per-device_type retention policies
+                "device_type": device.device_type,
             }
             if data.get("cpu_percent") is not None:
                 payload["cpu"] = data.get("cpu_percent")
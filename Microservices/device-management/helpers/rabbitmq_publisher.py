@@ -61,6 +61,8 @@ class RabbitMQPublisher:
                 body=json.dumps(message),
                 properties=pika.BasicProperties(
                     delivery_mode=2,  # Make message persistent
+                    # Partition key for the monitoring consistent-hash exchange
+                    headers={"device_id": str(device_data.get("device_id"))},
                 ),
             )
             logger.info(f"Published event '{event_type}' for device {device_data.get('device_id')}")
@@ -73,7 +75,10 @@ class RabbitMQPublisher:
                     exchange=self.exchange,
                     routing_key=f"device.{event_type}",
                     body=json.dumps(message),
-                    properties=pika.BasicProperties(delivery_mode=2),
+                    properties=pika.BasicProperties(
+                        delivery_mode=2,
+                        headers={"device_id": str(device_data.get("device_id"))},
+                    ),
                 )
             except Exception as retry_error:
                 logger.error(f"Retry failed: {retry_error}")
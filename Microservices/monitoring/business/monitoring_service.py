@@ -1,33 +1,260 @@
-from typing import List, Dict, Any, Optional
+from __future__ import annotations
+from typing import AsyncIterator, List, Dict, Any, Optional, Sequence, Tuple
 from datetime import datetime, timedelta
-from dal.monitoring_dao import (
+from dal.async_monitoring_dao import (
     insert_device_data,
     get_all_data,
     get_data_by_device_id,
     get_latest_data_by_device_id,
     get_data_by_time_range,
+    get_latest_data_per_device,
+    get_recent_temperatures,
+    iter_recent_temperatures,
+    get_temperature_stats,
 )
+from dal.rollup_dao import get_rollups, get_bucket_averages, RESOLUTION_SECONDS
+from dal.retention_dao import tier_sizes
+from dal.anomaly_dao import get_anomalies
+from helpers.latest_cache import latest_cache
+from helpers.ring_buffer import DeviceRingBuffer, ring_buffers
+from helpers.regression import Fit
+from helpers.config import PREDICT_BATCH_CHUNK_SIZE, HOLT_WINTERS_SEASON_DAYS, logger
+from business.prediction_service import (
+    METHOD_HOLT_WINTERS,
+    METHOD_LINEAR_REGRESSION,
+    batch_raw_predictions,
+    batch_results,
+    predict_temperature_from_arrays,
+    predict_temperature_from_state,
+)
+from helpers.model_executor import model_executor, ExecutorBusy, ExecutorTimeout
+from helpers.holt_winters import HoltWintersState
+from helpers.lazy_import import lazy_import
+
+np = lazy_import("numpy")
+
+# Holt-Winters seed: hourly rollup averages over the seasonal memory (at least one full season)
+_HW_SEED_RESOLUTION = "1h"
+_HW_SEED_DAYS = max(1.0, HOLT_WINTERS_SEASON_DAYS)
+
+
+async def _predict_chunk(
+    series: List[Tuple[str, Sequence[float], Sequence[float]]], limit: int, horizon_seconds: float
+) -> List[Dict[str, Any]]:
+    """
+    Pack (device_id, times, values) series into padded arrays and solve them in one batch, in the
+    model process pool for large chunks. Busy pool or timeout: one error line per device.
+    """
+    times = np.zeros((len(series), limit), dtype=np.float64)
+    values = np.zeros((len(series), limit), dtype=np.float64)
+    counts = np.zeros(len(series), dtype=np.int64)
+    for i, (_, t, v) in enumerate(series):
+        n = min(len(t), limit)
+        times[i, :n] = t[len(t) - n:]
+        values[i, :n] = v[len(v) - n:]
+        counts[i] = n
+    device_ids = [device_id for device_id, _, _ in series]
+    try:
+        raw_preds = await model_executor.run(
+            batch_raw_predictions,
+            {"times": times, "values": values, "counts": counts},
+            horizon_seconds,
+        )
+    except (ExecutorBusy, ExecutorTimeout) as e:
+        logger.warning(f"[PREDICT] Batch of {len(series)} device(s) not computed: {e}")
+        return [{"device_id": device_id, "error": f"Prediction unavailable: {e}"} for device_id in device_ids]
+    return batch_results(device_ids, counts, raw_preds, horizon_seconds)
+
+
+async def _seed_forecasters(buffers: List[Tuple[str, DeviceRingBuffer]]):
+    """Seed the Holt-Winters state of buffers not seeded yet from the hourly rollups (one query)"""
+    pending = [(device_id, buf) for device_id, buf in buffers if not buf.hw_seeded]
+    if not pending:
+        return
+    since = datetime.utcnow() - timedelta(days=_HW_SEED_DAYS)
+    series = await get_bucket_averages([device_id for device_id, _ in pending], _HW_SEED_RESOLUTION, since)
+    for device_id, buf in pending:
+        times, values = series.get(device_id, ([], []))
+        buf.seed_forecaster(times, values, RESOLUTION_SECONDS[_HW_SEED_RESOLUTION])
+
+
+def _forecast_device(device_id: str, buf: DeviceRingBuffer, horizon_seconds: float, limit: int) -> Dict[str, Any]:
+    """Holt-Winters forecast, or linear regression on the buffer until a full season of history exists"""
+    if buf.hw.has_full_season():
+        result = predict_temperature_from_state(buf.hw, next_seconds=horizon_seconds)
+    else:
+        times, values = buf.view(limit)
+        result = predict_temperature_from_arrays(
+            times, values, next_seconds=horizon_seconds, fit=buf.window_fit(len(values))
+        )
+        if result is not None:
+            result["requested_method"] = METHOD_HOLT_WINTERS
+    if result is None:
+        return {"device_id": device_id, "error": "Not enough data points with temperature for prediction."}
+    return {"device_id": device_id, **result}
 
 
 class MonitoringService:
-    def save_device_data(self, data: Dict[str, Any]) -> bool:
+    async def save_device_data(self, data: Dict[str, Any]) -> bool:
         """Save device data to MongoDB"""
-        return insert_device_data(data)
+        return await insert_device_data(data)
 
-    def get_all_device_data(self, limit: int = 100) -> List[Dict[str, Any]]:
+    async def get_all_device_data(self, limit: int = 100) -> List[Dict[str, Any]]:
         """Get all device data"""
-        return get_all_data(limit)
+        return await get_all_data(limit)
 
-    def get_device_data(self, device_id: str, limit: int = 100) -> List[Dict[str, Any]]:
+    async def get_device_data(self, device_id: str, limit: int = 100) -> List[Dict[str, Any]]:
         """Get data for a specific device"""
-        return get_data_by_device_id(device_id, limit)
+        return await get_data_by_device_id(device_id, limit)
+
+    async def get_latest_device_data(self, device_id: str) -> Optional[Dict[str, Any]]:
+        """Get latest data for a specific device (in-memory cache, MongoDB on a miss)"""
+        data = latest_cache.get(device_id)
+        if data is not None:
+            return data
+        data = await get_latest_data_by_device_id(device_id)
+        if data is not None:
+            latest_cache.update(data)
+        return data
+
+    async def warm_latest_cache(self) -> int:
+        """Load the latest reading of every device into the cache (startup)"""
+        documents = await get_latest_data_per_device(latest_cache.max_devices)
+        latest_cache.update_many(documents)
+        return len(documents)
+
+    async def get_recent_temperatures(self, device_id: str, limit: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (timestamps epoch, temperatures) of the last `limit` readings, chronological, served from
+        the device ring buffer. The buffer is filled from MongoDB when it cannot answer on its
+        own (device not tracked yet, fewer readings than requested, or not refreshed within
+        RING_BUFFER_MAX_AGE, e.g. the device is consumed by another replica).
+        """
+        buf = ring_buffers.get(device_id)
+        if buf is None or not ring_buffers.fresh(buf) or (not buf.warmed and buf.size < limit):
+            times, values = await get_recent_temperatures(device_id, ring_buffers.depth)
+            if not times and buf is None:
+                empty = np.empty(0, dtype=np.float64)
+                return empty, empty
+            buf = ring_buffers.warm(device_id, times, values)
+        return buf.view(limit)
 
-    def get_latest_device_data(self, device_id: str) -> Optional[Dict[str, Any]]:
-        """Get latest data for a specific device"""
-        return get_latest_data_by_device_id(device_id)
+    def get_temperature_fit(self, device_id: str, n: int) -> Optional[Fit]:
+        """Incremental regression of the device's last n readings, when n matches its sliding window"""
+        buf = ring_buffers.get(device_id)
+        return buf.window_fit(n) if buf is not None else None
 
-    def get_device_data_by_time_range(
+    async def get_forecaster(self, device_id: str) -> Optional[HoltWintersState]:
+        """
+        Holt-Winters state of the device, seeded from its hourly rollups then its buffered
+        history (None without data). Check has_full_season() before forecasting with it.
+        """
+        await self.get_recent_temperatures(device_id, ring_buffers.depth)
+        buf = ring_buffers.get(device_id)
+        if buf is None:
+            return None
+        await _seed_forecasters([(device_id, buf)])
+        return buf.hw
+
+    async def predict_batch(
+        self,
+        device_ids: Optional[List[str]],
+        horizon_seconds: float,
+        limit: int,
+        method: str = METHOD_LINEAR_REGRESSION,
+        chunk_size: int = PREDICT_BATCH_CHUNK_SIZE,
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Predictions for many devices (device_ids=None: every device), yielded chunk by chunk.
+        Devices whose ring buffer can answer (and is fresh) are served from memory; the others are loaded with
+        a single aggregation. Each chunk's regressions are solved in one NumPy computation;
+        Holt-Winters forecasts are read from the per-device state (buffers warmed from the
+        aggregation and seeded from the hourly rollups, as for a single device); devices without
+        a full season of history fall back to the linear regression.
+        """
+        holt_winters = method == METHOD_HOLT_WINTERS
+        # Holt-Winters state is built on the whole buffered history
+        needed = ring_buffers.depth if holt_winters else limit
+
+        async def solve(series: List[Tuple[str, Sequence[float], Sequence[float]]]) -> List[Dict[str, Any]]:
+            if not holt_winters:
+                return await _predict_chunk(series, limit, horizon_seconds)
+            warmed = [(device_id, ring_buffers.warm(device_id, t, v)) for device_id, t, v in series]
+            await _seed_forecasters(warmed)
+            return [_forecast_device(device_id, buf, horizon_seconds, limit) for device_id, buf in warmed]
+
+        hits: List[Tuple[str, Any]] = []
+        if device_ids is None:
+            candidates = ring_buffers.items()
+        else:
+            candidates = [(d, ring_buffers.get(d)) for d in dict.fromkeys(device_ids)]
+        for device_id, buf in candidates:
+            if buf is not None and ring_buffers.fresh(buf) and (buf.warmed or buf.size >= needed):
+                hits.append((device_id, buf))
+        for start in range(0, len(hits), chunk_size):
+            chunk_hits = hits[start:start + chunk_size]
+            if holt_winters:
+                await _seed_forecasters(chunk_hits)
+                yield [_forecast_device(device_id, buf, horizon_seconds, limit) for device_id, buf in chunk_hits]
+            else:
+                yield await _predict_chunk(
+                    [(device_id, *buf.view(limit)) for device_id, buf in chunk_hits], limit, horizon_seconds
+                )
+
+        hit_ids = [device_id for device_id, _ in hits]
+        if device_ids is None:
+            missing = None
+            rows = iter_recent_temperatures(needed, exclude_device_ids=hit_ids)
+        else:
+            served = set(hit_ids)
+            missing = [d for d in dict.fromkeys(device_ids) if d not in served]
+            if not missing:
+                return
+            rows = iter_recent_temperatures(needed, device_ids=missing)
+        chunk: List[Tuple[str, Sequence[float], Sequence[float]]] = []
+        found = set()
+        async for row in rows:
+            chunk.append(row)
+            found.add(row[0])
+            if len(chunk) >= chunk_size:
+                yield await solve(chunk)
+                chunk = []
+        if chunk:
+            yield await solve(chunk)
+        if missing is not None:
+            not_found = [
+                {"device_id": d, "error": f"No data found for device {d}"} for d in missing if d not in found
+            ]
+            if not_found:
+                yield not_found
+
+    async def get_temperature_stats(self, reference: float, per_device: int) -> List[Dict[str, Any]]:
+        """Average / mean absolute error against `reference` over the last `per_device` readings of every device"""
+        return await get_temperature_stats(reference, per_device)
+
+    async def get_anomalies(
+        self, device_id: Optional[str] = None, rule: Optional[str] = None, limit: int = 100
+    ) -> List[Dict[str, Any]]:
+        """Anomalies detected on ingest, newest first"""
+        return await get_anomalies(device_id, rule, limit)
+
+    async def get_device_data_by_time_range(
         self, device_id: str, start_time: datetime, end_time: datetime
     ) -> List[Dict[str, Any]]:
         """Get device data within a time range"""
-        return get_data_by_time_range(device_id, start_time, end_time)
+        return await get_data_by_time_range(device_id, start_time, end_time)
+
+    async def get_device_rollups(
+        self,
+        device_id: str,
+        resolution: str,
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+        limit: int = 500,
+    ) -> List[Dict[str, Any]]:
+        """Get rollup buckets (min/max/avg/count/last) for a specific device"""
+        return await get_rollups(device_id, resolution, start_time, end_time, limit)
+
+    async def get_retention_report(self, by_device_type: bool = False) -> Dict[str, Any]:
+        """Get retention policies and per-tier sizes (raw + rollups)"""
+        return await tier_sizes(by_device_type=by_device_type)
@@ -1,25 +1,29 @@
 """
 Prédiction 24h par notre modèle (entraîné sur les capteurs) + blend avec la météo.
 Avancé : on n'utilise pas seulement l'API météo, on entraîne un modèle sur les données
-du capteur et on le combine avec la prévision Open-Meteo pour les 24 prochaines heures.
+du capteur et on le combine avec la prévision Open-Meteo pour les 24 prochaines heures
+(ou 48h avec horizon_hours=48).
 """
-from typing import Any, Dict, List, Optional
-from datetime import datetime, timezone, timedelta
+from __future__ import annotations
 
-try:
-    from sklearn.linear_model import LinearRegression
-    import numpy as np
-    HAS_SKLEARN = True
-except ImportError:
-    HAS_SKLEARN = False
+from typing import Any, Dict, List, Optional, Sequence
+
+from helpers.lazy_import import lazy_import
+
+from helpers.regression import ols_fit
+
+np = lazy_import("numpy")
 
 WEATHER_ANCHOR_MARGIN = 15.0
 
 
-def predict_24h_blended(
-    sensor_points: List[Dict[str, Any]],
-    weather_hourly_24: List[Dict[str, Any]],
+def predict_24h_blended_from_columns(
+    temps_ts: Sequence[float],
+    values: Sequence[float],
+    weather_times: Sequence[Optional[str]],
+    weather_temperatures: Sequence[float],
     blend_factor: float = 0.5,
+    horizon_hours: int = 24,
 ) -> Optional[Dict[str, Any]]:
     """
     Prédit la température pour les 24 prochaines heures en combinant :
@@ -27,71 +31,54 @@ def predict_24h_blended(
     2) La prévision météo Open-Meteo (heure par heure)
     Pour chaque heure : blended = blend_factor * our_model + (1 - blend_factor) * weather.
     La prédiction "our_model" est bornée autour de la météo (±15 °C) pour rester réaliste.
+    Tout l'horizon est calculé d'un bloc (prédictions, bornage, blend).
 
-    sensor_points: liste de docs avec "timestamp" et "temperature", triés par timestamp croissant.
-    weather_hourly_24: liste de 24 dicts avec "time" (ISO) et "temperature".
+    temps_ts / values: timestamps epoch (s) et températures du capteur, ordre chronologique
+        (ex. vues NumPy du buffer circulaire du device).
+    weather_times / weather_temperatures: prévision horaire en colonnes (heures ISO, températures,
+        NaN si absente), ex. HourlyForecast de helpers.weather_client.
     blend_factor: poids de notre modèle (0 = 100% météo, 1 = 100% notre modèle).
+    horizon_hours: nombre d'heures prédites (jusqu'à 48 avec la prévision 48 h).
 
     Retourne { hourly: [ { time, our_model_temp, weather_temp, blended_temp } ], method } ou None.
     """
-    if not sensor_points or len(sensor_points) < 2:
-        return None
-    if not weather_hourly_24 or len(weather_hourly_24) < 24:
+    if len(temps_ts) < 2 or len(weather_times) < horizon_hours or len(weather_temperatures) < horizon_hours:
         return None
-    if not HAS_SKLEARN:
-        return _fallback_24h(sensor_points, weather_hourly_24, blend_factor)
-
-    temps_ts = []
-    values = []
-    for p in sensor_points:
-        t = p.get("timestamp")
-        v = p.get("temperature")
-        if t is not None and v is not None:
-            try:
-                ts = datetime.fromisoformat(t.replace("Z", "+00:00")).timestamp()
-                temps_ts.append(ts)
-                values.append(float(v))
-            except (ValueError, TypeError):
-                pass
-    if len(temps_ts) < 2:
+    weather_times = weather_times[:horizon_hours]
+    # Une heure sans horodatage invalide la prévision
+    if any(t is None for t in weather_times):
         return None
+    weather_temps = np.asarray(weather_temperatures, dtype=np.float64)[:horizon_hours]
 
-    X = np.array(temps_ts).reshape(-1, 1)
-    y = np.array(values)
-    model = LinearRegression()
-    model.fit(X, y)
-
-    last_ts = temps_ts[-1]
-    hourly: List[Dict[str, Any]] = []
-    for i, wh in enumerate(weather_hourly_24[:24]):
-        w_time = wh.get("time")
-        w_temp = wh.get("temperature")
-        if w_time is None:
-            continue
-        try:
-            # Timestamp de cette heure (prochaine heure = last_ts + 3600, etc.)
-            next_ts = last_ts + (i + 1) * 3600.0
-            our_pred = float(model.predict([[next_ts]])[0])
-            weather_temp = float(w_temp) if w_temp is not None else our_pred
-            # Borne notre prédiction autour de la météo (±15 °C)
-            low = weather_temp - WEATHER_ANCHOR_MARGIN
-            high = weather_temp + WEATHER_ANCHOR_MARGIN
-            our_clipped = max(low, min(high, our_pred))
-            blended = round(
-                blend_factor * our_clipped + (1.0 - blend_factor) * weather_temp,
-                2,
-            )
-            hourly.append({
-                "time": w_time,
-                "our_model_temp": round(our_clipped, 2),
-                "weather_temp": round(weather_temp, 2) if w_temp is not None else None,
-                "blended_temp": blended,
-            })
-        except (ValueError, TypeError):
-            continue
+    slope, intercept, t0 = ols_fit(temps_ts, values)
+    # Timestamp de chaque heure (prochaine heure = last_ts + 3600, etc.)
+    next_ts = float(temps_ts[-1]) + np.arange(1, horizon_hours + 1, dtype=np.float64) * 3600.0
+    our_pred = intercept + slope * (next_ts - t0)
+    has_weather = ~np.isnan(weather_temps)
+    weather_or_ours = np.where(has_weather, weather_temps, our_pred)
+    # Borne notre prédiction autour de la météo (±15 °C)
+    our_clipped = np.clip(
+        our_pred,
+        weather_or_ours - WEATHER_ANCHOR_MARGIN,
+        weather_or_ours + WEATHER_ANCHOR_MARGIN,
+    )
+    blended = blend_factor * our_clipped + (1.0 - blend_factor) * weather_or_ours
 
-    if len(hourly) < 24:
-        return None
+    hourly: List[Dict[str, Any]] = [
+        {
+            "time": t,
+            "our_model_temp": round(ours, 2),
+            "weather_temp": round(w, 2) if present else None,
+            "blended_temp": round(b, 2),
+        }
+        for t, ours, w, present, b in zip(
+            weather_times,
+            our_clipped.tolist(),
+            weather_temps.tolist(),
+            has_weather.tolist(),
+            blended.tolist(),
+        )
+    ]
     return {
         "hourly": hourly,
         "method": "linear_regression_blended",
@@ -100,39 +87,19 @@ def predict_24h_blended(
     }
 
 
-def _fallback_24h(
-    sensor_points: List[Dict[str, Any]],
-    weather_hourly_24: List[Dict[str, Any]],
+def blend_24h(
+    weather_times: Sequence[Optional[str]],
     blend_factor: float,
+    horizon_hours: int,
+    *,
+    temps_ts: np.ndarray,
+    values: np.ndarray,
+    weather_temperatures: np.ndarray,
 ) -> Optional[Dict[str, Any]]:
-    """Sans sklearn : moyenne des capteurs blendée avec la météo."""
-    temps = [float(p["temperature"]) for p in sensor_points if p.get("temperature") is not None]
-    if not temps:
-        return None
-    avg_sensor = sum(temps) / len(temps)
-    hourly: List[Dict[str, Any]] = []
-    for i, wh in enumerate(weather_hourly_24[:24]):
-        w_time = wh.get("time")
-        w_temp = wh.get("temperature")
-        if w_time is None:
-            continue
-        weather_temp = float(w_temp) if w_temp is not None else avg_sensor
-        low = weather_temp - WEATHER_ANCHOR_MARGIN
-        high = weather_temp + WEATHER_ANCHOR_MARGIN
-        our_clipped = max(low, min(high, avg_sensor))
-        blended = round(
-            blend_factor * our_clipped + (1.0 - blend_factor) * weather_temp,
-            2,
-        )
-        hourly.append({
-            "time": w_time,
-            "our_model_temp": round(our_clipped, 2),
-            "weather_temp": round(weather_temp, 2) if w_temp is not None else None,
-            "blended_temp": blended,
-        })
-    return {
-        "hourly": hourly,
-        "method": "average_blended",
-        "blend_factor": blend_factor,
-        "based_on_n_points": len(temps),
-    }
+    """
+    predict_24h_blended_from_columns avec les tableaux en arguments nommés : fonction de module,
+    exécutable par model_executor.run.
+    """
+    return predict_24h_blended_from_columns(
+        temps_ts, values, weather_times, weather_temperatures, blend_factor, horizon_hours
+    )
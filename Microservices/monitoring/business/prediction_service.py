@@ -1,13 +1,14 @@
 """Prédiction de température par device (régression linéaire sur les N dernières mesures)."""
-from typing import Any, Dict, List, Optional, Tuple
-from datetime import datetime, timezone
+from __future__ import annotations
 
-try:
-    from sklearn.linear_model import LinearRegression
-    import numpy as np
-    HAS_SKLEARN = True
-except ImportError:
-    HAS_SKLEARN = False
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from helpers.lazy_import import lazy_import
+
+from helpers.regression import Fit, ols_fit, ols_fit_batch, predict_at
+from helpers.holt_winters import HoltWintersState
+
+np = lazy_import("numpy")
 
 # Plage réaliste pour une température ambiante (°C) : évite 109 °C ou -50 °C
 GLOBAL_TEMP_MIN = -30.0
@@ -15,6 +16,10 @@ GLOBAL_TEMP_MAX = 70.0
 # Marge autour de la météo quand on ancre la prédiction (écart max capteur ↔ météo réaliste)
 WEATHER_ANCHOR_MARGIN = 15.0
 
+# Méthodes de prédiction (paramètre method= des routes de prédiction)
+METHOD_LINEAR_REGRESSION = "linear_regression"
+METHOD_HOLT_WINTERS = "holt_winters"
+
 
 def _clip_prediction(
     pred: float,
@@ -38,65 +43,125 @@ def _clip_prediction(
     return round(clipped, 2), was_clipped
 
 
-def predict_temperature(
-    points: List[Dict[str, Any]],
+def predict_temperature_from_arrays(
+    temps: Sequence[float],
+    values: Sequence[float],
     next_seconds: float = 60.0,
     weather_anchor: Optional[float] = None,
     anchor_margin: float = WEATHER_ANCHOR_MARGIN,
+    fit: Optional[Fit] = None,
 ) -> Optional[Dict[str, Any]]:
     """
     Prédit la température au prochain pas de temps à partir des N dernières mesures.
-    points: liste de docs avec "timestamp" et "temperature", triés par timestamp croissant.
+    temps / values: timestamps epoch (s) et températures, ordre chronologique
+        (ex. vues NumPy du buffer circulaire du device).
     next_seconds: horizon de prédiction en secondes (défaut 60).
     weather_anchor: si fourni (ex. météo prochaine heure), la prédiction est bornée autour
         de cette valeur (± anchor_margin) pour éviter des extrapolations irréalistes (ex. 109 °C).
     anchor_margin: écart max autorisé autour de weather_anchor (défaut 15 °C).
+    fit: ajustement déjà calculé sur ces points (sommes incrémentales du buffer), sinon
+        régression en forme close sur temps / values.
     Retourne { "predicted_temperature", "based_on_n_points", "horizon_seconds", "was_clipped", "raw_prediction" } ou None.
     """
-    if not points or len(points) < 2:
-        return None
-    temps = []
-    values = []
-    for p in points:
-        t = p.get("timestamp")
-        v = p.get("temperature")
-        if t is not None and v is not None:
-            try:
-                ts = datetime.fromisoformat(t.replace("Z", "+00:00")).timestamp()
-                temps.append(ts)
-                values.append(float(v))
-            except (ValueError, TypeError):
-                pass
     if len(temps) < 2:
         return None
-    if not HAS_SKLEARN:
-        avg = sum(values) / len(values)
-        clipped, was_clipped = _clip_prediction(avg, weather_anchor, anchor_margin)
-        out = {
-            "predicted_temperature": clipped,
-            "based_on_n_points": len(values),
-            "horizon_seconds": next_seconds,
-            "method": "average",
-            "was_clipped": was_clipped,
-        }
-        if was_clipped:
-            out["raw_prediction"] = round(avg, 2)
-        return out
-    X = np.array(temps).reshape(-1, 1)
-    y = np.array(values)
-    model = LinearRegression()
-    model.fit(X, y)
-    last_ts = temps[-1]
-    next_ts = last_ts + next_seconds
-    raw_pred = float(model.predict([[next_ts]])[0])
+    if fit is None:
+        fit = ols_fit(temps, values)
+    next_ts = float(temps[-1]) + next_seconds
+    raw_pred = predict_at(fit, next_ts)
     clipped, was_clipped = _clip_prediction(raw_pred, weather_anchor, anchor_margin)
     out = {
         "predicted_temperature": clipped,
         "based_on_n_points": len(values),
         "horizon_seconds": next_seconds,
-        "method": "linear_regression",
+        "method": METHOD_LINEAR_REGRESSION,
         "was_clipped": was_clipped,
     }
     if was_clipped:
         out["raw_prediction"] = round(raw_pred, 2)
     return out
+
+
+def fit_and_predict(
+    next_seconds: float,
+    weather_anchor: Optional[float],
+    anchor_margin: float,
+    *,
+    temps: np.ndarray,
+    values: np.ndarray,
+) -> Optional[Dict[str, Any]]:
+    """
+    predict_temperature_from_arrays avec les tableaux en arguments nommés : fonction de module,
+    exécutable par model_executor.run (pool de processus au-delà de MODEL_EXECUTOR_MIN_CELLS).
+    """
+    return predict_temperature_from_arrays(temps, values, next_seconds, weather_anchor, anchor_margin)
+
+
+def predict_temperature_from_state(
+    state: HoltWintersState,
+    next_seconds: float = 60.0,
+    weather_anchor: Optional[float] = None,
+    anchor_margin: float = WEATHER_ANCHOR_MARGIN,
+) -> Optional[Dict[str, Any]]:
+    """
+    Prédiction Holt-Winters : lecture de l'état tenu à jour à l'ingestion (niveau, tendance
+    amortie, saisonnalité journalière), sans calcul sur l'historique. Bornage et résultat
+    comme predict_temperature_from_arrays ; based_on_n_points = lectures intégrées à l'état.
+    """
+    raw_pred = state.forecast(next_seconds)
+    if raw_pred is None:
+        return None
+    clipped, was_clipped = _clip_prediction(raw_pred, weather_anchor, anchor_margin)
+    out = {
+        "predicted_temperature": clipped,
+        "based_on_n_points": state.count,
+        "horizon_seconds": next_seconds,
+        "method": METHOD_HOLT_WINTERS,
+        "was_clipped": was_clipped,
+    }
+    if was_clipped:
+        out["raw_prediction"] = round(raw_pred, 2)
+    return out
+
+
+def batch_raw_predictions(
+    next_seconds: float, *, times: np.ndarray, values: np.ndarray, counts: np.ndarray
+) -> np.ndarray:
+    """
+    Prédictions brutes (non bornées) de plusieurs devices : toutes les régressions sont résolues
+    en un calcul NumPy (ols_fit_batch). Fonction de module : exécutable dans le pool de processus.
+    """
+    slopes, intercepts, t0s = ols_fit_batch(times, values, counts)
+    last_ts = times[np.arange(len(counts)), np.maximum(counts, 1) - 1]
+    return intercepts + slopes * (last_ts + next_seconds - t0s)
+
+
+def batch_results(
+    device_ids: List[str], counts: np.ndarray, raw_preds: np.ndarray, next_seconds: float
+) -> List[Dict[str, Any]]:
+    """
+    Bornage et mise en forme des prédictions brutes : un résultat par device (même format que
+    /predict, avec "device_id"), ou { "device_id", "error" } quand il y a moins de 2 points.
+    """
+    results: List[Dict[str, Any]] = []
+    for device_id, count, raw_pred in zip(device_ids, counts.tolist(), raw_preds.tolist()):
+        if count < 2:
+            results.append({
+                "device_id": device_id,
+                "error": "Not enough data points with temperature for prediction.",
+            })
+            continue
+        clipped, was_clipped = _clip_prediction(raw_pred)
+        out = {
+            "device_id": device_id,
+            "predicted_temperature": clipped,
+            "based_on_n_points": count,
+            "horizon_seconds": next_seconds,
+            "method": METHOD_LINEAR_REGRESSION,
+            "was_clipped": was_clipped,
+        }
+        if was_clipped:
+            out["raw_prediction"] = round(raw_pred, 2)
+        results.append(out)
+    return results
+
@@ -1,17 +1,32 @@
-"""Analyse météo ↔ capteurs : anomalies et corrélation (écart moyen)."""
+"""
+Analyse météo ↔ capteurs : anomalies et corrélation (écart moyen).
+Les statistiques par device (moyenne, erreur absolue moyenne, nombre de lectures sur les N
+dernières lectures de chaque device) sont calculées côté MongoDB
+(dal.async_monitoring_dao.get_temperature_stats) : chaque device compte, même peu actif.
+"""
 from typing import Any, Dict, List, Optional
-from collections import defaultdict
 
-ANOMALY_THRESHOLD_CELSIUS = 5.0  # écart > 5 °C → anomalie
+from helpers.config import ANOMALY_WEATHER_THRESHOLD
+
+# écart > 5 °C (par défaut) → anomalie ; même seuil que la détection en flux à l'ingestion
+ANOMALY_THRESHOLD_CELSIUS = ANOMALY_WEATHER_THRESHOLD
 MAX_READINGS_PER_DEVICE = 15
 
 
+def weather_reference_temperature(weather_current: Optional[Dict[str, Any]]) -> float:
+    """Température météo de référence (0 °C si inconnue)"""
+    temperature = (weather_current or {}).get("temperature")
+    return 0.0 if temperature is None else float(temperature)
+
+
 def compute_weather_analysis(
     weather_current: Optional[Dict[str, Any]],
-    all_device_data: List[Dict[str, Any]],
+    device_stats: List[Dict[str, Any]],
 ) -> Dict[str, Any]:
     """
     Compare la météo actuelle aux mesures des capteurs.
+    device_stats : [ { device_id, avg_temp, mean_abs_error, sample_count } ], l'erreur absolue
+    étant calculée par rapport à weather_reference_temperature(weather_current).
     Retourne { city, weather_temp, weather_humidity, devices: [ { device_id, avg_temp, deviation, is_anomaly, mean_abs_error, sample_count } ] }.
     """
     if not weather_current:
@@ -21,45 +36,23 @@ def compute_weather_analysis(
             "weather_humidity": None,
             "devices": [],
         }
-    weather_temp = weather_current.get("temperature")
-    if weather_temp is None:
-        weather_temp = 0.0
-    else:
-        weather_temp = float(weather_temp)
-
-    # Grouper par device_id, garder les N dernières mesures avec température
-    by_device: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
-    for doc in all_device_data:
-        did = doc.get("device_id")
-        if not did:
-            continue
-        t = doc.get("temperature")
-        if t is None:
-            continue
-        try:
-            by_device[did].append({"temperature": float(t), "timestamp": doc.get("timestamp")})
-        except (TypeError, ValueError):
-            continue
+    weather_temp = weather_reference_temperature(weather_current)
 
     devices_result: List[Dict[str, Any]] = []
-    for device_id, readings in by_device.items():
-        # Dernières N lectures (déjà souvent triées par date décroissante)
-        recent = readings[:MAX_READINGS_PER_DEVICE]
-        temps = [r["temperature"] for r in recent]
-        if not temps:
+    for stats in device_stats:
+        if not stats.get("sample_count") or stats.get("avg_temp") is None:
             continue
-        avg_temp = sum(temps) / len(temps)
+        avg_temp = float(stats["avg_temp"])
         deviation = avg_temp - weather_temp
-        mean_abs_error = sum(abs(t - weather_temp) for t in temps) / len(temps)
         is_anomaly = abs(deviation) > ANOMALY_THRESHOLD_CELSIUS
 
         devices_result.append({
-            "device_id": device_id,
+            "device_id": stats["device_id"],
             "avg_temp": round(avg_temp, 2),
             "deviation": round(deviation, 2),
             "is_anomaly": is_anomaly,
-            "mean_abs_error": round(mean_abs_error, 2),
-            "sample_count": len(temps),
+            "mean_abs_error": round(float(stats["mean_abs_error"]), 2),
+            "sample_count": int(stats["sample_count"]),
         })
 
     # Trier par device_id pour affichage stable
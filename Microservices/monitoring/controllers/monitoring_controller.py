@@ -1,13 +1,31 @@
 from typing import List, Optional, Any
 from fastapi import APIRouter, Query, HTTPException
+from fastapi.responses import StreamingResponse
+import json
 from datetime import datetime, timedelta
 from business.monitoring_service import MonitoringService
-from business.prediction_service import predict_temperature
-from business.weather_analysis import compute_weather_analysis
-from business.prediction_24h import predict_24h_blended
-from models.device_data import DeviceDataResponse, DeviceDataRequest
+from business.prediction_service import fit_and_predict, predict_temperature_from_arrays, predict_temperature_from_state
+from business.weather_analysis import (
+    compute_weather_analysis,
+    weather_reference_temperature,
+    MAX_READINGS_PER_DEVICE,
+)
+from business.prediction_24h import blend_24h
+from models.device_data import (
+    DeviceDataResponse,
+    DeviceDataRequest,
+    DeviceRollupResponse,
+    BatchPredictionRequest,
+    PredictionMethod,
+)
+from dal.rollup_dao import ACTIVE_RESOLUTIONS
 from helpers.config import logger
-from helpers.weather_client import fetch_current_weather, search_cities, fetch_forecast
+from helpers.prediction_cache import prediction_cache
+from helpers.model_executor import model_executor, ExecutorBusy, ExecutorTimeout
+from helpers.weather_client import fetch_current_weather, search_cities, fetch_forecast, fetch_hourly_forecast
+from helpers.lazy_import import lazy_import
+
+np = lazy_import("numpy")
 
 router = APIRouter(prefix="/monitoring", tags=["monitoring"])
 monitoring_service = MonitoringService()
@@ -16,7 +34,7 @@ monitoring_service = MonitoringService()
 @router.get("/data", response_model=List[DeviceDataResponse])
 async def get_all_data(limit: int = Query(default=100, ge=1, le=1000)):
     """Get all device monitoring data"""
-    data = monitoring_service.get_all_device_data(limit=limit)
+    data = await monitoring_service.get_all_device_data(limit=limit)
     return data
 
 
@@ -25,7 +43,7 @@ async def get_device_data(
     device_id: str, limit: int = Query(default=100, ge=1, le=1000)
 ):
     """Get monitoring data for a specific device"""
-    data = monitoring_service.get_device_data(device_id, limit=limit)
+    data = await monitoring_service.get_device_data(device_id, limit=limit)
     if not data:
         raise HTTPException(status_code=404, detail=f"No data found for device {device_id}")
     return data
@@ -34,7 +52,7 @@ async def get_device_data(
 @router.get("/data/{device_id}/latest", response_model=DeviceDataResponse)
 async def get_latest_device_data(device_id: str):
     """Get latest monitoring data for a specific device"""
-    data = monitoring_service.get_latest_device_data(device_id)
+    data = await monitoring_service.get_latest_device_data(device_id)
     if not data:
         raise HTTPException(
             status_code=404, detail=f"No data found for device {device_id}"
@@ -57,10 +75,48 @@ async def get_device_data_by_range(
             status_code=400, detail="Invalid date format. Use ISO format (e.g., 2025-01-28T10:00:00Z)"
         )
 
-    data = monitoring_service.get_device_data_by_time_range(device_id, start, end)
+    data = await monitoring_service.get_device_data_by_time_range(device_id, start, end)
+    return data
+
+
+@router.get("/data/{device_id}/rollup", response_model=List[DeviceRollupResponse])
+async def get_device_rollup(
+    device_id: str,
+    resolution: str = Query(default="1h", description="Bucket size (1m, 1h or 1d)"),
+    start_time: Optional[str] = Query(default=None, description="Start time in ISO format"),
+    end_time: Optional[str] = Query(default=None, description="End time in ISO format"),
+    limit: int = Query(default=500, ge=1, le=5000),
+):
+    """Get min/max/avg/count/last per bucket for a device (continuous rollups, newest first)"""
+    if resolution not in ACTIVE_RESOLUTIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid resolution. Use one of: {', '.join(ACTIVE_RESOLUTIONS)}",
+        )
+    try:
+        start = datetime.fromisoformat(start_time.replace("Z", "+00:00")) if start_time else None
+        end = datetime.fromisoformat(end_time.replace("Z", "+00:00")) if end_time else None
+    except ValueError:
+        raise HTTPException(
+            status_code=400, detail="Invalid date format. Use ISO format (e.g., 2025-01-28T10:00:00Z)"
+        )
+
+    data = await monitoring_service.get_device_rollups(device_id, resolution, start, end, limit=limit)
     return data
 
 
+@router.get("/retention", response_model=dict)
+async def get_retention_report(
+    by_device_type: bool = Query(default=False, description="Count raw readings per device_type (full scan)"),
+):
+    """Retention policies and per-tier sizes (raw readings, rollups per resolution)"""
+    try:
+        return await monitoring_service.get_retention_report(by_device_type=by_device_type)
+    except Exception as e:
+        logger.error(f"Error building retention report: {e}")
+        raise HTTPException(status_code=503, detail="Retention report unavailable")
+
+
 @router.post("/data", response_model=dict, status_code=201)
 async def add_device_data(data: DeviceDataRequest):
     """Manually add device data (usually data comes from RabbitMQ)"""
@@ -68,12 +124,22 @@ async def add_device_data(data: DeviceDataRequest):
     if not data_dict.get("timestamp"):
         data_dict["timestamp"] = datetime.utcnow().isoformat()
 
-    success = monitoring_service.save_device_data(data_dict)
+    success = await monitoring_service.save_device_data(data_dict)
     if success:
         return {"message": "Data saved successfully"}
     raise HTTPException(status_code=500, detail="Failed to save data")
 
 
+@router.get("/anomalies", response_model=List[dict])
+async def list_anomalies(
+    device_id: Optional[str] = Query(default=None, description="Limiter à un device"),
+    rule: Optional[str] = Query(default=None, description="weather_deviation, zscore ou rate_of_change"),
+    limit: int = Query(default=100, ge=1, le=1000),
+):
+    """Anomalies détectées à l'ingestion (les plus récentes d'abord), aussi poussées en direct via Socket.IO (device_anomaly)."""
+    return await monitoring_service.get_anomalies(device_id=device_id, rule=rule, limit=limit)
+
+
 @router.get("/weather/current", response_model=dict)
 async def get_weather_current(
     lat: float = Query(default=48.8566, description="Latitude"),
@@ -81,7 +147,7 @@ async def get_weather_current(
     city: str = Query(default="Paris", description="Nom de la ville"),
 ):
     """Météo actuelle via Open-Meteo (gratuit, sans clé API)."""
-    result = fetch_current_weather(lat=lat, lon=lon, city=city)
+    result = await fetch_current_weather(lat=lat, lon=lon, city=city)
     if result is None:
         raise HTTPException(
             status_code=503,
@@ -96,7 +162,7 @@ async def search_weather_city(
     count: int = Query(default=5, ge=1, le=10),
 ):
     """Recherche de villes via l'API de géocodage Open-Meteo (autocomplete)."""
-    suggestions = search_cities(q, count=count)
+    suggestions = await search_cities(q, count=count)
     if suggestions is None:
         raise HTTPException(
             status_code=503,
@@ -113,7 +179,7 @@ async def get_weather_forecast(
     days: int = Query(default=7, ge=1, le=7),
 ):
     """Prévisions 7 jours + horaires 24h + prédiction prochaine heure (Open-Meteo)."""
-    result = fetch_forecast(lat=lat, lon=lon, city=city, days=days)
+    result = await fetch_forecast(lat=lat, lon=lon, city=city, days=days)
     if result is None:
         raise HTTPException(
             status_code=503,
@@ -127,17 +193,24 @@ async def get_weather_analysis(
     lat: float = Query(default=48.8566, description="Latitude"),
     lon: float = Query(default=2.3522, description="Longitude"),
     city: str = Query(default="Paris", description="Nom de la ville"),
-    limit_data: int = Query(default=100, ge=10, le=500),
+    readings_per_device: int = Query(
+        default=MAX_READINGS_PER_DEVICE, ge=1, le=500, description="Dernières lectures prises par device"
+    ),
+    limit_data: Optional[int] = Query(
+        default=None, ge=10, le=500, deprecated=True, description="Ignoré : remplacé par readings_per_device"
+    ),
 ):
-    """Analyse météo ↔ capteurs : anomalies (écart > seuil) et corrélation (écart moyen)."""
-    weather_current = fetch_current_weather(lat=lat, lon=lon, city=city)
+    """Analyse météo ↔ capteurs : anomalies (écart > seuil) et corrélation (écart moyen), sur les dernières lectures de chaque device."""
+    weather_current = await fetch_current_weather(lat=lat, lon=lon, city=city)
     if weather_current is None:
         raise HTTPException(
             status_code=503,
             detail="Service météo temporairement indisponible.",
         )
-    all_data = monitoring_service.get_all_device_data(limit=limit_data)
-    result = compute_weather_analysis(weather_current, all_data)
+    device_stats = await monitoring_service.get_temperature_stats(
+        weather_reference_temperature(weather_current), readings_per_device
+    )
+    result = compute_weather_analysis(weather_current, device_stats)
     return result
 
 
@@ -149,58 +222,155 @@ async def get_weather_prediction_24h(
     device_id: str = Query(..., description="Device ID pour entraîner notre modèle sur les capteurs"),
     blend_factor: float = Query(default=0.5, ge=0.0, le=1.0, description="Poids notre modèle (0=100% météo, 1=100% notre modèle)"),
     limit: int = Query(default=50, ge=5, le=200),
+    horizon_hours: int = Query(default=24, ge=1, le=48, description="Horizon de prédiction en heures (jusqu'à 48h)"),
 ):
     """Prédiction 24h par notre modèle (entraîné sur les capteurs) + blend avec la météo Open-Meteo. Avancé : on n'utilise pas seulement l'API, on entraîne un modèle sur vos données IoT et on le combine avec la prévision."""
-    forecast = fetch_forecast(lat=lat, lon=lon, city=city, days=2)
-    if forecast is None or not forecast.get("hourly_24"):
+    hourly = await fetch_hourly_forecast(lat=lat, lon=lon)
+    if hourly is None or len(hourly) == 0:
         raise HTTPException(
             status_code=503,
             detail="Service de prévisions météo temporairement indisponible.",
         )
-    sensor_data = monitoring_service.get_device_data(device_id, limit=limit)
-    if not sensor_data or len(sensor_data) < 2:
+    temps_ts, values = await monitoring_service.get_recent_temperatures(device_id, limit)
+    if len(values) < 2:
         raise HTTPException(
             status_code=404,
             detail=f"Pas assez de données capteur pour {device_id} (minimum 2 points).",
         )
-    points = list(reversed(sensor_data))
-    weather_hourly_24 = forecast["hourly_24"]
-    result = predict_24h_blended(points, weather_hourly_24, blend_factor=blend_factor)
+    result = await _run_model(
+        blend_24h,
+        {
+            "temps_ts": temps_ts,
+            "values": values,
+            "weather_temperatures": np.asarray(hourly.temperatures, dtype=np.float64),
+        },
+        hourly.times,
+        blend_factor,
+        horizon_hours,
+    )
     if result is None:
         raise HTTPException(
             status_code=400,
-            detail="Impossible de calculer la prédiction 24h (données insuffisantes).",
+            detail=f"Impossible de calculer la prédiction {horizon_hours}h (données insuffisantes).",
         )
     result["city"] = city
     result["device_id"] = device_id
     return result
 
 
-@router.get("/data/{device_id}/predict", response_model=dict)
-async def get_device_prediction(
-    device_id: str,
-    horizon_seconds: float = Query(default=60.0, ge=1.0, le=3600.0),
-    limit: int = Query(default=30, ge=2, le=100),
-):
-    """Prédiction de température pour le prochain pas (ML: régression linéaire sur les N dernières mesures)."""
-    data = monitoring_service.get_device_data(device_id, limit=limit)
-    if not data:
+async def _run_model(fn, arrays: dict, *args: Any) -> Any:
+    """Ajustement via model_executor (en ligne pour les petites entrées) ; 503 si saturé ou trop long"""
+    try:
+        return await model_executor.run(fn, arrays, *args)
+    except (ExecutorBusy, ExecutorTimeout) as e:
         raise HTTPException(
-            status_code=404,
-            detail=f"No data found for device {device_id}",
+            status_code=503,
+            detail=f"Prediction workers busy, retry later ({e}).",
+            headers={"Retry-After": "1"},
+        )
+
+
+async def _predict_device(
+    device_id: str,
+    method: PredictionMethod,
+    horizon_seconds: float,
+    limit: int,
+    weather_anchor: Optional[float] = None,
+    anchor_margin: float = 15.0,
+) -> dict:
+    """
+    Prédiction d'un device (régression sur le buffer ou état Holt-Winters, amorcé par les rollups
+    horaires et remplacé par la régression sans une saison complète) ; 404 sans données,
+    400 si insuffisantes. Servie depuis le cache tant qu'aucune lecture du device n'est arrivée
+    (au plus PREDICTION_CACHE_MAX_AGE s).
+    """
+    key = (method.value, horizon_seconds, limit, weather_anchor, anchor_margin)
+    cached = prediction_cache.get(device_id, key)
+    if cached is not None:
+        return cached
+    generation = prediction_cache.generation()
+    state = None
+    if method == PredictionMethod.holt_winters:
+        state = await monitoring_service.get_forecaster(device_id)
+        if state is None:
+            raise HTTPException(status_code=404, detail=f"No data found for device {device_id}")
+    if state is not None and state.has_full_season():
+        result = predict_temperature_from_state(
+            state, next_seconds=horizon_seconds, weather_anchor=weather_anchor, anchor_margin=anchor_margin
         )
-    # Données triées par timestamp décroissant; on inverse pour ordre chronologique
-    points = list(reversed(data))
-    result = predict_temperature(points, next_seconds=horizon_seconds)
+    else:
+        # Régression sur les dernières mesures en ordre chronologique (buffer circulaire du device),
+        # aussi en repli de Holt-Winters tant qu'une saison complète d'historique manque
+        temps_ts, values = await monitoring_service.get_recent_temperatures(device_id, limit)
+        if len(values) == 0:
+            raise HTTPException(status_code=404, detail=f"No data found for device {device_id}")
+        fit = monitoring_service.get_temperature_fit(device_id, len(values))
+        if fit is not None:
+            # Sommes incrémentales du buffer : prédiction en O(1), sans ajustement
+            result = predict_temperature_from_arrays(
+                temps_ts,
+                values,
+                next_seconds=horizon_seconds,
+                weather_anchor=weather_anchor,
+                anchor_margin=anchor_margin,
+                fit=fit,
+            )
+        else:
+            result = await _run_model(
+                fit_and_predict,
+                {"temps": temps_ts, "values": values},
+                horizon_seconds,
+                weather_anchor,
+                anchor_margin,
+            )
+        if result is not None and state is not None:
+            result["requested_method"] = PredictionMethod.holt_winters.value
     if result is None:
         raise HTTPException(
             status_code=400,
             detail="Not enough data points with temperature for prediction.",
         )
+    prediction_cache.put(device_id, key, result, generation)
+    return result
+
+
+@router.get("/data/{device_id}/predict", response_model=dict)
+async def get_device_prediction(
+    device_id: str,
+    horizon_seconds: float = Query(default=60.0, ge=1.0, le=3600.0),
+    limit: int = Query(default=30, ge=2, le=100),
+    method: PredictionMethod = Query(default=PredictionMethod.linear_regression),
+):
+    """Prédiction de température pour le prochain pas (ML: régression linéaire sur les N dernières mesures, ou Holt-Winters avec method=holt_winters)."""
+    result = await _predict_device(device_id, method, horizon_seconds, limit)
     result["device_id"] = device_id
     return result
 
 
+@router.post("/predict/batch")
+async def predict_batch(request: BatchPredictionRequest):
+    """
+    Prédiction pour toute la flotte (ou une liste de devices) en une requête : points chargés
+    par une seule agrégation (ou depuis les buffers), régressions résolues en un calcul NumPy.
+    Réponse en flux NDJSON, une ligne par device (même format que /data/{device_id}/predict).
+    """
+    if model_executor.saturated():
+        raise HTTPException(
+            status_code=503,
+            detail="Prediction workers busy, retry later.",
+            headers={"Retry-After": "1"},
+        )
+    device_ids = None if request.device_ids == "all" else request.device_ids
+
+    async def lines():
+        async for results in monitoring_service.predict_batch(
+            device_ids, request.horizon_seconds, request.limit, request.method.value
+        ):
+            yield "".join(json.dumps(result) + "\n" for result in results)
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
 @router.get("/data/{device_id}/predict-weather-aware", response_model=dict)
 async def get_device_prediction_weather_aware(
     device_id: str,
@@ -210,32 +380,21 @@ async def get_device_prediction_weather_aware(
     horizon_seconds: float = Query(default=3600.0, ge=60.0, le=86400.0),
     limit: int = Query(default=30, ge=2, le=100),
     blend_factor: float = Query(default=0.6, ge=0.0, le=1.0, description="Poids prédiction device (1=100% device, 0=100% météo)"),
+    method: PredictionMethod = Query(default=PredictionMethod.linear_regression),
 ):
     """Prédiction weather-aware : combine prédiction device (ML) + prévision météo (prochaine heure). La prédiction device est bornée autour de la météo (±15 °C) pour éviter des valeurs irréalistes (ex. 109 °C)."""
-    forecast = fetch_forecast(lat=lat, lon=lon, city=city, days=1)
-    weather_next_hour = None
-    if forecast and forecast.get("next_hour"):
-        weather_next_hour = forecast["next_hour"].get("temperature")
+    hourly = await fetch_hourly_forecast(lat=lat, lon=lon)
+    weather_next_hour = hourly.next_hour_temperature() if hourly is not None else None
 
-    data = monitoring_service.get_device_data(device_id, limit=limit)
-    if not data:
-        raise HTTPException(
-            status_code=404,
-            detail=f"No data found for device {device_id}",
-        )
-    points = list(reversed(data))
     # Ancrage météo : la prédiction device est bornée à [météo - 15, météo + 15] °C pour éviter 109 °C
-    device_pred_result = predict_temperature(
-        points,
-        next_seconds=horizon_seconds,
+    device_pred_result = await _predict_device(
+        device_id,
+        method,
+        horizon_seconds,
+        limit,
         weather_anchor=float(weather_next_hour) if weather_next_hour is not None else None,
         anchor_margin=15.0,
     )
-    if device_pred_result is None:
-        raise HTTPException(
-            status_code=400,
-            detail="Not enough data points with temperature for prediction.",
-        )
     device_pred_temp = device_pred_result.get("predicted_temperature")
     was_clipped = device_pred_result.get("was_clipped", False)
     raw_prediction = device_pred_result.get("raw_prediction")
@@ -261,6 +420,7 @@ async def get_device_prediction_weather_aware(
         "device_id": device_id,
         "city": city,
         "device_prediction": device_pred_temp,
+        "method": device_pred_result.get("method"),
         "weather_next_hour": weather_next_hour,
         "weather_aware_prediction": weather_aware_temp,
         "blend_factor": effective_blend,
@@ -0,0 +1,37 @@
+"""Anomalies detected on ingest (helpers/anomaly_detector.py), stored in the anomalies collection."""
+from typing import Any, Dict, List, Optional
+from helpers.config import async_anomaly_collection, logger
+from helpers.timeutils import serialize_document, to_iso
+from dal import queries
+
+
+def serialize_anomaly(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Anomaly document → JSON-compatible dict (Socket.IO payload, API response)"""
+    doc = serialize_document(doc)
+    if "detected_at" in doc:
+        doc["detected_at"] = to_iso(doc["detected_at"])
+    return doc
+
+
+async def insert_anomalies(anomalies: List[Dict[str, Any]]) -> int:
+    """Store detected anomalies; returns the number stored"""
+    if not anomalies:
+        return 0
+    try:
+        result = await async_anomaly_collection.insert_many(anomalies, ordered=False)
+        return len(result.inserted_ids)
+    except Exception as e:
+        logger.error(f"Error storing {len(anomalies)} anomaly document(s): {e}")
+        return 0
+
+
+async def get_anomalies(
+    device_id: Optional[str] = None, rule: Optional[str] = None, limit: int = 100
+) -> List[Dict[str, Any]]:
+    """Latest anomalies (newest first), optionally for one device and/or one rule"""
+    try:
+        cursor = queries.anomalies(device_id, rule, limit).cursor(async_anomaly_collection)
+        return [serialize_anomaly(doc) async for doc in cursor]
+    except Exception as e:
+        logger.error(f"Error fetching anomalies: {e}")
+        return []
@@ -0,0 +1,169 @@
+"""Async variant of monitoring_dao (motor), awaited from the FastAPI routes; also the only write path."""
+from typing import AsyncIterator, List, Dict, Any, Optional, Tuple
+from datetime import datetime
+from helpers.timeutils import to_utc_datetime, to_epoch_seconds, serialize_document
+from helpers.config import async_collection, logger, ROLLUPS_ENABLED
+from dal.rollup_dao import apply_rollups_async
+from dal import queries
+from helpers.latest_cache import latest_cache
+from helpers.ring_buffer import ring_buffers
+from helpers.prediction_cache import prediction_cache
+
+
+async def insert_device_data(data: Dict[str, Any]) -> bool:
+    """Insert device data into MongoDB"""
+    try:
+        document = {
+            "device_id": data.get("device_id"),
+            "temperature": data.get("temperature"),
+            "humidity": data.get("humidity"),
+            "status": data.get("status"),
+            "timestamp": to_utc_datetime(data.get("timestamp")) or datetime.utcnow(),
+            "event_type": data.get("event_type", "device.data"),
+        }
+        if data.get("device_type") is not None:
+            document["device_type"] = data.get("device_type")
+        await async_collection.insert_one(document)
+        if ROLLUPS_ENABLED:
+            await apply_rollups_async([document])
+        latest_cache.update(document)
+        ring_buffers.append(document)
+        prediction_cache.invalidate_documents([document])
+        logger.info(f"Data inserted for device {data.get('device_id')}")
+        return True
+    except Exception as e:
+        logger.error(f"Error inserting data: {e}")
+        return False
+
+
+async def get_all_data(limit: int = 100) -> List[Dict[str, Any]]:
+    """Get all device data from MongoDB"""
+    try:
+        cursor = queries.all_data(limit).cursor(async_collection)
+        data = []
+        async for doc in cursor:
+            data.append(serialize_document(doc))  # ObjectId → str, datetime → ISO
+        return data
+    except Exception as e:
+        logger.error(f"Error fetching all data: {e}")
+        return []
+
+
+async def get_data_by_device_id(device_id: str, limit: int = 100) -> List[Dict[str, Any]]:
+    """Get data for a specific device"""
+    try:
+        cursor = queries.device_data(device_id, limit).cursor(async_collection)
+        data = []
+        async for doc in cursor:
+            data.append(serialize_document(doc))
+        return data
+    except Exception as e:
+        logger.error(f"Error fetching data for device {device_id}: {e}")
+        return []
+
+
+async def get_latest_data_by_device_id(device_id: str) -> Optional[Dict[str, Any]]:
+    """Get latest data for a specific device"""
+    try:
+        query = queries.latest_device_data(device_id)
+        doc = await async_collection.find_one(query.filter, sort=query.sort)
+        if doc:
+            return serialize_document(doc)
+        return None
+    except Exception as e:
+        logger.error(f"Error fetching latest data for device {device_id}: {e}")
+        return None
+
+
+async def get_data_by_time_range(
+    device_id: str, start_time: datetime, end_time: datetime
+) -> List[Dict[str, Any]]:
+    """Get data for a device within a time range"""
+    try:
+        cursor = queries.data_by_time_range(device_id, start_time, end_time).cursor(async_collection)
+        data = []
+        async for doc in cursor:
+            data.append(serialize_document(doc))
+        return data
+    except Exception as e:
+        logger.error(f"Error fetching data by time range: {e}")
+        return []
+
+
+async def get_latest_data_per_device(limit: int) -> List[Dict[str, Any]]:
+    """Latest reading of each device (one aggregation, DISTINCT_SCAN on the device_id/timestamp index)"""
+    try:
+        cursor = async_collection.aggregate(queries.latest_per_device_pipeline(limit))
+        data = []
+        async for row in cursor:
+            data.append(serialize_document(row["doc"]))
+        return data
+    except Exception as e:
+        logger.error(f"Error fetching latest data per device: {e}")
+        return []
+
+
+async def get_recent_temperatures(device_id: str, limit: int) -> Tuple[List[float], List[float]]:
+    """(timestamps epoch, temperatures) of the last readings with a temperature, in chronological order"""
+    try:
+        cursor = queries.recent_temperatures(device_id, limit).cursor(async_collection)
+        times: List[float] = []
+        values: List[float] = []
+        async for doc in cursor:
+            ts = to_epoch_seconds(doc.get("timestamp"))
+            if ts is None:
+                continue
+            try:
+                values.append(float(doc["temperature"]))
+            except (TypeError, ValueError):
+                continue
+            times.append(ts)
+        times.reverse()
+        values.reverse()
+        return times, values
+    except Exception as e:
+        logger.error(f"Error fetching recent temperatures for device {device_id}: {e}")
+        return [], []
+
+
+async def iter_recent_temperatures(
+    limit: int,
+    device_ids: Optional[List[str]] = None,
+    exclude_device_ids: Optional[List[str]] = None,
+) -> AsyncIterator[Tuple[str, List[float], List[float]]]:
+    """
+    (device_id, timestamps epoch, temperatures) of the last `limit` readings of many devices,
+    chronological, from a single aggregation (one index seek per device, see dal/queries.py).
+    device_ids: only these devices; otherwise every device except exclude_device_ids.
+    """
+    pipeline = queries.recent_temperatures_pipeline(limit, device_ids, exclude_device_ids)
+    try:
+        async for row in async_collection.aggregate(pipeline, allowDiskUse=True):
+            times: List[float] = []
+            values: List[float] = []
+            for point in reversed(row["recent"]):
+                ts = to_epoch_seconds(point.get("timestamp"))
+                if ts is None:
+                    continue
+                try:
+                    values.append(float(point["temperature"]))
+                except (TypeError, ValueError):
+                    continue
+                times.append(ts)
+            yield row["_id"], times, values
+    except Exception as e:
+        logger.error(f"Error fetching recent temperatures of devices: {e}")
+
+
+async def get_temperature_stats(reference: float, per_device: int) -> List[Dict[str, Any]]:
+    """{device_id, avg_temp, mean_abs_error, sample_count} of every device, sorted by device_id"""
+    try:
+        return [
+            row
+            async for row in async_collection.aggregate(
+                queries.temperature_stats_pipeline(reference, per_device), allowDiskUse=True
+            )
+        ]
+    except Exception as e:
+        logger.error(f"Error computing temperature statistics of devices: {e}")
+        return []
@@ -0,0 +1,84 @@
+"""Storage provisioning for device telemetry: time-series collection (opt-in) and indexes."""
+from typing import Any, Dict, List
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import CollectionInvalid
+from helpers.config import (
+    collection,
+    async_collection,
+    rollup_collection,
+    async_rollup_collection,
+    anomaly_collection,
+    async_anomaly_collection,
+    db,
+    async_db,
+    logger,
+    USE_TIMESERIES,
+    DEVICE_DATA_COLLECTION,
+    MONGO_TIMESERIES_GRANULARITY,
+)
+
+# Every DAL query filters on device_id and/or sorts on timestamp (newest first)
+DEVICE_DATA_INDEXES: List[IndexModel] = [
+    IndexModel([("device_id", ASCENDING), ("timestamp", DESCENDING)], name="device_id_timestamp"),
+    IndexModel([("timestamp", DESCENDING)], name="timestamp"),
+]
+
+# One rollup document per (device, resolution, bucket), read newest first
+ROLLUP_INDEXES: List[IndexModel] = [
+    IndexModel(
+        [("device_id", ASCENDING), ("resolution", ASCENDING), ("bucket_start", DESCENDING)],
+        name="device_id_resolution_bucket_start",
+        unique=True,
+    ),
+    # Retention purge: expired buckets of one resolution, across devices
+    IndexModel([("resolution", ASCENDING), ("bucket_start", ASCENDING)], name="resolution_bucket_start"),
+]
+
+# Anomalies read newest first, per device or fleet-wide
+ANOMALY_INDEXES: List[IndexModel] = [
+    IndexModel([("device_id", ASCENDING), ("detected_at", DESCENDING)], name="device_id_detected_at"),
+    IndexModel([("detected_at", DESCENDING)], name="detected_at"),
+]
+
+
+def timeseries_options() -> Dict[str, Any]:
+    """Options of the time-series collection (readings bucketed per device)"""
+    return {
+        "timeField": "timestamp",
+        "metaField": "device_id",
+        "granularity": MONGO_TIMESERIES_GRANULARITY,
+    }
+
+
+def ensure_indexes() -> List[str]:
+    """Create the telemetry collection (time-series backend) and the indexes if missing (idempotent)"""
+    if USE_TIMESERIES and DEVICE_DATA_COLLECTION not in db.list_collection_names(
+        filter={"name": DEVICE_DATA_COLLECTION}
+    ):
+        try:
+            db.create_collection(DEVICE_DATA_COLLECTION, timeseries=timeseries_options())
+            logger.info(f"[MONGO] Created time-series collection {DEVICE_DATA_COLLECTION}")
+        except CollectionInvalid:
+            pass  # created concurrently by another replica
+    names = collection.create_indexes(DEVICE_DATA_INDEXES)
+    names += rollup_collection.create_indexes(ROLLUP_INDEXES)
+    names += anomaly_collection.create_indexes(ANOMALY_INDEXES)
+    logger.info(f"[MONGO] Indexes ensured on {DEVICE_DATA_COLLECTION}, device_rollups and anomalies: {names}")
+    return names
+
+
+async def ensure_indexes_async() -> List[str]:
+    """Same as ensure_indexes, on the motor client (app startup)"""
+    if USE_TIMESERIES and DEVICE_DATA_COLLECTION not in await async_db.list_collection_names(
+        filter={"name": DEVICE_DATA_COLLECTION}
+    ):
+        try:
+            await async_db.create_collection(DEVICE_DATA_COLLECTION, timeseries=timeseries_options())
+            logger.info(f"[MONGO] Created time-series collection {DEVICE_DATA_COLLECTION}")
+        except CollectionInvalid:
+            pass  # created concurrently by another replica
+    names = await async_collection.create_indexes(DEVICE_DATA_INDEXES)
+    names += await async_rollup_collection.create_indexes(ROLLUP_INDEXES)
+    names += await async_anomaly_collection.create_indexes(ANOMALY_INDEXES)
+    logger.info(f"[MONGO] Indexes ensured on {DEVICE_DATA_COLLECTION}, device_rollups and anomalies: {names}")
+    return names
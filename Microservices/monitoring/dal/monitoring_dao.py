@@ -1,35 +1,22 @@
+"""
+Synchronous read access to device telemetry (scripts, tooling). Read-only on purpose: readings
+are written through dal.async_monitoring_dao, which also updates the rollups and the
+in-process caches.
+"""
 from typing import List, Dict, Any, Optional
 from datetime import datetime, timedelta
+from helpers.timeutils import serialize_document
 from helpers.config import collection, logger
-
-
-def insert_device_data(data: Dict[str, Any]) -> bool:
-    """Insert device data into MongoDB"""
-    try:
-        document = {
-            "device_id": data.get("device_id"),
-            "temperature": data.get("temperature"),
-            "humidity": data.get("humidity"),
-            "status": data.get("status"),
-            "timestamp": data.get("timestamp", datetime.utcnow().isoformat()),
-            "event_type": data.get("event_type", "device.data"),
-        }
-        collection.insert_one(document)
-        logger.info(f"Data inserted for device {data.get('device_id')}")
-        return True
-    except Exception as e:
-        logger.error(f"Error inserting data: {e}")
-        return False
+from dal import queries
 
 
 def get_all_data(limit: int = 100) -> List[Dict[str, Any]]:
     """Get all device data from MongoDB"""
     try:
-        cursor = collection.find().sort("timestamp", -1).limit(limit)
+        cursor = queries.all_data(limit).cursor(collection)
         data = []
         for doc in cursor:
-            doc["_id"] = str(doc["_id"])  # Convert ObjectId to string
-            data.append(doc)
+            data.append(serialize_document(doc))  # ObjectId → str, datetime → ISO
         return data
     except Exception as e:
         logger.error(f"Error fetching all data: {e}")
@@ -39,15 +26,10 @@ def get_all_data(limit: int = 100) -> List[Dict[str, Any]]:
 def get_data_by_device_id(device_id: str, limit: int = 100) -> List[Dict[str, Any]]:
     """Get data for a specific device"""
     try:
-        cursor = (
-            collection.find({"device_id": device_id})
-            .sort("timestamp", -1)
-            .limit(limit)
-        )
+        cursor = queries.device_data(device_id, limit).cursor(collection)
         data = []
         for doc in cursor:
-            doc["_id"] = str(doc["_id"])
-            data.append(doc)
+            data.append(serialize_document(doc))
         return data
     except Exception as e:
         logger.error(f"Error fetching data for device {device_id}: {e}")
@@ -57,12 +39,10 @@ def get_data_by_device_id(device_id: str, limit: int = 100) -> List[Dict[str, An
 def get_latest_data_by_device_id(device_id: str) -> Optional[Dict[str, Any]]:
     """Get latest data for a specific device"""
     try:
-        doc = collection.find_one(
-            {"device_id": device_id}, sort=[("timestamp", -1)]
-        )
+        query = queries.latest_device_data(device_id)
+        doc = collection.find_one(query.filter, sort=query.sort)
         if doc:
-            doc["_id"] = str(doc["_id"])
-            return doc
+            return serialize_document(doc)
         return None
     except Exception as e:
         logger.error(f"Error fetching latest data for device {device_id}: {e}")
@@ -74,22 +54,10 @@ def get_data_by_time_range(
 ) -> List[Dict[str, Any]]:
     """Get data for a device within a time range"""
     try:
-        cursor = (
-            collection.find(
-                {
-                    "device_id": device_id,
-                    "timestamp": {
-                        "$gte": start_time.isoformat(),
-                        "$lte": end_time.isoformat(),
-                    },
-                }
-            )
-            .sort("timestamp", -1)
-        )
+        cursor = queries.data_by_time_range(device_id, start_time, end_time).cursor(collection)
         data = []
         for doc in cursor:
-            doc["_id"] = str(doc["_id"])
-            data.append(doc)
+            data.append(serialize_document(doc))
         return data
     except Exception as e:
         logger.error(f"Error fetching data by time range: {e}")
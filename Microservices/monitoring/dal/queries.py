@@ -0,0 +1,208 @@
+"""
+Query shapes of the DAL (filters, projections, sorts, limits, aggregation pipelines), built in
+one place: the sync and async DAOs run exactly what scripts/explain_queries.py checks against
+the indexes (dal/indexes.py).
+"""
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from datetime import datetime
+from helpers.config import DEVICE_DATA_COLLECTION
+from helpers.timeutils import timestamp_range_filter
+
+NEWEST_FIRST: List[Tuple[str, int]] = [("timestamp", -1)]
+
+
+class FindQuery(NamedTuple):
+    filter: Dict[str, Any]
+    sort: List[Tuple[str, int]]
+    limit: int = 0  # 0 = no limit
+    projection: Optional[Dict[str, Any]] = None
+
+    def cursor(self, coll):
+        """find() cursor on a pymongo or motor collection"""
+        cursor = coll.find(self.filter, self.projection)
+        if self.sort:
+            cursor = cursor.sort(self.sort)
+        return cursor.limit(self.limit) if self.limit else cursor
+
+
+# --- device_data -------------------------------------------------------------------------
+
+def all_data(limit: int) -> FindQuery:
+    return FindQuery({}, NEWEST_FIRST, limit)
+
+
+def device_data(device_id: str, limit: int) -> FindQuery:
+    return FindQuery({"device_id": device_id}, NEWEST_FIRST, limit)
+
+
+def latest_device_data(device_id: str) -> FindQuery:
+    return FindQuery({"device_id": device_id}, NEWEST_FIRST, 1)
+
+
+def data_by_time_range(device_id: str, start_time: datetime, end_time: datetime) -> FindQuery:
+    return FindQuery({"device_id": device_id, **timestamp_range_filter(start_time, end_time)}, NEWEST_FIRST)
+
+
+def recent_temperatures(device_id: str, limit: int) -> FindQuery:
+    return FindQuery(
+        {"device_id": device_id, "temperature": {"$ne": None}},
+        NEWEST_FIRST,
+        limit,
+        {"_id": 0, "timestamp": 1, "temperature": 1},
+    )
+
+
+def latest_per_device_pipeline(limit: int) -> List[Dict[str, Any]]:
+    """Latest reading of each device (DISTINCT_SCAN on the device_id_timestamp index)"""
+    return [
+        {"$sort": {"device_id": 1, "timestamp": -1}},
+        {"$group": {"_id": "$device_id", "doc": {"$first": "$$ROOT"}}},
+        {"$limit": limit},
+    ]
+
+
+def _last_readings_per_device(match: Dict[str, Any], limit: int, project: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Devices from a distinct scan of the device_id_timestamp index, then one index seek per
+    device for its last `limit` readings ($lookup, MongoDB >= 5.0) into "recent": the cost
+    grows with the number of devices, not with the number of readings.
+    """
+    return [
+        {"$sort": {"device_id": 1, "timestamp": -1}},
+        {"$group": {"_id": "$device_id"}},
+        {"$match": {"_id": {"$ne": None}}},
+        {
+            "$lookup": {
+                "from": DEVICE_DATA_COLLECTION,
+                "localField": "_id",
+                "foreignField": "device_id",
+                "pipeline": [
+                    {"$match": match},
+                    {"$sort": {"timestamp": -1}},
+                    {"$limit": limit},
+                    {"$project": {"_id": 0, **project}},
+                ],
+                "as": "recent",
+            }
+        },
+    ]
+
+
+def recent_temperatures_pipeline(
+    limit: int,
+    device_ids: Optional[List[str]] = None,
+    exclude_device_ids: Optional[List[str]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    {_id: device_id, recent: [{timestamp, temperature}] newest first} for the last `limit`
+    readings with a temperature of each device (only device_ids, or all but exclude_device_ids)
+    """
+    pipeline: List[Dict[str, Any]] = []
+    if device_ids is not None:
+        pipeline.append({"$match": {"device_id": {"$in": device_ids}}})
+    elif exclude_device_ids:
+        pipeline.append({"$match": {"device_id": {"$nin": exclude_device_ids}}})
+    pipeline += _last_readings_per_device(
+        {"temperature": {"$ne": None}}, limit, {"timestamp": 1, "temperature": 1}
+    )
+    pipeline.append({"$match": {"recent": {"$ne": []}}})
+    return pipeline
+
+
+def temperature_stats_pipeline(reference: float, per_device: int) -> List[Dict[str, Any]]:
+    """
+    Per device, over its last `per_device` readings with a numeric temperature: average, mean
+    absolute error against `reference` and sample count.
+    """
+    return _last_readings_per_device({"temperature": {"$type": "number"}}, per_device, {"temperature": 1}) + [
+        {
+            "$project": {
+                "_id": 0,
+                "device_id": "$_id",
+                "sample_count": {"$size": "$recent"},
+                "avg_temp": {"$avg": "$recent.temperature"},
+                "mean_abs_error": {
+                    "$avg": {
+                        "$map": {
+                            "input": "$recent.temperature",
+                            "as": "t",
+                            "in": {"$abs": {"$subtract": ["$$t", reference]}},
+                        }
+                    }
+                },
+            }
+        },
+        {"$match": {"sample_count": {"$gt": 0}}},
+        {"$sort": {"device_id": 1}},
+    ]
+
+
+def raw_expired(policy_filter: Dict[str, Any], cutoff: datetime) -> FindQuery:
+    """Raw readings of a retention policy older than cutoff (ids of one purge batch)"""
+    return FindQuery({**policy_filter, "timestamp": {"$lt": cutoff}}, [], 0, {"_id": 1})
+
+
+def oldest_raw_expired(policy_filter: Dict[str, Any], cutoff: datetime) -> FindQuery:
+    """Oldest raw reading of a retention policy older than cutoff (rollup coverage check)"""
+    return FindQuery(
+        {**policy_filter, "device_id": {"$type": "string"}, "timestamp": {"$lt": cutoff}},
+        [("timestamp", 1)],
+        1,
+        {"_id": 0, "device_id": 1, "timestamp": 1},
+    )
+
+
+# --- device_rollups ----------------------------------------------------------------------
+
+def rollups(
+    device_id: str,
+    resolution: str,
+    start_bucket: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    limit: int = 500,
+) -> FindQuery:
+    """Rollup buckets of a device, newest first (start_bucket: start of the first bucket)"""
+    query: Dict[str, Any] = {"device_id": device_id, "resolution": resolution}
+    if start_bucket is not None or end_time is not None:
+        query["bucket_start"] = {}
+        if start_bucket is not None:
+            query["bucket_start"]["$gte"] = start_bucket
+        if end_time is not None:
+            query["bucket_start"]["$lte"] = end_time
+    return FindQuery(query, [("bucket_start", -1)], limit)
+
+
+def rollup_series(device_ids: List[str], resolution: str, since: datetime, metric: str) -> FindQuery:
+    """Buckets of several devices since `since` holding `metric`, per device in chronological order"""
+    return FindQuery(
+        {
+            "device_id": {"$in": device_ids},
+            "resolution": resolution,
+            "bucket_start": {"$gte": since},
+            f"metrics.{metric}.count": {"$gt": 0},
+        },
+        [("device_id", 1), ("bucket_start", 1)],
+        0,
+        {"_id": 0, "device_id": 1, "bucket_start": 1, f"metrics.{metric}.sum": 1, f"metrics.{metric}.count": 1},
+    )
+
+
+def rollup_bucket(device_id: str, resolution: str, start: datetime) -> FindQuery:
+    """One rollup bucket, by its key"""
+    return FindQuery({"device_id": device_id, "resolution": resolution, "bucket_start": start}, [], 1, {"_id": 1})
+
+
+def rollups_expired(resolution: str, cutoff: datetime) -> FindQuery:
+    return FindQuery({"resolution": resolution, "bucket_start": {"$lt": cutoff}}, [], 0, {"_id": 1})
+
+
+# --- anomalies ---------------------------------------------------------------------------
+
+def anomalies(device_id: Optional[str] = None, rule: Optional[str] = None, limit: int = 100) -> FindQuery:
+    """Latest anomalies, optionally for one device and/or one rule"""
+    query: Dict[str, Any] = {}
+    if device_id:
+        query["device_id"] = device_id
+    if rule:
+        query["rule"] = rule
+    return FindQuery(query, [("detected_at", -1)], limit)
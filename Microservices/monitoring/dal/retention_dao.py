@@ -0,0 +1,194 @@
+"""
+Retention of raw telemetry and rollup tiers (batched purge) + per-tier size report.
+Raw readings: RETENTION_RAW_DAYS, overridden per device_type by RETENTION_RAW_DAYS_BY_TYPE.
+Rollups: RETENTION_ROLLUP_DAYS per resolution. A value of 0 keeps the tier forever.
+On the time-series backend (MongoDB 6.0 only deletes on metaField there), raw retention is the
+collection-level expireAfterSeconds and per-device_type overrides are not applied.
+Raw readings are only purged while rollups are enabled and cover them: the oldest expiring
+reading of each policy must have its bucket in the longest-kept rollup tier. History stored
+before rollups were enabled is not covered until scripts/rebuild_rollups.py has been run;
+until then the raw purge is skipped with a warning.
+"""
+import asyncio
+from typing import List, Dict, Any, Optional, Tuple
+from datetime import datetime, timedelta
+from helpers.config import (
+    async_db,
+    async_collection,
+    async_rollup_collection,
+    logger,
+    USE_TIMESERIES,
+    DEVICE_DATA_COLLECTION,
+    RETENTION_RAW_DAYS,
+    RETENTION_RAW_DAYS_BY_TYPE,
+    RETENTION_ROLLUP_DAYS,
+    RETENTION_PURGE_BATCH_SIZE,
+    ROLLUPS_ENABLED,
+)
+from helpers.timeutils import to_iso, to_utc_datetime
+from dal.rollup_dao import ACTIVE_RESOLUTIONS, bucket_start
+from dal import queries
+
+
+def _parse_days(spec: str) -> Dict[str, int]:
+    """"a=7,b=90" → {"a": 7, "b": 90} (invalid entries ignored)"""
+    days: Dict[str, int] = {}
+    for item in spec.split(","):
+        key, _, value = item.partition("=")
+        try:
+            days[key.strip()] = int(value)
+        except ValueError:
+            continue
+    return {k: v for k, v in days.items() if k}
+
+
+RAW_DAYS_BY_TYPE = _parse_days(RETENTION_RAW_DAYS_BY_TYPE)
+ROLLUP_DAYS = _parse_days(RETENTION_ROLLUP_DAYS)
+
+
+def raw_policies() -> List[Tuple[str, Dict[str, Any], int]]:
+    """[(policy name, filter, days)] for raw readings; the default covers the other device types"""
+    policies = [(device_type, {"device_type": device_type}, days) for device_type, days in RAW_DAYS_BY_TYPE.items()]
+    policies.append(("default", {"device_type": {"$nin": list(RAW_DAYS_BY_TYPE)}}, RETENTION_RAW_DAYS))
+    return policies
+
+
+def policies_summary() -> Dict[str, Any]:
+    """Configured retention (days, 0 = forever)"""
+    return {
+        "raw_default_days": RETENTION_RAW_DAYS,
+        "raw_days_by_device_type": {} if USE_TIMESERIES else RAW_DAYS_BY_TYPE,
+        "rollup_days": {r: ROLLUP_DAYS.get(r, 0) for r in ACTIVE_RESOLUTIONS},
+        "backend": "timeseries" if USE_TIMESERIES else "standard",
+    }
+
+
+async def _purge_batched(coll, query: queries.FindQuery, batch_size: int) -> int:
+    """Delete matching documents by batches of _id (short write locks, no huge oplog entry)"""
+    deleted = 0
+    batch = query._replace(limit=batch_size)
+    while True:
+        ids = [doc["_id"] async for doc in batch.cursor(coll)]
+        if not ids:
+            break
+        result = await coll.delete_many({"_id": {"$in": ids}})
+        deleted += result.deleted_count
+        if len(ids) < batch_size:
+            break
+        await asyncio.sleep(0)  # let ingest and requests run between batches
+    return deleted
+
+
+def _longest_rollup_tier() -> Optional[str]:
+    """Active resolution kept the longest (0 = forever), i.e. the one that replaces purged raw data"""
+    if not ACTIVE_RESOLUTIONS:
+        return None
+    return max(ACTIVE_RESOLUTIONS, key=lambda r: ROLLUP_DAYS.get(r, 0) or float("inf"))
+
+
+async def _rollups_cover(policy_filter: Dict[str, Any], cutoff: datetime, resolution: str) -> bool:
+    """
+    True when the oldest raw reading of the policy older than cutoff has its rollup bucket.
+    Rollups are fed on ingest, so later readings are covered as well.
+    """
+    async for doc in queries.oldest_raw_expired(policy_filter, cutoff).cursor(async_collection):
+        ts = to_utc_datetime(doc.get("timestamp"))
+        if ts is None:
+            return False
+        bucket = queries.rollup_bucket(doc["device_id"], resolution, bucket_start(ts, resolution))
+        return await async_rollup_collection.find_one(bucket.filter, bucket.projection) is not None
+    return True  # nothing to purge
+
+
+async def _raw_purge_allowed(name: str, policy_filter: Dict[str, Any], cutoff: datetime) -> bool:
+    """Rollups enabled and covering the readings about to be purged (else warn and keep them)"""
+    resolution = _longest_rollup_tier()
+    if not ROLLUPS_ENABLED or resolution is None:
+        logger.warning(
+            f"[RETENTION] Raw purge ({name}) skipped: rollups are disabled, expired readings would be lost"
+        )
+        return False
+    if not await _rollups_cover(policy_filter, cutoff, resolution):
+        logger.warning(
+            f"[RETENTION] Raw purge ({name}) skipped: readings before {cutoff.isoformat()} are not "
+            f"rolled up ({resolution}); run scripts/rebuild_rollups.py first"
+        )
+        return False
+    return True
+
+
+async def _apply_timeseries_expiry(now: datetime):
+    """Raw retention on the time-series backend: collection-level TTL (off while not covered by rollups)"""
+    expire: Any = "off"
+    if RETENTION_RAW_DAYS > 0 and await _raw_purge_allowed(
+        "timeseries", {}, now - timedelta(days=RETENTION_RAW_DAYS)
+    ):
+        expire = RETENTION_RAW_DAYS * 86400
+    await async_db.command("collMod", DEVICE_DATA_COLLECTION, expireAfterSeconds=expire)
+    if RAW_DAYS_BY_TYPE:
+        logger.warning("[RETENTION] Per-device_type raw retention is not applied on the time-series backend")
+
+
+async def purge_expired(batch_size: int = RETENTION_PURGE_BATCH_SIZE, now: Optional[datetime] = None) -> Dict[str, int]:
+    """Apply every retention policy once. Returns the number of deleted documents per policy."""
+    now = now or datetime.utcnow()
+    deleted: Dict[str, int] = {}
+    if USE_TIMESERIES:
+        await _apply_timeseries_expiry(now)
+    else:
+        for name, query, days in raw_policies():
+            if days <= 0:
+                continue
+            cutoff = now - timedelta(days=days)
+            if not await _raw_purge_allowed(name, query, cutoff):
+                continue
+            deleted[f"raw:{name}"] = await _purge_batched(
+                async_collection, queries.raw_expired(query, cutoff), batch_size
+            )
+    for resolution in ACTIVE_RESOLUTIONS:
+        days = ROLLUP_DAYS.get(resolution, 0)
+        if days <= 0:
+            continue
+        cutoff = now - timedelta(days=days)
+        deleted[f"rollup:{resolution}"] = await _purge_batched(
+            async_rollup_collection, queries.rollups_expired(resolution, cutoff), batch_size
+        )
+    total = sum(deleted.values())
+    if total:
+        logger.info(f"[RETENTION] Purged {total} document(s): {deleted}")
+    return deleted
+
+
+async def tier_sizes(by_device_type: bool = False) -> Dict[str, Any]:
+    """Documents, sizes and oldest entry of each tier (raw + one per rollup resolution)"""
+    raw_stats = await async_db.command("collStats", DEVICE_DATA_COLLECTION)
+    oldest_raw = await async_collection.find_one({}, {"timestamp": 1}, sort=[("timestamp", 1)])
+    raw: Dict[str, Any] = {
+        "collection": DEVICE_DATA_COLLECTION,
+        "documents": raw_stats.get("count"),
+        "size_bytes": raw_stats.get("size"),
+        "storage_bytes": raw_stats.get("storageSize"),
+        "index_bytes": raw_stats.get("totalIndexSize"),
+        "oldest": to_iso(oldest_raw.get("timestamp")) if oldest_raw else None,
+    }
+    if by_device_type:
+        # Full scan of the raw collection: opt-in
+        cursor = async_collection.aggregate([{"$group": {"_id": "$device_type", "documents": {"$sum": 1}}}])
+        raw["documents_by_device_type"] = {
+            (doc["_id"] if doc["_id"] is not None else "unknown"): doc["documents"] async for doc in cursor
+        }
+
+    rollup_stats = await async_db.command("collStats", "device_rollups")
+    avg_size = rollup_stats.get("avgObjSize", 0)
+    rollups: Dict[str, Any] = {}
+    for resolution in ACTIVE_RESOLUTIONS:
+        count = await async_rollup_collection.count_documents({"resolution": resolution})
+        oldest = await async_rollup_collection.find_one(
+            {"resolution": resolution}, {"bucket_start": 1}, sort=[("bucket_start", 1)]
+        )
+        rollups[resolution] = {
+            "documents": count,
+            "size_bytes_estimate": int(count * avg_size),
+            "oldest": to_iso(oldest.get("bucket_start")) if oldest else None,
+        }
+    return {"policies": policies_summary(), "raw": raw, "rollups": rollups}
@@ -0,0 +1,184 @@
+"""
+Continuous rollups of sensor metrics: one document per (device_id, resolution, bucket_start)
+holding min/max/sum/count/last for each metric. Fed from the ingest path with one bulk
+of upserts per stored batch; readings of a batch are pre-aggregated per bucket first.
+The upserts are pipeline updates: "last" is stored with its reading time and only replaced
+by a reading at least as recent, so late or redelivered readings do not overwrite it.
+"""
+import math
+from typing import List, Dict, Any, Optional, Tuple
+from datetime import datetime, timezone
+from pymongo import UpdateOne
+from helpers.config import rollup_collection, async_rollup_collection, logger, ROLLUP_RESOLUTIONS
+from helpers.timeutils import to_utc_datetime, to_epoch_seconds, to_iso
+from dal import queries
+
+ROLLUP_METRICS = ("temperature", "humidity", "cpu", "memory_percent", "disk_percent")
+RESOLUTION_SECONDS = {"1m": 60, "1h": 3600, "1d": 86400}
+ACTIVE_RESOLUTIONS = [r.strip() for r in ROLLUP_RESOLUTIONS.split(",") if r.strip() in RESOLUTION_SECONDS]
+
+
+def bucket_start(ts: datetime, resolution: str) -> datetime:
+    """Start of the bucket containing ts (UTC naive)"""
+    seconds = RESOLUTION_SECONDS[resolution]
+    epoch = int(ts.replace(tzinfo=timezone.utc).timestamp())
+    return datetime.fromtimestamp(epoch - epoch % seconds, tz=timezone.utc).replace(tzinfo=None)
+
+
+def build_rollup_updates(documents: List[Dict[str, Any]]) -> List[UpdateOne]:
+    """Pre-aggregate readings per (device, resolution, bucket) and build the upserts"""
+    buckets: Dict[Tuple[str, str, datetime], Dict[str, Any]] = {}
+    for doc in documents:
+        device_id = doc.get("device_id")
+        ts = to_utc_datetime(doc.get("timestamp"))
+        if not device_id or ts is None:
+            continue
+        values = {}
+        for metric in ROLLUP_METRICS:
+            value = doc.get(metric)
+            if value is None:
+                continue
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                continue
+            if math.isfinite(value):  # NaN would stick in min/max/sum
+                values[metric] = value
+        for resolution in ACTIVE_RESOLUTIONS:
+            key = (device_id, resolution, bucket_start(ts, resolution))
+            acc = buckets.setdefault(key, {"count": 0, "last_timestamp": ts, "metrics": {}})
+            acc["count"] += 1
+            if ts >= acc["last_timestamp"]:
+                acc["last_timestamp"] = ts
+            for metric, value in values.items():
+                m = acc["metrics"].get(metric)
+                if m is None:
+                    acc["metrics"][metric] = {"min": value, "max": value, "sum": value, "count": 1, "last": value, "ts": ts}
+                    continue
+                m["min"] = min(m["min"], value)
+                m["max"] = max(m["max"], value)
+                m["sum"] += value
+                m["count"] += 1
+                if ts >= m["ts"]:
+                    m["last"], m["ts"] = value, ts
+
+    updates: List[UpdateOne] = []
+    for (device_id, resolution, start), acc in buckets.items():
+        fields: Dict[str, Any] = {
+            "count": _add("count", acc["count"]),
+            "last_timestamp": {"$max": ["$last_timestamp", acc["last_timestamp"]]},
+        }
+        for metric, m in acc["metrics"].items():
+            path = f"metrics.{metric}"
+            # $ifNull: no stored reading time yet (new bucket) → take this one
+            newer = {"$gte": [m["ts"], {"$ifNull": [f"${path}.last_timestamp", m["ts"]]}]}
+            fields[f"{path}.min"] = {"$min": [f"${path}.min", m["min"]]}
+            fields[f"{path}.max"] = {"$max": [f"${path}.max", m["max"]]}
+            fields[f"{path}.sum"] = _add(f"{path}.sum", m["sum"])
+            fields[f"{path}.count"] = _add(f"{path}.count", m["count"])
+            fields[f"{path}.last"] = {"$cond": [newer, m["last"], f"${path}.last"]}
+            fields[f"{path}.last_timestamp"] = {"$cond": [newer, m["ts"], f"${path}.last_timestamp"]}
+        updates.append(
+            UpdateOne(
+                {"device_id": device_id, "resolution": resolution, "bucket_start": start},
+                [{"$set": fields}],
+                upsert=True,
+            )
+        )
+    return updates
+
+
+def _add(path: str, value: Any) -> Dict[str, Any]:
+    """Pipeline-update equivalent of $inc (the field is missing in a new bucket)"""
+    return {"$add": [{"$ifNull": [f"${path}", 0]}, value]}
+
+
+def apply_rollups(documents: List[Dict[str, Any]]) -> int:
+    """Fold stored readings into the rollups (sync, scripts)"""
+    updates = build_rollup_updates(documents)
+    if not updates:
+        return 0
+    rollup_collection.bulk_write(updates, ordered=False)
+    return len(updates)
+
+
+async def apply_rollups_async(documents: List[Dict[str, Any]]) -> int:
+    """Fold stored readings into the rollups (ingest path). Errors are logged, not raised:
+    the raw readings are already stored."""
+    try:
+        updates = build_rollup_updates(documents)
+        if not updates:
+            return 0
+        await async_rollup_collection.bulk_write(updates, ordered=False)
+    except Exception as e:
+        logger.error(f"[ROLLUP] Error updating rollups for {len(documents)} reading(s): {e}")
+        return 0
+    return len(updates)
+
+
+def _serialize_rollup(doc: Dict[str, Any]) -> Dict[str, Any]:
+    metrics = {}
+    for metric, m in (doc.get("metrics") or {}).items():
+        count = m.get("count") or 0
+        metrics[metric] = {
+            "min": m.get("min"),
+            "max": m.get("max"),
+            "avg": round(m["sum"] / count, 4) if count else None,
+            "count": count,
+            "last": m.get("last"),
+        }
+    return {
+        "device_id": doc.get("device_id"),
+        "resolution": doc.get("resolution"),
+        "bucket_start": to_iso(doc.get("bucket_start")),
+        "count": doc.get("count", 0),
+        "last_timestamp": to_iso(doc.get("last_timestamp")),
+        **metrics,
+    }
+
+
+async def get_bucket_averages(
+    device_ids: List[str], resolution: str, since: datetime, metric: str = "temperature"
+) -> Dict[str, Tuple[List[float], List[float]]]:
+    """
+    device_id → (bucket centres in epoch seconds, averages of `metric`), chronological, for the
+    buckets since `since`. Empty when the resolution is not maintained.
+    """
+    series: Dict[str, Tuple[List[float], List[float]]] = {}
+    if not device_ids or resolution not in ACTIVE_RESOLUTIONS:
+        return series
+    half = RESOLUTION_SECONDS[resolution] / 2
+    try:
+        cursor = queries.rollup_series(device_ids, resolution, since, metric).cursor(async_rollup_collection)
+        async for doc in cursor:
+            m = doc["metrics"][metric]
+            start = to_epoch_seconds(doc.get("bucket_start"))
+            if start is None:
+                continue
+            times, values = series.setdefault(doc["device_id"], ([], []))
+            times.append(start + half)
+            values.append(m["sum"] / m["count"])
+    except Exception as e:
+        logger.error(f"Error fetching {resolution} rollups of {len(device_ids)} device(s): {e}")
+    return series
+
+
+async def get_rollups(
+    device_id: str,
+    resolution: str,
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    limit: int = 500,
+) -> List[Dict[str, Any]]:
+    """Rollup buckets of a device, newest first"""
+    try:
+        start_bucket = bucket_start(to_utc_datetime(start_time), resolution) if start_time is not None else None
+        end = to_utc_datetime(end_time) if end_time is not None else None
+        cursor = queries.rollups(device_id, resolution, start_bucket, end, limit).cursor(async_rollup_collection)
+        data = []
+        async for doc in cursor:
+            data.append(_serialize_rollup(doc))
+        return data
+    except Exception as e:
+        logger.error(f"Error fetching rollups for device {device_id}: {e}")
+        return []
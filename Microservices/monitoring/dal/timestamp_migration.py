@@ -0,0 +1,48 @@
+"""Background migration: legacy ISO string timestamps → native BSON datetimes, in batches."""
+import asyncio
+from pymongo import UpdateOne
+from helpers.config import async_collection, logger, TIMESTAMP_MIGRATION_BATCH_SIZE
+from helpers.timeutils import to_utc_datetime
+
+# Pause between batches so the migration does not compete with live ingest
+_BATCH_PAUSE_SECONDS = 0.2
+
+
+async def migrate_string_timestamps(batch_size: int = TIMESTAMP_MIGRATION_BATCH_SIZE) -> int:
+    """
+    Rewrite documents whose timestamp is still a string, walking _id in ascending order.
+    Unparsable strings are left untouched (and skipped). Returns the number of documents migrated.
+    """
+    migrated = 0
+    skipped = 0
+    last_id = None
+    while True:
+        query = {"timestamp": {"$type": "string"}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        docs = await (
+            async_collection.find(query, {"timestamp": 1})
+            .sort("_id", 1)
+            .limit(batch_size)
+            .to_list(length=batch_size)
+        )
+        if not docs:
+            break
+        last_id = docs[-1]["_id"]
+        updates = []
+        for doc in docs:
+            dt = to_utc_datetime(doc["timestamp"])
+            if dt is None:
+                skipped += 1
+                continue
+            # Guard on the old value: a concurrent writer wins
+            updates.append(
+                UpdateOne({"_id": doc["_id"], "timestamp": doc["timestamp"]}, {"$set": {"timestamp": dt}})
+            )
+        if updates:
+            result = await async_collection.bulk_write(updates, ordered=False)
+            migrated += result.modified_count
+        await asyncio.sleep(_BATCH_PAUSE_SECONDS)
+    if migrated or skipped:
+        logger.info(f"[MIGRATION] {migrated} timestamp(s) converted to datetime, {skipped} unparsable left as string")
+    return migrated
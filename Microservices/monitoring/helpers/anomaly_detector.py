@@ -0,0 +1,155 @@
+"""
+Détection d'anomalies en flux, à l'ingestion (publish_documents) : chaque lecture est comparée
+dès son arrivée, en O(1) par lecture, selon trois règles :
+- weather_deviation : |capteur - météo| > ANOMALY_WEATHER_THRESHOLD (météo actuelle en cache,
+  rafraîchie en arrière-plan, même seuil que /weather/analysis) ;
+- zscore : écart à la moyenne glissante du device > ANOMALY_ZSCORE_THRESHOLD écarts-types
+  (moyenne / variance à pondération exponentielle sur ~ANOMALY_WINDOW lectures) ;
+- rate_of_change : variation > ANOMALY_MAX_RATE_PER_MINUTE °C par minute depuis la lecture précédente.
+Une même règle ne se redéclenche pas pour un device avant ANOMALY_COOLDOWN_SECONDS (horodatage
+des lectures). Les anomalies sont émises (Socket.IO device_anomaly) et enregistrées par l'appelant.
+"""
+import math
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from prometheus_client import Counter
+
+from helpers.config import (
+    ANOMALY_DETECTION_ENABLED,
+    ANOMALY_WEATHER_THRESHOLD,
+    ANOMALY_ZSCORE_THRESHOLD,
+    ANOMALY_MAX_RATE_PER_MINUTE,
+    ANOMALY_WINDOW,
+    ANOMALY_MIN_SAMPLES,
+    ANOMALY_COOLDOWN_SECONDS,
+    ANOMALY_MAX_DEVICES,
+)
+from helpers.timeutils import to_epoch_seconds
+
+RULE_WEATHER = "weather_deviation"
+RULE_ZSCORE = "zscore"
+RULE_RATE = "rate_of_change"
+
+# Écart-type minimal pour le z-score (capteur quasi constant : pas de division par ~0)
+_MIN_STD = 0.1
+
+ANOMALIES_DETECTED = Counter(
+    "monitoring_anomalies_detected",
+    "Anomalies detected on ingest, by rule",
+    ["rule"],
+)
+
+
+class _DeviceStats:
+    __slots__ = ("count", "mean", "var", "last_ts", "last_value", "last_alert")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.var = 0.0
+        self.last_ts: Optional[float] = None
+        self.last_value: Optional[float] = None
+        self.last_alert: Dict[str, float] = {}  # règle -> horodatage de la dernière anomalie émise
+
+    def push(self, value: float, alpha: float):
+        """Moyenne / variance à pondération exponentielle (moyenne cumulée pendant le démarrage)"""
+        self.count += 1
+        weight = max(alpha, 1.0 / self.count)
+        diff = value - self.mean
+        increment = weight * diff
+        self.mean += increment
+        self.var = (1.0 - weight) * (self.var + diff * increment)
+
+
+class AnomalyDetector:
+    def __init__(
+        self,
+        enabled: bool = ANOMALY_DETECTION_ENABLED,
+        max_devices: int = ANOMALY_MAX_DEVICES,
+        window: int = ANOMALY_WINDOW,
+    ):
+        self.enabled = enabled
+        self.max_devices = max_devices
+        self.alpha = 2.0 / (window + 1)
+        self.weather_temp: Optional[float] = None
+        self._devices: "OrderedDict[str, _DeviceStats]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._devices)
+
+    def set_weather(self, temperature: Optional[float]):
+        """Température météo de référence (None : règle weather_deviation suspendue)"""
+        self.weather_temp = None if temperature is None else float(temperature)
+
+    def observe(self, document: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Intègre une lecture ; retourne les anomalies détectées (documents à émettre / enregistrer)"""
+        device_id = document.get("device_id")
+        ts = to_epoch_seconds(document.get("timestamp"))
+        try:
+            value = float(document["temperature"])
+        except (KeyError, TypeError, ValueError):
+            return []
+        if not device_id or ts is None or not math.isfinite(value):
+            return []
+        stats = self._devices.get(device_id)
+        if stats is None:
+            stats = _DeviceStats()
+            self._devices[device_id] = stats
+            if len(self._devices) > self.max_devices:
+                self._devices.popitem(last=False)
+        else:
+            self._devices.move_to_end(device_id)
+
+        # (règle, valeur de référence, score, seuil)
+        hits = []
+        if self.weather_temp is not None:
+            deviation = value - self.weather_temp
+            if abs(deviation) > ANOMALY_WEATHER_THRESHOLD:
+                hits.append((RULE_WEATHER, self.weather_temp, deviation, ANOMALY_WEATHER_THRESHOLD))
+        if stats.count >= ANOMALY_MIN_SAMPLES:
+            std = math.sqrt(stats.var)
+            if std >= _MIN_STD:
+                zscore = (value - stats.mean) / std
+                if abs(zscore) > ANOMALY_ZSCORE_THRESHOLD:
+                    hits.append((RULE_ZSCORE, stats.mean, zscore, ANOMALY_ZSCORE_THRESHOLD))
+        if stats.last_ts is not None and ts > stats.last_ts:
+            rate = (value - stats.last_value) / (ts - stats.last_ts) * 60.0
+            if abs(rate) > ANOMALY_MAX_RATE_PER_MINUTE:
+                hits.append((RULE_RATE, stats.last_value, rate, ANOMALY_MAX_RATE_PER_MINUTE))
+
+        stats.push(value, self.alpha)
+        if stats.last_ts is None or ts >= stats.last_ts:
+            stats.last_ts = ts
+            stats.last_value = value
+
+        anomalies = []
+        for rule, expected, score, threshold in hits:
+            last_alert = stats.last_alert.get(rule)
+            if last_alert is not None and 0 <= ts - last_alert < ANOMALY_COOLDOWN_SECONDS:
+                continue
+            stats.last_alert[rule] = ts
+            ANOMALIES_DETECTED.labels(rule).inc()
+            anomalies.append({
+                "device_id": device_id,
+                "rule": rule,
+                "temperature": value,
+                "expected": round(expected, 2),
+                "score": round(score, 2),
+                "threshold": threshold,
+                "timestamp": document.get("timestamp"),
+                "detected_at": datetime.utcnow(),
+            })
+        return anomalies
+
+    def observe_many(self, documents: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if not self.enabled:
+            return []
+        anomalies: List[Dict[str, Any]] = []
+        for document in documents:
+            anomalies.extend(self.observe(document))
+        return anomalies
+
+
+anomaly_detector = AnomalyDetector()
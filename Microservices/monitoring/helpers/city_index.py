@@ -0,0 +1,391 @@
+"""
+Index local des villes pour l'autocomplétion de /weather/search-city, construit à partir d'un
+export GeoNames (cities500.txt, cities15000.txt, ... ou l'extrait fourni data/cities_sample.tsv).
+
+Format binaire (fichier mappé en mémoire, partagé entre workers via le cache de pages) :
+- en-tête ;
+- enregistrements de taille fixe (nom, pays, lat, lon, population) ;
+- clés de recherche triées (nom normalisé : minuscules, sans accents ; noms alternatifs) ;
+- top-k par population des préfixes trop fréquents pour être parcourus à chaque requête ;
+- chaînes UTF-8.
+Recherche par préfixe : deux recherches dichotomiques sur les clés, puis classement par
+population sur la plage (ou lecture du top-k précalculé) ; quelques microsecondes.
+
+LocalGeocoder y ajoute en mémoire les villes renvoyées par l'API de géocodage (recherches
+pour lesquelles l'index a moins de résultats que demandé, fusionnées par merge_suggestions).
+"""
+import bisect
+import heapq
+import mmap
+import os
+import struct
+import tempfile
+import unicodedata
+from itertools import groupby
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from prometheus_client import Counter
+
+from helpers.config import (
+    CITY_INDEX_ENABLED,
+    CITY_INDEX_PATH,
+    CITY_INDEX_SOURCE,
+    CITY_OVERLAY_MAX_CITIES,
+    logger,
+)
+
+_MAGIC = b"CITYIDX1"
+# magic, enregistrements, clés, préfixes, k, offsets (enregistrements, clés, préfixes, chaînes)
+_HEADER = struct.Struct("<8sIIIIQQQQ")
+# nom (offset, longueur), pays (offset, longueur), lat, lon, population
+_RECORD = struct.Struct("<IHIHffI")
+# clé (offset, longueur), enregistrement
+_KEY = struct.Struct("<IHI")
+_NO_RECORD = 0xFFFFFFFF
+
+# Préfixes couvrant plus de TOP_THRESHOLD clés : top TOP_K précalculé
+TOP_THRESHOLD = 256
+TOP_K = 10
+
+# Noms des pays (codes ISO GeoNames), en français comme l'API (language=fr)
+COUNTRY_NAMES_FR = {
+    "AE": "Émirats arabes unis", "AR": "Argentine", "BE": "Belgique", "BR": "Brésil",
+    "CA": "Canada", "CH": "Suisse", "CI": "Côte d'Ivoire", "CM": "Cameroun", "CN": "Chine",
+    "DE": "Allemagne", "DZ": "Algérie", "EG": "Égypte", "ES": "Espagne", "FR": "France",
+    "GB": "Royaume-Uni", "IN": "Inde", "IT": "Italie", "JP": "Japon", "LU": "Luxembourg",
+    "LY": "Libye", "MA": "Maroc", "MX": "Mexique", "NL": "Pays-Bas", "PT": "Portugal",
+    "QA": "Qatar", "RU": "Russie", "SA": "Arabie saoudite", "SN": "Sénégal", "TN": "Tunisie",
+    "TR": "Turquie", "US": "États-Unis",
+}
+
+# (nom, pays, latitude, longitude, population, noms alternatifs)
+City = Tuple[str, str, float, float, int, Sequence[str]]
+
+CITY_SEARCH_REQUESTS = Counter(
+    "monitoring_city_search_requests",
+    "City autocomplete lookups by source (local index or upstream geocoding API)",
+    ["source"],
+)
+
+
+def _top_struct(k: int) -> struct.Struct:
+    # préfixe (offset, longueur), k meilleurs enregistrements (_NO_RECORD en complément)
+    return struct.Struct(f"<IH{k}I")
+
+
+def normalize(text: str) -> str:
+    """Clé de recherche : minuscules, sans accents, tirets et apostrophes remplacés par des espaces"""
+    decomposed = unicodedata.normalize("NFKD", text)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    for sep in ("-", "'", "’"):
+        stripped = stripped.replace(sep, " ")
+    return " ".join(stripped.casefold().split())
+
+
+def read_geonames(
+    path: str,
+    min_population: int = 0,
+    country_names: Optional[Dict[str, str]] = None,
+    max_alternate_names: int = 10,
+) -> Iterator[City]:
+    """
+    Lit un export GeoNames (colonnes séparées par des tabulations : geonameid, name, asciiname,
+    alternatenames, latitude, longitude, feature class, ..., country code, ..., population).
+    Seuls les lieux habités (classe P) d'au moins `min_population` habitants sont gardés.
+    """
+    names = country_names if country_names is not None else COUNTRY_NAMES_FR
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            cols = line.rstrip("\n").split("\t")
+            if len(cols) < 15 or line.startswith("#"):
+                continue
+            if cols[6] and cols[6] != "P":
+                continue
+            population = int(cols[14] or 0)
+            if population < min_population:
+                continue
+            alternates = [
+                a for a in cols[3].split(",")
+                if len(a) >= 3 and not any(c.isdigit() for c in a) and "/" not in a
+            ][:max_alternate_names]
+            yield (
+                cols[1],
+                names.get(cols[8], cols[8]),
+                float(cols[4]),
+                float(cols[5]),
+                population,
+                [cols[2], *alternates],
+            )
+
+
+def write_index(cities: Iterable[City], path: str) -> int:
+    """Écrit l'index (remplacement atomique du fichier) ; retourne le nombre de villes"""
+    strings = bytearray()
+    string_offsets: Dict[bytes, int] = {}
+
+    def intern(value: str) -> Tuple[int, int]:
+        data = value.encode("utf-8")
+        offset = string_offsets.get(data)
+        if offset is None:
+            offset = len(strings)
+            string_offsets[data] = offset
+            strings.extend(data)
+        return offset, len(data)
+
+    records = bytearray()
+    populations: List[int] = []
+    keys: List[Tuple[bytes, int, int]] = []  # (clé, -population, enregistrement)
+    for name, country, lat, lon, population, alternates in cities:
+        record_id = len(populations)
+        name_ref = intern(name)
+        country_ref = intern(country)
+        records.extend(_RECORD.pack(*name_ref, *country_ref, lat, lon, min(population, 0xFFFFFFFE)))
+        populations.append(population)
+        for key in {normalize(n) for n in (name, *alternates) if n}:
+            if key:
+                keys.append((key.encode("utf-8"), -population, record_id))
+    keys.sort()
+
+    key_bytes = [k for k, _, _ in keys]
+    key_records = [r for _, _, r in keys]
+    packed_keys = bytearray()
+    for key, _, record_id in keys:
+        packed_keys.extend(_KEY.pack(*intern(key.decode("utf-8")), record_id))
+
+    tops = bytearray()
+    n_tops = 0
+    for prefix, records_in_range in _frequent_prefixes(key_bytes, key_records):
+        top = heapq.nlargest(TOP_K, set(records_in_range), key=lambda r: (populations[r], -r))
+        top += [_NO_RECORD] * (TOP_K - len(top))
+        tops.extend(_top_struct(TOP_K).pack(*intern(prefix.decode("utf-8")), *top))
+        n_tops += 1
+
+    records_off = _HEADER.size
+    keys_off = records_off + len(records)
+    tops_off = keys_off + len(packed_keys)
+    strings_off = tops_off + len(tops)
+    header = _HEADER.pack(
+        _MAGIC, len(populations), len(keys), n_tops, TOP_K, records_off, keys_off, tops_off, strings_off
+    )
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for part in (header, records, packed_keys, tops, strings):
+                f.write(part)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return len(populations)
+
+
+def _frequent_prefixes(keys: List[bytes], records: List[int]) -> List[Tuple[bytes, List[int]]]:
+    """Préfixes (limites de caractères UTF-8) partagés par plus de TOP_THRESHOLD clés, triés"""
+    found: List[Tuple[bytes, List[int]]] = []
+    ranges = [(0, len(keys))]
+    length = 1
+    while ranges:
+        next_ranges = []
+        for lo, hi in ranges:
+            i = lo
+            for prefix, group in groupby(range(lo, hi), key=lambda j: keys[j][:length]):
+                size = sum(1 for _ in group)
+                if size > TOP_THRESHOLD and len(prefix) == length:
+                    first = keys[i]
+                    # Un préfixe qui coupe un caractère multi-octets n'est jamais demandé tel quel
+                    if len(first) == length or (first[length] & 0xC0) != 0x80:
+                        found.append((prefix, records[i:i + size]))
+                    next_ranges.append((i, i + size))
+                i += size
+        ranges = next_ranges
+        length += 1
+    found.sort(key=lambda item: item[0])
+    return found
+
+
+class CityIndex:
+    """Lecture de l'index via mmap (lecture seule, aucune copie en mémoire du processus)"""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, self.n_records, self.n_keys, self.n_tops, self.top_k,
+         self._records_off, self._keys_off, self._tops_off, self._strings_off) = _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC:
+            self._mm.close()
+            raise ValueError(f"{path} is not a city index")
+        self._top = _top_struct(self.top_k)
+
+    def __len__(self) -> int:
+        return self.n_records
+
+    def close(self):
+        self._mm.close()
+
+    def _string(self, offset: int, length: int) -> bytes:
+        start = self._strings_off + offset
+        return self._mm[start:start + length]
+
+    def _key(self, i: int) -> bytes:
+        offset, length, _ = _KEY.unpack_from(self._mm, self._keys_off + i * _KEY.size)
+        return self._string(offset, length)
+
+    def _key_record(self, i: int) -> int:
+        return _KEY.unpack_from(self._mm, self._keys_off + i * _KEY.size)[2]
+
+    def _lower_bound(self, target: bytes) -> int:
+        lo, hi = 0, self.n_keys
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _precomputed_top(self, prefix: bytes) -> Optional[List[int]]:
+        lo, hi = 0, self.n_tops
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset, length, *_ = self._top.unpack_from(self._mm, self._tops_off + mid * self._top.size)
+            if self._string(offset, length) < prefix:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.n_tops:
+            offset, length, *top = self._top.unpack_from(self._mm, self._tops_off + lo * self._top.size)
+            if self._string(offset, length) == prefix:
+                return [r for r in top if r != _NO_RECORD]
+        return None
+
+    def record(self, record_id: int) -> Dict[str, Any]:
+        name_off, name_len, country_off, country_len, lat, lon, population = _RECORD.unpack_from(
+            self._mm, self._records_off + record_id * _RECORD.size
+        )
+        return {
+            "name": self._string(name_off, name_len).decode("utf-8"),
+            "country": self._string(country_off, country_len).decode("utf-8"),
+            "latitude": round(lat, 5),
+            "longitude": round(lon, 5),
+            "population": population,
+        }
+
+    def search(self, query: str, count: int = 5) -> List[Dict[str, Any]]:
+        """Villes dont un nom commence par `query`, par population décroissante"""
+        prefix = normalize(query).encode("utf-8")
+        if not prefix:
+            return []
+        lo = self._lower_bound(prefix)
+        # Aucun octet 0xFF en UTF-8 : toute clé commençant par prefix est < prefix + 0xFF
+        hi = self._lower_bound(prefix + b"\xff")
+        if hi - lo > TOP_THRESHOLD:
+            top = self._precomputed_top(prefix)
+            if top is not None:
+                return [self.record(r) for r in top[:count]]
+        record_ids = {self._key_record(i) for i in range(lo, hi)}
+        cities = [self.record(r) for r in record_ids]
+        cities.sort(key=lambda c: (-c["population"], c["name"]))
+        return cities[:count]
+
+
+def open_index(path: str = CITY_INDEX_PATH, source: str = CITY_INDEX_SOURCE) -> Optional[CityIndex]:
+    """Ouvre l'index, en le construisant depuis `source` s'il manque ou est plus ancien ; None sinon"""
+    try:
+        if source and os.path.exists(source) and (
+            not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(source)
+        ):
+            count = write_index(read_geonames(source), path)
+            logger.info(f"[GEOCODING] Built city index {path} from {source} ({count} cities)")
+        if not os.path.exists(path):
+            logger.warning(f"[GEOCODING] No city index at {path}: autocomplete uses the geocoding API")
+            return None
+        index = CityIndex(path)
+        logger.info(f"[GEOCODING] City index loaded ({len(index)} cities)")
+        return index
+    except Exception as e:
+        logger.error(f"[GEOCODING] Could not load city index {path}: {e}")
+        return None
+
+
+class LocalGeocoder:
+    """Index local + villes apprises de l'API (en mémoire, au plus CITY_OVERLAY_MAX_CITIES)"""
+
+    def __init__(self, enabled: bool = CITY_INDEX_ENABLED, max_overlay: int = CITY_OVERLAY_MAX_CITIES):
+        self.enabled = enabled
+        self.max_overlay = max_overlay
+        self._index: Optional[CityIndex] = None
+        self._opened = False
+        self._overlay: List[Dict[str, Any]] = []
+        self._overlay_keys: List[Tuple[str, int]] = []  # (nom normalisé, position dans _overlay), trié
+        self._overlay_seen: set = set()
+
+    def open(self):
+        """Charge l'index (au démarrage, hors boucle d'événements : construction éventuelle)"""
+        if not self._opened:
+            self._opened = True
+            self._index = open_index() if self.enabled else None
+
+    def close(self):
+        if self._index is not None:
+            self._index.close()
+            self._index = None
+        self._opened = False
+
+    def search(self, query: str, count: int = 5) -> List[Dict[str, Any]]:
+        """Suggestions locales { name, country, latitude, longitude } ; [] si aucune"""
+        if not self.enabled:
+            return []
+        self.open()
+        cities = self._index.search(query, count) if self._index is not None else []
+        prefix = normalize(query)
+        if prefix and self._overlay_keys:
+            i = bisect.bisect_left(self._overlay_keys, (prefix, -1))
+            while i < len(self._overlay_keys) and self._overlay_keys[i][0].startswith(prefix):
+                cities.append(self._overlay[self._overlay_keys[i][1]])
+                i += 1
+        return merge_suggestions(count, sorted(cities, key=lambda c: -(c.get("population") or 0)))
+
+    def add(self, cities: Iterable[Dict[str, Any]]):
+        """Mémorise des villes renvoyées par l'API de géocodage"""
+        for city in cities:
+            if len(self._overlay) >= self.max_overlay:
+                return
+            if not city.get("name") or city.get("latitude") is None or city.get("longitude") is None:
+                continue
+            identity = _identity(city)
+            if identity in self._overlay_seen:
+                continue
+            self._overlay_seen.add(identity)
+            self._overlay.append(dict(city))
+            bisect.insort(self._overlay_keys, (normalize(city["name"]), len(self._overlay) - 1))
+
+
+# Même nom et même pays à moins de ~10 km : même ville (coordonnées de sources différentes)
+_SAME_CITY_DEGREES = 0.1
+
+
+def merge_suggestions(count: int, *suggestions: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Concatène des listes de suggestions (ordre conservé, doublons retirés), tronquée à count"""
+    places: Dict[Tuple[str, Any], List[Tuple[float, float]]] = {}
+    results: List[Dict[str, Any]] = []
+    for city in (c for cities in suggestions for c in cities):
+        if len(results) >= count:
+            break
+        lat, lon = city.get("latitude"), city.get("longitude")
+        if not city.get("name") or lat is None or lon is None:
+            continue
+        seen = places.setdefault((normalize(city["name"]), city.get("country")), [])
+        if any(abs(lat - a) < _SAME_CITY_DEGREES and abs(lon - b) < _SAME_CITY_DEGREES for a, b in seen):
+            continue
+        seen.append((lat, lon))
+        results.append({k: city.get(k) for k in ("name", "country", "latitude", "longitude")})
+    return results
+
+
+def _identity(city: Dict[str, Any]) -> Tuple[str, Any, float, float]:
+    return (normalize(city["name"]), city.get("country"), round(city["latitude"], 2), round(city["longitude"], 2))
+
+
+local_geocoder = LocalGeocoder()
@@ -1,6 +1,7 @@
-from typing import Final
+from typing import Final, Optional
 import os
 from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
 import logging
 
 # MongoDB configuration
@@ -11,6 +12,14 @@ MONGO_URI: Final[str] = os.getenv(
     "MONGO_URI", f"mongodb://{MONGO_HOST}:{MONGO_PORT}/"
 )
 
+# Storage backend for device telemetry: "standard" (one document per reading in device_data)
+# or "timeseries" (MongoDB time-series collection, timeField=timestamp, metaField=device_id)
+MONGO_STORAGE_BACKEND: Final[str] = os.getenv("MONGO_STORAGE_BACKEND", "standard").lower()
+MONGO_TIMESERIES_COLLECTION: Final[str] = os.getenv("MONGO_TIMESERIES_COLLECTION", "device_data_ts")
+MONGO_TIMESERIES_GRANULARITY: Final[str] = os.getenv("MONGO_TIMESERIES_GRANULARITY", "seconds")
+USE_TIMESERIES: Final[bool] = MONGO_STORAGE_BACKEND == "timeseries"
+DEVICE_DATA_COLLECTION: Final[str] = MONGO_TIMESERIES_COLLECTION if USE_TIMESERIES else "device_data"
+
 # RabbitMQ configuration
 RABBITMQ_HOST: Final[str] = os.getenv("RABBITMQ_HOST", "localhost")
 RABBITMQ_PORT: Final[int] = int(os.getenv("RABBITMQ_PORT", "5672"))
@@ -19,10 +28,145 @@ RABBITMQ_PASSWORD: Final[str] = os.getenv("RABBITMQ_PASSWORD", "guest")
 RABBITMQ_EXCHANGE: Final[str] = os.getenv("RABBITMQ_EXCHANGE", "device_events")
 RABBITMQ_QUEUE: Final[str] = os.getenv("RABBITMQ_QUEUE", "monitoring_queue")
 
+# Ingestion batching (prefetch window + one insert_many / multiple-ack per batch)
+INGEST_BATCH_ENABLED: Final[bool] = os.getenv("INGEST_BATCH_ENABLED", "false").lower() in ("1", "true", "yes")
+INGEST_BATCH_SIZE: Final[int] = int(os.getenv("INGEST_BATCH_SIZE", "500"))
+INGEST_BATCH_MAX_WAIT_MS: Final[int] = int(os.getenv("INGEST_BATCH_MAX_WAIT_MS", "200"))
+RABBITMQ_PREFETCH: Final[int] = int(os.getenv("RABBITMQ_PREFETCH", "1000"))
+# Reconnect backoff (seconds): base * 2^attempt, capped
+RABBITMQ_RECONNECT_BASE_DELAY: Final[float] = float(os.getenv("RABBITMQ_RECONNECT_BASE_DELAY", "1"))
+RABBITMQ_RECONNECT_MAX_DELAY: Final[float] = float(os.getenv("RABBITMQ_RECONNECT_MAX_DELAY", "30"))
+
+# Multi-process consumer pool: N worker processes, each bound to its own partition queue
+# ("<RABBITMQ_QUEUE>.<i>", single active consumer across replicas) behind a consistent-hash
+# exchange keyed on the device_id header. 0 = single consumer on the app's event loop.
+# Queues left by a previous mode / larger pool are drained and deleted at startup.
+INGEST_WORKERS: Final[int] = int(os.getenv("INGEST_WORKERS", "0"))
+RABBITMQ_PARTITION_EXCHANGE: Final[str] = os.getenv("RABBITMQ_PARTITION_EXCHANGE", "device_data_partitions")
+INGEST_WORKER_STATS_INTERVAL: Final[float] = float(os.getenv("INGEST_WORKER_STATS_INTERVAL", "5"))
+
+# Background migration of legacy string timestamps to BSON datetimes
+TIMESTAMP_MIGRATION_ENABLED: Final[bool] = os.getenv("TIMESTAMP_MIGRATION_ENABLED", "true").lower() in ("1", "true", "yes")
+TIMESTAMP_MIGRATION_BATCH_SIZE: Final[int] = int(os.getenv("TIMESTAMP_MIGRATION_BATCH_SIZE", "1000"))
+
+# Continuous rollups (min/max/avg/count/last per device and bucket), maintained on ingest
+ROLLUPS_ENABLED: Final[bool] = os.getenv("ROLLUPS_ENABLED", "true").lower() in ("1", "true", "yes")
+ROLLUP_RESOLUTIONS: Final[str] = os.getenv("ROLLUP_RESOLUTIONS", "1m,1h,1d")
+
+# Retention: raw readings kept RETENTION_RAW_DAYS (overridable per device_type, e.g.
+# "end_device=7,sensor=90"), rollup tiers kept per resolution ("1m=7,1h=365,1d=0", 0 = forever).
+# Older raw data survives only as rollups. Purged in batches by a background job, only while
+# ROLLUPS_ENABLED and once rollups cover the expiring readings: run scripts/rebuild_rollups.py
+# before the first purge when history predates the rollups (the purge is skipped until then).
+RETENTION_ENABLED: Final[bool] = os.getenv("RETENTION_ENABLED", "false").lower() in ("1", "true", "yes")
+RETENTION_RAW_DAYS: Final[int] = int(os.getenv("RETENTION_RAW_DAYS", "30"))
+RETENTION_RAW_DAYS_BY_TYPE: Final[str] = os.getenv("RETENTION_RAW_DAYS_BY_TYPE", "")
+RETENTION_ROLLUP_DAYS: Final[str] = os.getenv("RETENTION_ROLLUP_DAYS", "1m=7,1h=365,1d=0")
+RETENTION_PURGE_INTERVAL: Final[int] = int(os.getenv("RETENTION_PURGE_INTERVAL", "3600"))
+RETENTION_PURGE_BATCH_SIZE: Final[int] = int(os.getenv("RETENTION_PURGE_BATCH_SIZE", "5000"))
+
+# In-process latest reading per device (LRU, bounded), fed by the consumer
+LATEST_CACHE_MAX_DEVICES: Final[int] = int(os.getenv("LATEST_CACHE_MAX_DEVICES", "10000"))
+# Max age (seconds) of the in-process state (latest cache, ring buffers, prediction cache) since
+# it was last fed by this process's consumer or reloaded from MongoDB; older entries are reloaded.
+# Bounds staleness when another replica / process consumes a device's partition. 0 = never expire
+# (only safe with a single replica consuming every partition).
+LATEST_CACHE_MAX_AGE: Final[float] = float(os.getenv("LATEST_CACHE_MAX_AGE", "10"))
+
+# Per-device ring buffers of recent (timestamp, temperature) readings for the prediction routes
+RING_BUFFER_DEPTH: Final[int] = int(os.getenv("RING_BUFFER_DEPTH", "200"))
+RING_BUFFER_MAX_DEVICES: Final[int] = int(os.getenv("RING_BUFFER_MAX_DEVICES", "5000"))
+RING_BUFFER_MAX_AGE: Final[float] = float(os.getenv("RING_BUFFER_MAX_AGE", "60"))
+# Sliding window of the incremental regression (sums updated on ingest); predictions on
+# another number of points are computed in closed form from the ring buffer
+REGRESSION_WINDOW: Final[int] = int(os.getenv("REGRESSION_WINDOW", "30"))
+
+# Streaming Holt-Winters forecaster (method=holt_winters on the predict routes), updated with the
+# ring buffers. Time constants in seconds: level / trend smoothing, trend damping at forecast time;
+# each hourly seasonal term keeps a memory of about HOLT_WINTERS_SEASON_DAYS days.
+HOLT_WINTERS_LEVEL_SECONDS: Final[float] = float(os.getenv("HOLT_WINTERS_LEVEL_SECONDS", "600"))
+HOLT_WINTERS_TREND_SECONDS: Final[float] = float(os.getenv("HOLT_WINTERS_TREND_SECONDS", "1800"))
+HOLT_WINTERS_SEASON_DAYS: Final[float] = float(os.getenv("HOLT_WINTERS_SEASON_DAYS", "3"))
+HOLT_WINTERS_DAMPING_SECONDS: Final[float] = float(os.getenv("HOLT_WINTERS_DAMPING_SECONDS", "3600"))
+
+# Per-device prediction cache (invalidated when a new reading of the device is stored)
+PREDICTION_CACHE_MAX_DEVICES: Final[int] = int(os.getenv("PREDICTION_CACHE_MAX_DEVICES", "10000"))
+PREDICTION_CACHE_MAX_AGE: Final[float] = float(os.getenv("PREDICTION_CACHE_MAX_AGE", "30"))
+
+# Fleet-wide batch prediction: devices solved per NumPy batch (and per streamed chunk)
+PREDICT_BATCH_CHUNK_SIZE: Final[int] = int(os.getenv("PREDICT_BATCH_CHUNK_SIZE", "1000"))
+
+# Process pool for CPU-heavy model fitting (0 workers = inline). Beyond MAX_PENDING fits in
+# flight new ones are refused (503); inputs smaller than MIN_CELLS array cells run inline.
+MODEL_EXECUTOR_WORKERS: Final[int] = int(os.getenv("MODEL_EXECUTOR_WORKERS", "2"))
+MODEL_EXECUTOR_MAX_PENDING: Final[int] = int(os.getenv("MODEL_EXECUTOR_MAX_PENDING", "8"))
+MODEL_EXECUTOR_TIMEOUT: Final[float] = float(os.getenv("MODEL_EXECUTOR_TIMEOUT", "10"))
+MODEL_EXECUTOR_MIN_CELLS: Final[int] = int(os.getenv("MODEL_EXECUTOR_MIN_CELLS", "20000"))
+
+# Heavy modules (NumPy) are imported on first use; warm them up in a background thread
+# IMPORT_WARMUP_DELAY seconds after startup so the first prediction does not pay for it
+IMPORT_WARMUP_ENABLED: Final[bool] = os.getenv("IMPORT_WARMUP_ENABLED", "true").lower() in ("1", "true", "yes")
+IMPORT_WARMUP_DELAY: Final[float] = float(os.getenv("IMPORT_WARMUP_DELAY", "2"))
+
+# Shared Open-Meteo HTTP client: pooled keep-alive connections, HTTP/2 when the h2 package is installed
+WEATHER_HTTP_TIMEOUT: Final[float] = float(os.getenv("WEATHER_HTTP_TIMEOUT", "10"))
+WEATHER_HTTP_MAX_CONNECTIONS: Final[int] = int(os.getenv("WEATHER_HTTP_MAX_CONNECTIONS", "20"))
+WEATHER_HTTP_MAX_KEEPALIVE: Final[int] = int(os.getenv("WEATHER_HTTP_MAX_KEEPALIVE", "10"))
+WEATHER_HTTP_KEEPALIVE_EXPIRY: Final[float] = float(os.getenv("WEATHER_HTTP_KEEPALIVE_EXPIRY", "30"))
+WEATHER_HTTP2_ENABLED: Final[bool] = os.getenv("WEATHER_HTTP2_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Open-Meteo response cache, keyed by data kind and (lat, lon) rounded to GRID_DECIMALS.
+# Entries older than their TTL are served while a background refresh runs, up to STALE_WINDOW
+# seconds past the TTL (also the tolerated upstream outage); failures are cached NEGATIVE_TTL seconds.
+WEATHER_CACHE_ENABLED: Final[bool] = os.getenv("WEATHER_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+WEATHER_CACHE_GRID_DECIMALS: Final[int] = int(os.getenv("WEATHER_CACHE_GRID_DECIMALS", "2"))
+WEATHER_CACHE_MAX_ENTRIES: Final[int] = int(os.getenv("WEATHER_CACHE_MAX_ENTRIES", "5000"))
+WEATHER_CURRENT_TTL: Final[float] = float(os.getenv("WEATHER_CURRENT_TTL", "600"))
+WEATHER_FORECAST_TTL: Final[float] = float(os.getenv("WEATHER_FORECAST_TTL", "3600"))
+WEATHER_CACHE_NEGATIVE_TTL: Final[float] = float(os.getenv("WEATHER_CACHE_NEGATIVE_TTL", "30"))
+WEATHER_CACHE_STALE_WINDOW: Final[float] = float(os.getenv("WEATHER_CACHE_STALE_WINDOW", "21600"))
+
+# Local city index for /weather/search-city (memory-mapped, built from a GeoNames dump with
+# scripts/build_city_index.py, or from CITY_INDEX_SOURCE when the index is missing or older).
+# Lookups with fewer local matches than requested also go to the geocoding API (answer cached
+# CITY_SEARCH_TTL s per query, merged after the local matches); its cities are kept in memory.
+CITY_INDEX_ENABLED: Final[bool] = os.getenv("CITY_INDEX_ENABLED", "true").lower() in ("1", "true", "yes")
+CITY_INDEX_PATH: Final[str] = os.getenv("CITY_INDEX_PATH", "./data/cities.idx")
+CITY_INDEX_SOURCE: Final[str] = os.getenv("CITY_INDEX_SOURCE", "./data/cities_sample.tsv")
+CITY_OVERLAY_MAX_CITIES: Final[int] = int(os.getenv("CITY_OVERLAY_MAX_CITIES", "20000"))
+CITY_SEARCH_TTL: Final[float] = float(os.getenv("CITY_SEARCH_TTL", "86400"))
+
+# Streaming anomaly detection on ingest (Socket.IO "device_anomaly" + anomalies collection).
+# Rules: |reading - current weather| > WEATHER_THRESHOLD (weather refreshed every
+# WEATHER_REFRESH seconds), z-score against an exponentially weighted mean over ~WINDOW readings
+# (after MIN_SAMPLES), rate of change in °C per minute. One alert per device and rule per COOLDOWN.
+# The weather rule compares against the weather at ANOMALY_WEATHER_LAT / ANOMALY_WEATHER_LON (the
+# site where the devices are installed); it is off while they are not set.
+ANOMALY_DETECTION_ENABLED: Final[bool] = os.getenv("ANOMALY_DETECTION_ENABLED", "true").lower() in ("1", "true", "yes")
+ANOMALY_WEATHER_THRESHOLD: Final[float] = float(os.getenv("ANOMALY_WEATHER_THRESHOLD", "5.0"))
+ANOMALY_WEATHER_REFRESH: Final[float] = float(os.getenv("ANOMALY_WEATHER_REFRESH", "300"))
+ANOMALY_WEATHER_LAT: Final[Optional[float]] = float(os.environ["ANOMALY_WEATHER_LAT"]) if os.getenv("ANOMALY_WEATHER_LAT") else None
+ANOMALY_WEATHER_LON: Final[Optional[float]] = float(os.environ["ANOMALY_WEATHER_LON"]) if os.getenv("ANOMALY_WEATHER_LON") else None
+ANOMALY_ZSCORE_THRESHOLD: Final[float] = float(os.getenv("ANOMALY_ZSCORE_THRESHOLD", "3.0"))
+ANOMALY_MAX_RATE_PER_MINUTE: Final[float] = float(os.getenv("ANOMALY_MAX_RATE_PER_MINUTE", "5.0"))
+ANOMALY_WINDOW: Final[int] = int(os.getenv("ANOMALY_WINDOW", "30"))
+ANOMALY_MIN_SAMPLES: Final[int] = int(os.getenv("ANOMALY_MIN_SAMPLES", "20"))
+ANOMALY_COOLDOWN_SECONDS: Final[float] = float(os.getenv("ANOMALY_COOLDOWN_SECONDS", "300"))
+ANOMALY_MAX_DEVICES: Final[int] = int(os.getenv("ANOMALY_MAX_DEVICES", "10000"))
+
 # MongoDB client
 mongo_client = MongoClient(MONGO_URI)
 db = mongo_client[MONGO_DB]
-collection = db["device_data"]
+collection = db[DEVICE_DATA_COLLECTION]
+rollup_collection = db["device_rollups"]
+anomaly_collection = db["anomalies"]
+
+# MongoDB async client (motor) for code running on the app's event loop
+async_mongo_client = AsyncIOMotorClient(MONGO_URI)
+async_db = async_mongo_client[MONGO_DB]
+async_collection = async_db[DEVICE_DATA_COLLECTION]
+async_rollup_collection = async_db["device_rollups"]
+async_anomaly_collection = async_db["anomalies"]
 
 # logs
 os.makedirs("./logs", exist_ok=True)
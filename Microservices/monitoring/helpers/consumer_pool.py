@@ -0,0 +1,214 @@
+"""
+Multi-process consumer pool for the ingest path.
+
+Each worker process runs the asyncio RabbitMQ consumer on its own partition queue
+(consistent-hash exchange on device_id, see rabbitmq_consumer.connect_to_rabbitmq),
+so ingest scales with cores while keeping per-device ordering. Stored documents are
+forwarded to the API process, which publishes them (Socket.IO, in-memory state).
+Workers write their stats in a shared array exported on /metrics.
+"""
+import asyncio
+import math
+import multiprocessing
+import queue as queue_module
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from prometheus_client import REGISTRY
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from helpers.config import INGEST_WORKER_STATS_INTERVAL, logger
+
+# Per-worker slots in the shared stats array
+_STAT_STORED = 0
+_STAT_QUEUE_DEPTH = 1
+_STAT_THROUGHPUT = 2
+_STAT_UPDATED_AT = 3
+_STATS_PER_WORKER = 4
+
+# Forwarded batches waiting for the API process; beyond this, Socket.IO updates are dropped
+_FORWARD_QUEUE_SIZE = 10000
+_SUPERVISE_INTERVAL = 5.0
+
+_ctx = multiprocessing.get_context("spawn")
+
+
+def _worker_main(partition: int, stats, forward_queue):
+    """Entry point of a worker process"""
+    asyncio.run(_run_worker(partition, stats, forward_queue))
+
+
+async def _run_worker(partition: int, stats, forward_queue):
+    from helpers import rabbitmq_consumer
+
+    def forward(documents: List[Dict[str, Any]]):
+        payloads = [{**doc, "_id": str(doc["_id"])} if "_id" in doc else doc for doc in documents]
+        try:
+            forward_queue.put_nowait(payloads)
+        except queue_module.Full:
+            logger.warning(f"[POOL] Worker {partition}: forward queue full, dropped {len(payloads)} update(s)")
+
+    rabbitmq_consumer.set_stored_sink(forward)
+    reporter = asyncio.create_task(_report_stats(partition, stats))
+    try:
+        await rabbitmq_consumer.start_rabbitmq_consumer(partition)
+    finally:
+        reporter.cancel()
+
+
+async def _report_stats(partition: int, stats):
+    """Periodically publish stored count, queue depth (lag) and throughput of this worker"""
+    from helpers import rabbitmq_consumer
+
+    base = partition * _STATS_PER_WORKER
+    last_count = 0
+    last_time = time.monotonic()
+    connection = None
+    channel = None
+    while True:
+        await asyncio.sleep(INGEST_WORKER_STATS_INTERVAL)
+        depth = math.nan
+        try:
+            if connection is None or connection.is_closed:
+                connection = await rabbitmq_consumer.open_connection()
+                channel = await connection.channel()
+            queue = await channel.declare_queue(
+                rabbitmq_consumer.partition_queue_name(partition), passive=True
+            )
+            depth = float(queue.declaration_result.message_count)
+        except Exception as e:
+            logger.warning(f"[POOL] Worker {partition}: queue depth unavailable: {e}")
+            if connection is not None and not connection.is_closed:
+                await connection.close()
+            connection = None
+        now = time.monotonic()
+        count = rabbitmq_consumer.stored_count
+        throughput = (count - last_count) / (now - last_time)
+        last_count, last_time = count, now
+        with stats.get_lock():
+            stats[base + _STAT_STORED] = count
+            stats[base + _STAT_QUEUE_DEPTH] = depth
+            stats[base + _STAT_THROUGHPUT] = throughput
+            stats[base + _STAT_UPDATED_AT] = time.time()
+
+
+class _PoolStatsCollector:
+    """Prometheus collector reading the shared worker stats"""
+
+    def __init__(self, pool: "ConsumerPool"):
+        self.pool = pool
+
+    def collect(self):
+        stored = CounterMetricFamily(
+            "monitoring_ingest_worker_stored",
+            "Documents stored by each ingest worker process",
+            labels=["worker"],
+        )
+        depth = GaugeMetricFamily(
+            "monitoring_ingest_worker_queue_depth",
+            "Messages waiting in the worker partition queue (consumer lag)",
+            labels=["worker"],
+        )
+        throughput = GaugeMetricFamily(
+            "monitoring_ingest_worker_throughput",
+            "Documents stored per second over the last stats interval",
+            labels=["worker"],
+        )
+        alive = GaugeMetricFamily(
+            "monitoring_ingest_worker_up",
+            "1 if the worker process is alive",
+            labels=["worker"],
+        )
+        values = self.pool.snapshot()
+        for partition, (worker_stats, is_alive) in enumerate(values):
+            label = [str(partition)]
+            stored.add_metric(label, worker_stats[_STAT_STORED])
+            if not math.isnan(worker_stats[_STAT_QUEUE_DEPTH]):
+                depth.add_metric(label, worker_stats[_STAT_QUEUE_DEPTH])
+            throughput.add_metric(label, worker_stats[_STAT_THROUGHPUT])
+            alive.add_metric(label, 1.0 if is_alive else 0.0)
+        yield stored
+        yield depth
+        yield throughput
+        yield alive
+
+
+class ConsumerPool:
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.stats = _ctx.Array("d", workers * _STATS_PER_WORKER)
+        for partition in range(workers):
+            self.stats[partition * _STATS_PER_WORKER + _STAT_QUEUE_DEPTH] = math.nan
+        self.forward_queue = _ctx.Queue(maxsize=_FORWARD_QUEUE_SIZE)
+        self.processes: List[Optional[multiprocessing.process.BaseProcess]] = [None] * workers
+        self._collector: Optional[_PoolStatsCollector] = None
+
+    def _spawn(self, partition: int):
+        process = _ctx.Process(
+            target=_worker_main,
+            args=(partition, self.stats, self.forward_queue),
+            name=f"ingest-worker-{partition}",
+            daemon=True,
+        )
+        process.start()
+        self.processes[partition] = process
+        logger.info(f"[POOL] Started ingest worker {partition} (pid {process.pid})")
+
+    def start(self):
+        """Start the worker processes and export their stats"""
+        for partition in range(self.workers):
+            self._spawn(partition)
+        self._collector = _PoolStatsCollector(self)
+        REGISTRY.register(self._collector)
+
+    def supervise(self):
+        """Restart workers that died"""
+        for partition, process in enumerate(self.processes):
+            if process is not None and not process.is_alive():
+                logger.error(
+                    f"[POOL] Ingest worker {partition} exited (code {process.exitcode}), restarting"
+                )
+                self._spawn(partition)
+
+    def snapshot(self):
+        """[(stats of the worker, is_alive)] per partition"""
+        with self.stats.get_lock():
+            values = list(self.stats)
+        return [
+            (
+                values[p * _STATS_PER_WORKER:(p + 1) * _STATS_PER_WORKER],
+                process is not None and process.is_alive(),
+            )
+            for p, process in enumerate(self.processes)
+        ]
+
+    async def run(self, on_documents: Callable[[List[Dict[str, Any]]], Awaitable[None]]):
+        """Publish documents forwarded by the workers and keep the pool alive"""
+        loop = asyncio.get_running_loop()
+        next_check = time.monotonic() + _SUPERVISE_INTERVAL
+        while True:
+            try:
+                documents = await loop.run_in_executor(None, self.forward_queue.get, True, 0.5)
+            except queue_module.Empty:
+                documents = None
+            if documents:
+                try:
+                    await on_documents(documents)
+                except Exception as e:
+                    logger.error(f"[POOL] Error publishing forwarded documents: {e}")
+            if time.monotonic() >= next_check:
+                self.supervise()
+                next_check = time.monotonic() + _SUPERVISE_INTERVAL
+
+    def stop(self):
+        """Terminate the workers (unacked messages are redelivered by RabbitMQ)"""
+        if self._collector is not None:
+            REGISTRY.unregister(self._collector)
+            self._collector = None
+        for process in self.processes:
+            if process is not None and process.is_alive():
+                process.terminate()
+        for process in self.processes:
+            if process is not None:
+                process.join(timeout=5)
+        logger.info("[POOL] Ingest workers stopped")
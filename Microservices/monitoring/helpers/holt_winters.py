@@ -0,0 +1,85 @@
+"""
+Lissage exponentiel de Holt-Winters en flux (niveau / tendance / saisonnalité journalière),
+adapté aux lectures irrégulières : les coefficients de lissage dépendent de l'intervalle entre
+deux lectures (1 - exp(-dt / constante de temps)). Mise à jour en O(1) par lecture.
+
+La saisonnalité est additive, un terme par heure UTC de la journée, estimé sur l'écart à une
+moyenne lente (constante de temps d'un jour) : le niveau, rapide, suit la série désaisonnalisée
+sans absorber le cycle journalier, et inversement. La tendance est amortie
+à la prévision (sa contribution plafonne à trend * HOLT_WINTERS_DAMPING_SECONDS), ce qui évite
+les extrapolations irréalistes de la régression linéaire sur de longs horizons.
+
+Les termes saisonniers n'ont de sens qu'après au moins une saison (un jour) de données : l'état
+est amorcé avec les moyennes horaires des rollups (HOLT_WINTERS_SEASON_DAYS jours) avant les
+lectures du buffer, et has_full_season() indique s'il peut servir une prévision.
+"""
+import math
+from typing import Optional
+
+from helpers.config import (
+    HOLT_WINTERS_LEVEL_SECONDS,
+    HOLT_WINTERS_TREND_SECONDS,
+    HOLT_WINTERS_SEASON_DAYS,
+    HOLT_WINTERS_DAMPING_SECONDS,
+)
+
+SEASON_SLOTS = 24
+SEASON_SECONDS = 86400
+_SLOT_SECONDS = SEASON_SECONDS // SEASON_SLOTS
+_BASELINE_SECONDS = 86400.0
+
+
+def _season_slot(ts: float) -> int:
+    return int(ts // _SLOT_SECONDS) % SEASON_SLOTS
+
+
+class HoltWintersState:
+    __slots__ = ("level", "trend", "baseline", "season", "first_ts", "last_ts", "count")
+
+    def __init__(self):
+        self.level = 0.0
+        self.baseline = 0.0
+        self.trend = 0.0  # °C par seconde
+        self.season = [0.0] * SEASON_SLOTS
+        self.first_ts: Optional[float] = None
+        self.last_ts: Optional[float] = None
+        self.count = 0
+
+    def has_full_season(self) -> bool:
+        """Au moins une saison (un jour) de données intégrée : les termes saisonniers sont estimés"""
+        return self.first_ts is not None and self.last_ts - self.first_ts >= SEASON_SECONDS
+
+    def update(self, ts: float, value: float):
+        """Intègre une lecture (ordre chronologique)"""
+        slot = _season_slot(ts)
+        season = self.season[slot]
+        if self.last_ts is None:
+            self.level = value - season
+            self.baseline = value
+            self.first_ts = self.last_ts = ts
+            self.count = 1
+            return
+        dt = ts - self.last_ts
+        if dt <= 0:
+            # Même timestamp : le niveau seul absorbe la lecture
+            self.level += 0.5 * (value - season - self.level)
+            self.count += 1
+            return
+        alpha = 1.0 - math.exp(-dt / HOLT_WINTERS_LEVEL_SECONDS)
+        beta = 1.0 - math.exp(-dt / HOLT_WINTERS_TREND_SECONDS)
+        gamma = 1.0 - math.exp(-dt / (HOLT_WINTERS_SEASON_DAYS * _SLOT_SECONDS))
+        previous = self.level
+        self.level = alpha * (value - season) + (1.0 - alpha) * (previous + self.trend * dt)
+        self.trend = beta * (self.level - previous) / dt + (1.0 - beta) * self.trend
+        self.baseline += (1.0 - math.exp(-dt / _BASELINE_SECONDS)) * (value - self.baseline)
+        self.season[slot] = season + gamma * (value - self.baseline - season)
+        self.last_ts = ts
+        self.count += 1
+
+    def forecast(self, horizon_seconds: float) -> Optional[float]:
+        """Prévision à last_ts + horizon_seconds, None avant 2 lectures"""
+        if self.count < 2 or self.last_ts is None:
+            return None
+        damping = HOLT_WINTERS_DAMPING_SECONDS
+        trend_part = self.trend * damping * (1.0 - math.exp(-horizon_seconds / damping))
+        return self.level + trend_part + self.season[_season_slot(self.last_ts + horizon_seconds)]
@@ -0,0 +1,62 @@
+"""
+Cache en mémoire de la dernière lecture de chaque device (LRU borné à LATEST_CACHE_MAX_DEVICES).
+Alimenté à l'ingestion, servi directement par /data/{device_id}/latest ; repli sur MongoDB en cas
+d'absence, préchargé au démarrage par une agrégation.
+Une entrée non rafraîchie (consumer ou MongoDB) depuis LATEST_CACHE_MAX_AGE s est ignorée : un
+device consommé par un autre replica est relu dans MongoDB au lieu d'être servi indéfiniment.
+"""
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from helpers.config import LATEST_CACHE_MAX_DEVICES, LATEST_CACHE_MAX_AGE
+from helpers.timeutils import to_utc_datetime, serialize_document
+
+
+class LatestValueCache:
+    def __init__(self, max_devices: int = LATEST_CACHE_MAX_DEVICES, max_age: float = LATEST_CACHE_MAX_AGE):
+        self.max_devices = max_devices
+        self.max_age = max_age
+        # device_id -> (timestamp, document sérialisé pour l'API, instant du dernier rafraîchissement)
+        self._entries: "OrderedDict[str, Tuple[datetime, Dict[str, Any], float]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, device_id: str) -> Optional[Dict[str, Any]]:
+        """Dernière lecture connue (copie) ou None (absente ou trop ancienne)"""
+        entry = self._entries.get(device_id)
+        if entry is None:
+            return None
+        if self.max_age > 0 and time.monotonic() - entry[2] > self.max_age:
+            return None
+        self._entries.move_to_end(device_id)
+        return dict(entry[1])
+
+    def update(self, doc: Dict[str, Any]) -> bool:
+        """
+        Enregistre la lecture si elle est au moins aussi récente que celle en cache. Une lecture
+        plus ancienne (relue dans MongoDB) confirme tout de même l'entrée en cache.
+        """
+        device_id = doc.get("device_id")
+        ts = to_utc_datetime(doc.get("timestamp"))
+        if not device_id or ts is None:
+            return False
+        now = time.monotonic()
+        current = self._entries.get(device_id)
+        if current is not None and current[0] > ts:
+            self._entries[device_id] = (current[0], current[1], now)
+            return False
+        self._entries[device_id] = (ts, serialize_document(dict(doc)), now)
+        self._entries.move_to_end(device_id)
+        while len(self._entries) > self.max_devices:
+            self._entries.popitem(last=False)
+        return True
+
+    def update_many(self, documents: Iterable[Dict[str, Any]]):
+        for doc in documents:
+            self.update(doc)
+
+
+latest_cache = LatestValueCache()
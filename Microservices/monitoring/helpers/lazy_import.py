@@ -0,0 +1,59 @@
+"""
+Import différé des dépendances lourdes (NumPy) : le module n'est chargé qu'au premier accès à
+l'un de ses attributs, donc ni le démarrage ni un --reload ne paient son import tant qu'aucune
+prédiction n'est demandée ou qu'aucune lecture n'est reçue. warm_up() le charge en arrière-plan
+après le démarrage.
+
+Les modules qui l'utilisent déclarent `from __future__ import annotations` : les annotations
+(np.ndarray) ne sont alors pas évaluées à l'import.
+"""
+import importlib
+import time
+from types import ModuleType
+from typing import Any, Dict, Optional
+
+from helpers.config import logger
+
+# Modules différés, chargés par warm_up()
+HEAVY_MODULES = ("numpy",)
+
+
+class LazyModule:
+    """Proxy du module `name`, importé (via le verrou d'import, donc thread-safe) au premier accès"""
+
+    __slots__ = ("_name", "_module")
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module: Optional[ModuleType] = None
+
+    def _load(self) -> ModuleType:
+        module = self._module
+        if module is None:
+            module = importlib.import_module(self._name)
+            self._module = module
+        return module
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self._load(), attr)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+def lazy_import(name: str) -> LazyModule:
+    return LazyModule(name)
+
+
+def warm_up() -> Dict[str, float]:
+    """Importe les modules lourds (à lancer dans un thread) ; retourne la durée d'import par module (s)"""
+    durations: Dict[str, float] = {}
+    for name in HEAVY_MODULES:
+        start = time.perf_counter()
+        importlib.import_module(name)
+        durations[name] = time.perf_counter() - start
+    logger.info(
+        "[WARMUP] Imported " + ", ".join(f"{name} ({d * 1000:.0f} ms)" for name, d in durations.items())
+    )
+    return durations
@@ -0,0 +1,151 @@
+"""
+Process pool for CPU-heavy model fitting, so it never blocks the API event loop.
+
+Input arrays are copied once into shared memory and attached by the worker as NumPy views
+(no pickling of the data). The number of tasks in flight is bounded: beyond
+MODEL_EXECUTOR_MAX_PENDING a submission is refused immediately (ExecutorBusy) instead of
+queuing, and each task has a timeout (ExecutorTimeout). Small inputs run inline, where the
+round trip to a worker would cost more than the fit itself.
+"""
+from __future__ import annotations
+
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from helpers.lazy_import import lazy_import
+
+from helpers.config import (
+    MODEL_EXECUTOR_WORKERS,
+    MODEL_EXECUTOR_MAX_PENDING,
+    MODEL_EXECUTOR_TIMEOUT,
+    MODEL_EXECUTOR_MIN_CELLS,
+    logger,
+)
+
+np = lazy_import("numpy")
+
+# (shared memory block name, shape, dtype)
+_ArrayRef = Tuple[str, Tuple[int, ...], str]
+
+
+class ExecutorBusy(Exception):
+    """Too many model fits in flight"""
+
+
+class ExecutorTimeout(Exception):
+    """A model fit did not finish within MODEL_EXECUTOR_TIMEOUT"""
+
+
+def _run_task(fn: Callable[..., Any], refs: Dict[str, _ArrayRef], args: Tuple[Any, ...]) -> Any:
+    """Worker side: attach the shared arrays, run the fit, detach"""
+    blocks: List[shared_memory.SharedMemory] = []
+    arrays: Dict[str, np.ndarray] = {}
+    try:
+        for key, (name, shape, dtype) in refs.items():
+            # Spawned workers share the API process's resource tracker: the block stays
+            # registered once and is unlinked by the API process
+            block = shared_memory.SharedMemory(name=name)
+            blocks.append(block)
+            arrays[key] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+        return fn(*args, **arrays)
+    finally:
+        arrays.clear()
+        for block in blocks:
+            block.close()
+
+
+class ModelExecutor:
+    def __init__(
+        self,
+        workers: int = MODEL_EXECUTOR_WORKERS,
+        max_pending: int = MODEL_EXECUTOR_MAX_PENDING,
+        timeout: float = MODEL_EXECUTOR_TIMEOUT,
+        min_cells: int = MODEL_EXECUTOR_MIN_CELLS,
+    ):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.min_cells = min_cells
+        self.pending = 0
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def saturated(self) -> bool:
+        return self.workers > 0 and self.pending >= self.max_pending
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+            logger.info(f"[EXECUTOR] Started model process pool ({self.workers} workers)")
+        return self._pool
+
+    async def run(self, fn: Callable[..., Any], arrays: Dict[str, np.ndarray], *args: Any) -> Any:
+        """
+        fn(*args, **arrays) in a worker process (fn must be a module-level function).
+        Raises ExecutorBusy when the backlog is full, ExecutorTimeout after `timeout` seconds.
+        """
+        cells = sum(array.size for array in arrays.values())
+        if self.workers <= 0 or cells < self.min_cells:
+            return fn(*args, **arrays)
+        if self.pending >= self.max_pending:
+            raise ExecutorBusy(f"{self.pending} model fits in flight")
+        self.pending += 1
+        blocks: List[shared_memory.SharedMemory] = []
+        try:
+            refs: Dict[str, _ArrayRef] = {}
+            for key, array in arrays.items():
+                block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+                blocks.append(block)
+                np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+                refs[key] = (block.name, array.shape, array.dtype.str)
+            future = self._get_pool().submit(_run_task, fn, refs, args)
+        except BaseException as e:
+            self._release(blocks)
+            if isinstance(e, BrokenProcessPool):
+                self._on_broken_pool(e)
+            raise
+        # The slot (and the shared arrays) are held until the task really ends: a timed-out
+        # task cannot be interrupted and keeps its worker busy
+        loop = asyncio.get_running_loop()
+        future.add_done_callback(lambda _: self._release_from_worker(loop, blocks))
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            # A running task cannot be interrupted: its result is discarded when it finishes
+            future.cancel()
+            raise ExecutorTimeout(f"model fit exceeded {self.timeout:g}s")
+        except BrokenProcessPool as e:
+            self._on_broken_pool(e)
+
+    def _on_broken_pool(self, error: BrokenProcessPool):
+        # A worker died (OOM kill, ...): start a fresh pool on the next submission
+        logger.error("[EXECUTOR] Model process pool broken, restarting it")
+        self._pool = None
+        raise ExecutorBusy("model process pool restarting") from error
+
+    def _release_from_worker(self, loop: asyncio.AbstractEventLoop, blocks: List[shared_memory.SharedMemory]):
+        """Done callback (executor thread): release the slot on the event loop"""
+        try:
+            loop.call_soon_threadsafe(self._release, blocks)
+        except RuntimeError:  # loop closed (shutdown)
+            self._release(blocks)
+
+    def _release(self, blocks: List[shared_memory.SharedMemory]):
+        self.pending -= 1
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+            logger.info("[EXECUTOR] Model process pool stopped")
+
+
+model_executor = ModelExecutor()
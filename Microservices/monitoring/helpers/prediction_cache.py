@@ -0,0 +1,94 @@
+"""
+Cache des prédictions par device, clé (method, horizon, limit, ancrage météo) : tant qu'aucune
+nouvelle lecture n'arrive, un rafraîchissement du dashboard coûte une recherche dans un dict.
+Invalidé par device à l'ingestion (consumer, POST /data). LRU borné à PREDICTION_CACHE_MAX_DEVICES.
+Une prédiction est aussi périmée après PREDICTION_CACHE_MAX_AGE s : les lectures stockées par un
+autre replica n'invalident pas ce cache. Compteurs hit / miss exportés sur /metrics.
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, Optional, Tuple
+
+from prometheus_client import Counter
+
+from helpers.config import PREDICTION_CACHE_MAX_DEVICES, PREDICTION_CACHE_MAX_AGE
+
+# Paramètres distincts conservés par device (horizons / limites différents)
+_MAX_KEYS_PER_DEVICE = 16
+
+PREDICTION_CACHE_HITS = Counter(
+    "monitoring_prediction_cache_hits",
+    "Predictions served from the in-process cache",
+    ["method"],
+)
+PREDICTION_CACHE_MISSES = Counter(
+    "monitoring_prediction_cache_misses",
+    "Predictions computed because no cached result was available",
+    ["method"],
+)
+
+
+class PredictionCache:
+    def __init__(self, max_devices: int = PREDICTION_CACHE_MAX_DEVICES, max_age: float = PREDICTION_CACHE_MAX_AGE):
+        self.max_devices = max_devices
+        self.max_age = max_age
+        # device_id -> (génération de la dernière invalidation, {clé: (résultat, instant du calcul)})
+        self._entries: "OrderedDict[str, Tuple[int, Dict[Hashable, Tuple[Dict[str, Any], float]]]]" = OrderedDict()
+        self._generation = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def generation(self) -> int:
+        """À lire avant de calculer une prédiction, puis à passer à put()"""
+        return self._generation
+
+    def get(self, device_id: str, key: Tuple[Any, ...]) -> Optional[Dict[str, Any]]:
+        """Prédiction en cache (copie) ou None ; key[0] = méthode (label des compteurs)"""
+        entry = self._entries.get(device_id)
+        cached = entry[1].get(key) if entry is not None else None
+        if cached is None or (self.max_age > 0 and time.monotonic() - cached[1] > self.max_age):
+            PREDICTION_CACHE_MISSES.labels(key[0]).inc()
+            return None
+        PREDICTION_CACHE_HITS.labels(key[0]).inc()
+        self._entries.move_to_end(device_id)
+        return dict(cached[0])
+
+    def put(self, device_id: str, key: Tuple[Any, ...], result: Dict[str, Any], generation: int) -> bool:
+        """
+        Enregistre une prédiction calculée à partir de la génération `generation` ; ignorée si
+        une lecture du device est arrivée pendant le calcul (résultat déjà périmé).
+        """
+        entry = self._entries.get(device_id)
+        if entry is None:
+            entry = (0, {})
+            self._entries[device_id] = entry
+        elif entry[0] > generation:
+            return False
+        results = entry[1]
+        results.pop(key, None)  # réinsérée en fin : la plus ancienne clé est évincée en premier
+        results[key] = (dict(result), time.monotonic())
+        while len(results) > _MAX_KEYS_PER_DEVICE:
+            results.pop(next(iter(results)))
+        self._entries.move_to_end(device_id)
+        self._evict()
+        return True
+
+    def invalidate(self, device_id: str):
+        """Nouvelle lecture du device : ses prédictions en cache sont périmées"""
+        self._generation += 1
+        self._entries[device_id] = (self._generation, {})
+        self._entries.move_to_end(device_id)
+        self._evict()
+
+    def invalidate_documents(self, documents: Iterable[Dict[str, Any]]):
+        for device_id in {doc.get("device_id") for doc in documents}:
+            if device_id:
+                self.invalidate(device_id)
+
+    def _evict(self):
+        while len(self._entries) > self.max_devices:
+            self._entries.popitem(last=False)
+
+
+prediction_cache = PredictionCache()
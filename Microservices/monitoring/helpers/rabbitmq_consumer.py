@@ -1,8 +1,11 @@
-import pika
+import aio_pika
 import json
-import time
 import asyncio
-from typing import Dict, Any
+from datetime import datetime
+from typing import Callable, Dict, Any, List, Optional, Set, Tuple
+from aio_pika.abc import AbstractIncomingMessage
+from aio_pika.exceptions import ChannelNotFoundEntity, ChannelPreconditionFailed
+from pymongo.errors import BulkWriteError
 from helpers.config import (
     RABBITMQ_HOST,
     RABBITMQ_PORT,
@@ -10,117 +13,454 @@ from helpers.config import (
     RABBITMQ_PASSWORD,
     RABBITMQ_EXCHANGE,
     RABBITMQ_QUEUE,
+    INGEST_BATCH_ENABLED,
+    INGEST_BATCH_SIZE,
+    INGEST_BATCH_MAX_WAIT_MS,
+    RABBITMQ_PREFETCH,
+    RABBITMQ_RECONNECT_BASE_DELAY,
+    RABBITMQ_RECONNECT_MAX_DELAY,
+    RABBITMQ_PARTITION_EXCHANGE,
+    INGEST_WORKERS,
+    USE_TIMESERIES,
+    ROLLUPS_ENABLED,
     logger,
-    collection,
+    async_collection,
 )
-from helpers.socket_manager import get_socket_manager, get_event_loop
+from helpers.socket_manager import get_socket_manager
+from helpers.timeutils import to_utc_datetime, serialize_document
+from dal.indexes import ensure_indexes_async
+from dal.rollup_dao import apply_rollups_async
+from dal.anomaly_dao import insert_anomalies, serialize_anomaly
+from helpers.latest_cache import latest_cache
+from helpers.ring_buffer import ring_buffers
+from helpers.prediction_cache import prediction_cache
+from helpers.anomaly_detector import anomaly_detector
 
+# Number of documents stored by this process (read by the consumer pool stats)
+stored_count = 0
+# When set (consumer pool worker), stored documents are handed to this callable
+# instead of being emitted: the Socket.IO server lives in the API process.
+_stored_sink: Optional[Callable[[List[Dict[str, Any]]], None]] = None
 
-def connect_to_rabbitmq():
-    """Establish connection to RabbitMQ with retry logic"""
-    for attempt in range(5):
+
+def set_stored_sink(sink: Optional[Callable[[List[Dict[str, Any]]], None]]):
+    """Redirect stored documents (consumer pool worker → API process)"""
+    global _stored_sink
+    _stored_sink = sink
+
+
+def partition_queue_name(partition: int) -> str:
+    """Queue consumed by the pool worker of this partition"""
+    return f"{RABBITMQ_QUEUE}.{partition}"
+
+
+async def open_connection():
+    """Open a RabbitMQ connection"""
+    return await aio_pika.connect(
+        host=RABBITMQ_HOST,
+        port=RABBITMQ_PORT,
+        login=RABBITMQ_USER,
+        password=RABBITMQ_PASSWORD,
+        heartbeat=600,
+    )
+
+
+# Partition queues: one active consumer at a time, so that replicas running the same
+# partitions (several pods) do not consume a partition concurrently (per-device ordering)
+_PARTITION_QUEUE_ARGUMENTS = {"x-single-active-consumer": True}
+# Highest partition index probed when looking for partitions left by a larger pool
+_MAX_STALE_PARTITIONS = 256
+
+
+async def connect_to_rabbitmq(partition: Optional[int] = None):
+    """
+    Open a RabbitMQ connection and declare the monitoring exchange/queue.
+    partition: pool worker index. Its queue is bound to a consistent-hash exchange
+    that receives 'device.data' events and hashes them on the device_id header,
+    so every reading of a device lands in the same partition (per-device ordering).
+    Partition queues are single-active-consumer: when several replicas run the pool,
+    one of them consumes each partition and the others stand by.
+    """
+    connection = await open_connection()
+    channel = await connection.channel()
+    # Declare exchange and queue
+    exchange = await channel.declare_exchange(
+        RABBITMQ_EXCHANGE, aio_pika.ExchangeType.TOPIC, durable=True
+    )
+    if partition is not None:
+        partitions = await _declare_partition_exchange(channel)
+        await partitions.bind(exchange, routing_key="device.data")
         try:
-            credentials = pika.PlainCredentials(RABBITMQ_USER, RABBITMQ_PASSWORD)
-            parameters = pika.ConnectionParameters(
-                host=RABBITMQ_HOST,
-                port=RABBITMQ_PORT,
-                credentials=credentials,
-                heartbeat=600,
-                blocked_connection_timeout=300,
+            queue = await channel.declare_queue(
+                partition_queue_name(partition), durable=True, arguments=_PARTITION_QUEUE_ARGUMENTS
             )
-            connection = pika.BlockingConnection(parameters)
-            channel = connection.channel()
-            # Declare exchange and queue
-            channel.exchange_declare(
-                exchange=RABBITMQ_EXCHANGE, exchange_type="topic", durable=True
+        except ChannelPreconditionFailed:
+            # Declared by an earlier version without single-active-consumer: drain and recreate it
+            await _retire_queue(connection, partition_queue_name(partition), RABBITMQ_PARTITION_EXCHANGE, "1")
+            channel = await connection.channel()
+            partitions = await _declare_partition_exchange(channel)
+            queue = await channel.declare_queue(
+                partition_queue_name(partition), durable=True, arguments=_PARTITION_QUEUE_ARGUMENTS
             )
-            channel.queue_declare(queue=RABBITMQ_QUEUE, durable=True)
-            # Bind queue to exchange with routing key pattern
-            channel.queue_bind(
-                exchange=RABBITMQ_EXCHANGE,
-                queue=RABBITMQ_QUEUE,
-                routing_key="device.*",  # Listen to all device events
+        await queue.bind(partitions, routing_key="1")  # equal weight per partition
+    else:
+        queue = await channel.declare_queue(RABBITMQ_QUEUE, durable=True)
+        # Bind queue to exchange with routing key pattern
+        await queue.bind(exchange, routing_key="device.*")  # Listen to all device events
+    logger.info(f"[OK] Connected to RabbitMQ at {RABBITMQ_HOST}:{RABBITMQ_PORT}")
+    return connection, channel, queue
+
+
+async def _declare_partition_exchange(channel):
+    # Requires the rabbitmq_consistent_hash_exchange plugin
+    return await channel.declare_exchange(
+        RABBITMQ_PARTITION_EXCHANGE,
+        "x-consistent-hash",
+        durable=True,
+        arguments={"hash-header": "device_id"},
+    )
+
+
+async def _retire_queue(connection, name: str, source: str, routing_key: str) -> bool:
+    """
+    Unbind a queue that no consumer of the current configuration reads, move its messages
+    back to the device exchange (they are routed again to the queues now in use), then
+    delete it. Returns False if the queue does not exist.
+    """
+    channel = await connection.channel()
+    try:
+        queue = await channel.declare_queue(name, passive=True)
+    except ChannelNotFoundEntity:
+        return False  # the failed passive declare closed the channel
+    try:
+        await queue.unbind(source, routing_key)
+        exchange = await channel.get_exchange(RABBITMQ_EXCHANGE)
+        moved = 0
+        while True:
+            message = await queue.get(no_ack=False, fail=False)
+            if message is None:
+                break
+            await exchange.publish(
+                aio_pika.Message(
+                    body=message.body,
+                    headers=message.headers,
+                    content_type=message.content_type,
+                    delivery_mode=message.delivery_mode,
+                ),
+                routing_key=message.routing_key or "device.data",
             )
-            logger.info(f"[OK] Connected to RabbitMQ at {RABBITMQ_HOST}:{RABBITMQ_PORT}")
-            return connection, channel
+            await message.ack()
+            moved += 1
+        # Still fails (and is retried on the next start) if another replica consumes it
+        await queue.delete(if_unused=True, if_empty=True)
+        logger.info(f"[CONSUMER] Retired queue {name} ({moved} message(s) moved back to {RABBITMQ_EXCHANGE})")
+    finally:
+        if not channel.is_closed:
+            await channel.close()
+    return True
+
+
+async def reconcile_topology(connection, workers: int = INGEST_WORKERS):
+    """
+    Remove the queues a previous configuration left bound to the device exchange, which would
+    keep receiving readings that nobody consumes:
+    - pool mode: partition queues >= workers (pool shrunk) and the single-consumer queue;
+    - single consumer: every partition queue, after unbinding the partition exchange.
+    Their pending messages are moved back to the device exchange before deletion.
+    """
+    if workers > 0:
+        await _retire_queue(connection, RABBITMQ_QUEUE, RABBITMQ_EXCHANGE, "device.*")
+        first_stale = workers
+    else:
+        channel = await connection.channel()
+        try:
+            partitions = await channel.get_exchange(RABBITMQ_PARTITION_EXCHANGE)
+            await partitions.unbind(RABBITMQ_EXCHANGE, routing_key="device.data")
+        except ChannelNotFoundEntity:
+            return  # pool mode never used on this broker
+        finally:
+            if not channel.is_closed:
+                await channel.close()
+        first_stale = 0
+    for partition in range(first_stale, _MAX_STALE_PARTITIONS):
+        # Partitions are numbered from 0: stop at the first one that does not exist
+        if not await _retire_queue(connection, partition_queue_name(partition), RABBITMQ_PARTITION_EXCHANGE, "1"):
+            break
+
+
+def _build_document(event_type: str, device_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Build the MongoDB document for a 'device.data' event.
+    Raises ValueError when device_id is not a string: such a reading cannot be keyed
+    (caches, rollups, partitioning) and would fail again on redelivery.
+    """
+    device_id = device_data.get("device_id")
+    if device_id is not None and not isinstance(device_id, str):
+        raise ValueError(f"device_id must be a string, got {type(device_id).__name__}")
+    # Store in MongoDB (température, humidité, CPU/RAM/disk des end-devices, etc.)
+    document = {
+        "device_id": device_id,
+        "temperature": device_data.get("temperature"),
+        "humidity": device_data.get("humidity"),
+        "status": device_data.get("status"),
+        # Native BSON datetime (UTC); reception time if missing or unparsable
+        "timestamp": to_utc_datetime(device_data.get("timestamp")) or datetime.utcnow(),
+        "event_type": event_type,
+    }
+    if device_data.get("device_type") is not None:
+        document["device_type"] = device_data.get("device_type")
+    if device_data.get("cpu") is not None:
+        document["cpu"] = device_data.get("cpu")
+    if device_data.get("memory_percent") is not None:
+        document["memory_percent"] = device_data.get("memory_percent")
+    if device_data.get("disk_percent") is not None:
+        document["disk_percent"] = device_data.get("disk_percent")
+    return document
+
+
+async def _on_stored(documents: List[Dict[str, Any]]):
+    """
+    Update rollups, then hand freshly stored documents to the API process (pool worker) or publish them here.
+    Called once the documents are stored and acked: errors are logged, never raised, so that
+    they cannot requeue (and store twice) a message or stop the consumer.
+    """
+    global stored_count
+    if not documents:
+        return
+    stored_count += len(documents)
+    try:
+        if ROLLUPS_ENABLED:
+            await apply_rollups_async(documents)
+        if _stored_sink is not None:
+            _stored_sink(documents)
+            return
+        await publish_documents(documents)
+    except Exception as e:
+        logger.error(f"[ERROR] Post-insert processing failed for {len(documents)} document(s): {e}")
+
+
+def _guarded(stage: str, apply: Callable[[Dict[str, Any]], Any], doc: Dict[str, Any]) -> Any:
+    """Apply one in-process stage to one document; a failure is logged and the document skipped"""
+    try:
+        return apply(doc)
+    except Exception as e:
+        logger.error(f"[STATE] {stage} skipped a reading of device {doc.get('device_id')!r}: {e}")
+        return None
+
+
+async def publish_documents(documents: List[Dict[str, Any]]):
+    """
+    Update in-process state and run anomaly detection, then Socket.IO real-time broadcast
+    (same event loop, emits are awaited directly); detected anomalies are emitted as
+    device_anomaly and stored in the anomalies collection.
+    Each stage is guarded per document: a reading that makes one fail is logged and
+    skipped, the rest of the batch (and the consumer) carries on.
+    """
+    anomalies: List[Dict[str, Any]] = []
+    for doc in documents:
+        _guarded("latest cache", latest_cache.update, doc)
+        _guarded("ring buffer", ring_buffers.append, doc)
+        _guarded("prediction cache", lambda d: prediction_cache.invalidate_documents([d]), doc)
+        anomalies.extend(_guarded("anomaly detection", lambda d: anomaly_detector.observe_many([d]), doc) or [])
+    sio = get_socket_manager()
+    if sio is None:
+        logger.warning("[SOCKET] Socket manager not initialized")
+    else:
+        emitted = 0
+        for doc in documents:
+            try:
+                # ObjectId "_id" (added by insert_one/insert_many) and datetime are not JSON serializable
+                payload = serialize_document(dict(doc))
+                await sio.emit("device_data", payload)
+                emitted += 1
+            except Exception as socket_error:
+                logger.error(f"[SOCKET] Error emitting via Socket.IO: {socket_error}")
+        logger.info(f"[SOCKET] Emitted device_data for {emitted} document(s)")
+        for anomaly in anomalies:
+            try:
+                await sio.emit("device_anomaly", serialize_anomaly(dict(anomaly)))
+            except Exception as socket_error:
+                logger.error(f"[SOCKET] Error emitting anomaly via Socket.IO: {socket_error}")
+    if anomalies:
+        logger.info(f"[ANOMALY] {len(anomalies)} anomaly(ies) detected")
+        try:
+            await insert_anomalies(anomalies)
         except Exception as e:
-            logger.warning(
-                f"[WARNING] RabbitMQ connection attempt {attempt + 1}/5 failed: {e}"
-            )
-            if attempt < 4:
-                time.sleep(5)
-            else:
-                logger.error("[ERROR] Failed to connect to RabbitMQ after 5 attempts")
-                raise
+            logger.error(f"[ANOMALY] Error storing {len(anomalies)} anomaly(ies): {e}")
 
 
-def process_message(ch, method, properties, body):
+async def process_message(message: AbstractIncomingMessage):
     """Process incoming RabbitMQ message"""
     try:
-        message = json.loads(body)
-        event_type = message.get("event_type", "unknown")
-        device_data = message.get("data", {})
+        payload = json.loads(message.body)
+        event_type = payload.get("event_type", "unknown")
+        device_data = payload.get("data", {})
 
         # Only process 'device.data' events for monitoring
+        document = None
         if event_type == "device.data":
-            # Store in MongoDB (température, humidité, CPU/RAM/disk des end-devices, etc.)
-            document = {
-                "device_id": device_data.get("device_id"),
-                "temperature": device_data.get("temperature"),
-                "humidity": device_data.get("humidity"),
-                "status": device_data.get("status"),
-                "timestamp": device_data.get("timestamp"),
-                "event_type": event_type,
-            }
-            if device_data.get("cpu") is not None:
-                document["cpu"] = device_data.get("cpu")
-            if device_data.get("memory_percent") is not None:
-                document["memory_percent"] = device_data.get("memory_percent")
-            if device_data.get("disk_percent") is not None:
-                document["disk_percent"] = device_data.get("disk_percent")
-            collection.insert_one(document)
+            document = _build_document(event_type, device_data)
+            await async_collection.insert_one(document)
             logger.info(
                 f"[DATA] Stored data for device {device_data.get('device_id')} in MongoDB"
             )
-
-            # Socket.IO real-time broadcast (depuis le thread RabbitMQ → boucle asyncio principale)
-            try:
-                sio = get_socket_manager()
-                loop = get_event_loop()
-                if sio is not None and loop is not None:
-                    async def emit_data():
-                        await sio.emit("device_data", document)
-                    asyncio.run_coroutine_threadsafe(emit_data(), loop)
-                    logger.info(
-                        f"[SOCKET] Emitted device_data for {document.get('device_id')}"
-                    )
-                else:
-                    logger.warning("[SOCKET] Socket manager or event loop not initialized")
-            except Exception as socket_error:
-                logger.error(f"[SOCKET] Error emitting via Socket.IO: {socket_error}")
-
-        # Acknowledge message
-        ch.basic_ack(delivery_tag=method.delivery_tag)
     except json.JSONDecodeError as e:
         logger.error(f"[ERROR] Failed to parse RabbitMQ message: {e}")
-        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+        await message.nack(requeue=False)
+        return
+    except ValueError as e:
+        logger.error(f"[ERROR] Invalid device.data event: {e}")
+        await message.nack(requeue=False)
+        return
     except Exception as e:
         logger.error(f"[ERROR] Error processing message: {e}")
-        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+        await message.nack(requeue=True)
+        return
 
+    # Acknowledge message as soon as it is stored: a redelivery would insert it again
+    await message.ack()
+    if document is not None:
+        await _on_stored([document])
 
-def start_rabbitmq_consumer():
-    """Start consuming messages from RabbitMQ"""
-    try:
-        connection, channel = connect_to_rabbitmq()
-        channel.basic_qos(prefetch_count=1)  # Process one message at a time
-        channel.basic_consume(
-            queue=RABBITMQ_QUEUE, on_message_callback=process_message
+
+async def flush_batch(batch: List[Tuple[AbstractIncomingMessage, Optional[Dict[str, Any]]]]):
+    """
+    Write a batch with one unordered insert_many and ack it with a single multiple-ack.
+    batch: list of (message, document) in delivery order; document is None for
+    events that are acknowledged without being stored.
+    Documents rejected by MongoDB are nacked on their own (without requeue: a write
+    error such as a validation failure would fail again on redelivery).
+    """
+    if not batch:
+        return
+    indexed = [(message, doc) for message, doc in batch if doc is not None]
+    documents = [doc for _, doc in indexed]
+    failed_tags: Set[int] = set()
+    if documents:
+        try:
+            await async_collection.insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                failed_tags.add(indexed[error["index"]][0].delivery_tag)
+            logger.error(
+                f"[ERROR] {len(failed_tags)}/{len(documents)} document(s) rejected in batch insert"
+            )
+        except Exception as e:
+            # Whole batch failed (MongoDB unreachable, ...) → requeue everything
+            logger.error(f"[ERROR] Batch insert failed, requeuing {len(batch)} message(s): {e}")
+            await batch[-1][0].nack(multiple=True, requeue=True)
+            return
+
+    acked: Optional[AbstractIncomingMessage] = None
+    for message, _ in batch:
+        if message.delivery_tag in failed_tags:
+            await message.nack(requeue=False)
+        else:
+            acked = message
+    if acked is not None:
+        # Multiple-ack covers every outstanding delivery up to this tag (nacked ones excluded)
+        await acked.ack(multiple=True)
+
+    stored = [doc for message, doc in indexed if message.delivery_tag not in failed_tags]
+    if stored:
+        logger.info(f"[DATA] Stored batch of {len(stored)} document(s) in MongoDB")
+    await _on_stored(stored)
+
+
+async def consume_batches(inbox: "asyncio.Queue[AbstractIncomingMessage]"):
+    """Accumulate messages until INGEST_BATCH_SIZE or INGEST_BATCH_MAX_WAIT_MS, then flush"""
+    loop = asyncio.get_running_loop()
+    max_wait = INGEST_BATCH_MAX_WAIT_MS / 1000.0
+    while True:
+        message = await inbox.get()
+        batch: List[Tuple[AbstractIncomingMessage, Optional[Dict[str, Any]]]] = []
+        deadline = loop.time() + max_wait
+        while True:
+            try:
+                payload = json.loads(message.body)
+            except json.JSONDecodeError as e:
+                logger.error(f"[ERROR] Failed to parse RabbitMQ message: {e}")
+                await message.nack(requeue=False)
+                payload = None
+            if payload is not None:
+                event_type = payload.get("event_type", "unknown")
+                document = None
+                # Only process 'device.data' events for monitoring
+                if event_type == "device.data":
+                    try:
+                        document = _build_document(event_type, payload.get("data", {}))
+                    except ValueError as e:
+                        logger.error(f"[ERROR] Invalid device.data event: {e}")
+                        await message.nack(requeue=False)
+                        payload = None
+                if payload is not None:
+                    batch.append((message, document))
+            timeout = deadline - loop.time()
+            if len(batch) >= INGEST_BATCH_SIZE or timeout <= 0:
+                break
+            try:
+                message = await asyncio.wait_for(inbox.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+        await flush_batch(batch)
+
+
+async def _consume(connection, channel, queue):
+    """Consume until the connection closes (or the batch loop fails)"""
+    closed = asyncio.Event()
+    connection.close_callbacks.add(lambda *args: closed.set())
+    waiters = [asyncio.create_task(closed.wait())]
+    if INGEST_BATCH_ENABLED:
+        # Prefetch window must hold at least one full batch
+        await channel.set_qos(prefetch_count=max(RABBITMQ_PREFETCH, INGEST_BATCH_SIZE))
+        inbox: "asyncio.Queue[AbstractIncomingMessage]" = asyncio.Queue()
+        await queue.consume(inbox.put)
+        waiters.append(asyncio.create_task(consume_batches(inbox)))
+        logger.info(
+            f"[CONSUMER] Started batched consuming from RabbitMQ queue: {RABBITMQ_QUEUE} "
+            f"(batch={INGEST_BATCH_SIZE}, max_wait={INGEST_BATCH_MAX_WAIT_MS}ms)"
         )
+    else:
+        await channel.set_qos(prefetch_count=1)  # Process one message at a time
+        await queue.consume(process_message)
         logger.info(f"[CONSUMER] Started consuming from RabbitMQ queue: {RABBITMQ_QUEUE}")
-        channel.start_consuming()
-    except Exception as e:
-        logger.error(f"[ERROR] RabbitMQ consumer error: {e}")
-        # Retry after delay
-        time.sleep(10)
-        start_rabbitmq_consumer()
+    try:
+        done, _ = await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            task.result()  # re-raise a batch loop failure
+    finally:
+        for task in waiters:
+            task.cancel()
+
+
+async def start_rabbitmq_consumer(partition: Optional[int] = None):
+    """Consume from RabbitMQ on the app's event loop, reconnecting with a capped exponential backoff"""
+    attempt = 0
+    storage_ready = not USE_TIMESERIES
+    # Cleanup of a previous topology: done once, by the single consumer or by pool worker 0
+    topology_ready = partition not in (None, 0)
+    while True:
+        try:
+            if not storage_ready:
+                # An insert into a missing collection would create a regular one
+                await ensure_indexes_async()
+                storage_ready = True
+            connection, channel, queue = await connect_to_rabbitmq(partition)
+            attempt = 0
+            async with connection:
+                if not topology_ready:
+                    try:
+                        await reconcile_topology(connection)
+                    except Exception as e:
+                        logger.error(f"[CONSUMER] Could not retire stale queues: {e}")
+                    topology_ready = True
+                await _consume(connection, channel, queue)
+            logger.warning("[CONSUMER] RabbitMQ connection closed")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"[ERROR] RabbitMQ consumer error: {e}")
+        delay = min(RABBITMQ_RECONNECT_MAX_DELAY, RABBITMQ_RECONNECT_BASE_DELAY * 2 ** min(attempt, 10))
+        attempt += 1
+        logger.info(f"[CONSUMER] Reconnecting to RabbitMQ in {delay:.1f}s (attempt {attempt})")
+        await asyncio.sleep(delay)
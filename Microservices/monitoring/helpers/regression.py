@@ -0,0 +1,125 @@
+"""
+Régression linéaire simple (température ~ timestamp) en forme close.
+Même pente / ordonnée que sklearn LinearRegression sur une seule variable, sans fit par requête.
+
+Les timestamps sont exprimés relativement à une origine t0 (timestamps epoch ~1.7e9 :
+Σt² perdrait toute précision en float64). Un ajustement est un tuple (slope, intercept, t0) :
+prédiction(t) = intercept + slope * (t - t0).
+"""
+from __future__ import annotations
+
+from typing import Optional, Sequence, Tuple
+
+from helpers.lazy_import import lazy_import
+
+np = lazy_import("numpy")
+
+Fit = Tuple[float, float, float]
+
+# Écart max (s) entre un timestamp et l'origine avant recalcul des sommes sur une nouvelle origine
+_MAX_ORIGIN_OFFSET = 86400.0
+
+
+def ols_fit(times: Sequence[float], values: Sequence[float]) -> Optional[Fit]:
+    """Moindres carrés sur des tableaux (données centrées, comme sklearn). None si moins de 2 points."""
+    if len(times) < 2:
+        return None
+    t0 = float(times[0])
+    t = np.asarray(times, dtype=np.float64) - t0
+    y = np.asarray(values, dtype=np.float64)
+    t_mean = t.mean()
+    y_mean = y.mean()
+    dt = t - t_mean
+    sxx = float(np.dot(dt, dt))
+    # Timestamps tous identiques : pente nulle, comme la solution de norme minimale de sklearn
+    slope = float(np.dot(dt, y - y_mean)) / sxx if sxx > 0 else 0.0
+    return slope, float(y_mean - slope * t_mean), t0
+
+
+def predict_at(fit: Fit, ts: float) -> float:
+    slope, intercept, t0 = fit
+    return intercept + slope * (ts - t0)
+
+
+class SlidingOLS:
+    """
+    Statistiques suffisantes (n, Σt, Σt², Σy, Σty) d'une fenêtre glissante, mises à jour en O(1)
+    par lecture (ajout de la nouvelle, retrait de celle qui sort de la fenêtre).
+    Les sommes sont recalculées exactement toutes les `window` mises à jour (dérive des
+    additions / soustractions flottantes) et quand un timestamp s'éloigne trop de l'origine.
+    """
+
+    __slots__ = ("window", "t0", "n", "st", "stt", "sy", "sty", "updates")
+
+    def __init__(self, window: int):
+        self.window = window
+        self.t0 = 0.0
+        self.n = 0
+        self.st = self.stt = self.sy = self.sty = 0.0
+        self.updates = 0
+
+    def _add(self, ts: float, value: float, sign: float):
+        t = ts - self.t0
+        self.st += sign * t
+        self.stt += sign * t * t
+        self.sy += sign * value
+        self.sty += sign * t * value
+
+    def push(self, ts: float, value: float, evicted: Optional[Tuple[float, float]] = None):
+        """Ajoute une lecture ; evicted = (ts, value) de la lecture qui sort de la fenêtre"""
+        if self.n == 0:
+            self.t0 = ts
+        if evicted is not None:
+            self._add(evicted[0], evicted[1], -1.0)
+            self.n -= 1
+        self._add(ts, value, 1.0)
+        self.n += 1
+        self.updates += 1
+
+    def needs_rebase(self, ts: float) -> bool:
+        return self.updates >= self.window or abs(ts - self.t0) > _MAX_ORIGIN_OFFSET
+
+    def rebase(self, times: Sequence[float], values: Sequence[float]):
+        """Recalcule les sommes exactement sur la fenêtre (ordre chronologique), origine = plus ancienne lecture"""
+        self.n = len(times)
+        self.t0 = float(times[0]) if self.n else 0.0
+        t = np.asarray(times, dtype=np.float64) - self.t0
+        y = np.asarray(values, dtype=np.float64)
+        self.st = float(t.sum())
+        self.stt = float(np.dot(t, t))
+        self.sy = float(y.sum())
+        self.sty = float(np.dot(t, y))
+        self.updates = 0
+
+    def fit(self) -> Optional[Fit]:
+        """(slope, intercept, t0) de la fenêtre courante, None si moins de 2 lectures"""
+        n = self.n
+        if n < 2:
+            return None
+        den = n * self.stt - self.st * self.st
+        # Seuil relatif : den ≈ 0 aux erreurs d'arrondi près quand les timestamps sont identiques
+        slope = (n * self.sty - self.st * self.sy) / den if den > 1e-12 * n * self.stt else 0.0
+        return slope, (self.sy - slope * self.st) / n, self.t0
+
+
+def ols_fit_batch(
+    times: np.ndarray, values: np.ndarray, counts: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Moindres carrés de plusieurs séries d'un coup (une ligne par device).
+    times / values : tableaux (devices, n), séries chronologiques alignées à gauche, cellules
+    au-delà de counts[i] ignorées. Retourne (slopes, intercepts, t0s) ; lignes de moins de
+    2 points non significatives (à écarter par l'appelant).
+    """
+    mask = np.arange(times.shape[1]) < counts[:, None]
+    t0 = times[:, 0].copy()
+    t = np.where(mask, times - t0[:, None], 0.0)
+    y = np.where(mask, values, 0.0)
+    n = np.maximum(counts, 1).astype(np.float64)
+    t_mean = t.sum(axis=1) / n
+    y_mean = y.sum(axis=1) / n
+    dt = np.where(mask, t - t_mean[:, None], 0.0)
+    sxx = np.einsum("ij,ij->i", dt, dt)
+    sxy = np.einsum("ij,ij->i", dt, y - y_mean[:, None])
+    slopes = np.divide(sxy, sxx, out=np.zeros_like(sxx), where=sxx > 0)
+    return slopes, y_mean - slopes * t_mean, t0
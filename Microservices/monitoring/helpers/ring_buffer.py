@@ -0,0 +1,205 @@
+"""
+Buffers circulaires par device des dernières lectures (timestamp epoch float64, température float64).
+Remplis par le consumer ; les routes de prédiction lisent des vues NumPy sans requête MongoDB
+ni parsing de dates. Profondeur et nombre de devices suivis bornés (éviction LRU).
+Un buffer sans lecture ni rechargement depuis RING_BUFFER_MAX_AGE s n'est plus considéré à jour
+(device consommé par un autre replica) : il est rechargé depuis MongoDB avant d'être lu.
+"""
+from __future__ import annotations
+
+import math
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from helpers.lazy_import import lazy_import
+
+from helpers.config import RING_BUFFER_DEPTH, RING_BUFFER_MAX_DEVICES, RING_BUFFER_MAX_AGE, REGRESSION_WINDOW
+from helpers.regression import Fit, SlidingOLS
+from helpers.holt_winters import HoltWintersState
+from helpers.timeutils import to_epoch_seconds
+
+np = lazy_import("numpy")
+
+
+class DeviceRingBuffer:
+    """
+    Chaque valeur est écrite deux fois (position p et p + depth) : les n dernières lectures
+    sont toujours contiguës, donc accessibles en vue (slice) sans copie.
+    Les sommes de la régression sur les `window` dernières lectures et l'état Holt-Winters
+    sont tenus à jour à l'ajout.
+    """
+
+    __slots__ = ("depth", "times", "values", "pos", "size", "warmed", "refreshed_at", "ols", "hw", "hw_seeded")
+
+    def __init__(self, depth: int = RING_BUFFER_DEPTH, window: int = REGRESSION_WINDOW):
+        self.depth = depth
+        self.times = np.zeros(2 * depth, dtype=np.float64)
+        self.values = np.zeros(2 * depth, dtype=np.float64)
+        self.pos = 0
+        self.size = 0
+        # True une fois complété depuis MongoDB (l'historique antérieur au démarrage est chargé)
+        self.warmed = False
+        # Instant (time.monotonic) de la dernière lecture ajoutée ou du dernier rechargement
+        self.refreshed_at = time.monotonic()
+        self.ols = SlidingOLS(max(2, min(window, depth)))
+        self.hw = HoltWintersState()
+        # True une fois l'état Holt-Winters amorcé avec l'historique des rollups
+        self.hw_seeded = False
+
+    def last_time(self) -> Optional[float]:
+        if self.size == 0:
+            return None
+        return float(self.times[self.pos + self.depth - 1])
+
+    def append(self, ts: float, value: float) -> bool:
+        """
+        Ajoute une lecture ; les lectures plus anciennes que la dernière sont ignorées, comme les
+        valeurs non finies (NaN, inf : json.loads accepte NaN) qui fausseraient les sommes de la
+        régression et l'état Holt-Winters
+        """
+        if not (math.isfinite(ts) and math.isfinite(value)):
+            return False
+        last = self.last_time()
+        if last is not None and ts < last:
+            return False
+        p = self.pos
+        window = self.ols.window
+        evicted = None
+        if self.size >= window:
+            # Lecture qui sort de la fenêtre (lue avant écrasement quand window == depth)
+            out = p + self.depth - window
+            evicted = (float(self.times[out]), float(self.values[out]))
+        self.times[p] = self.times[p + self.depth] = ts
+        self.values[p] = self.values[p + self.depth] = value
+        self.pos = (p + 1) % self.depth
+        self.size = min(self.size + 1, self.depth)
+        if self.ols.needs_rebase(ts):
+            self.ols.rebase(*self.view(window))
+        else:
+            self.ols.push(ts, value, evicted)
+        self.hw.update(ts, value)
+        self.refreshed_at = time.monotonic()
+        return True
+
+    def seed_forecaster(self, times: Iterable[float], values: Iterable[float], width: float = 0.0):
+        """
+        Reconstruit l'état Holt-Winters : historique plus ancien (moyennes sur des intervalles de
+        `width` s centrés sur times, ex. buckets horaires des rollups, ordre chronologique) dont
+        l'intervalle se termine avant la première lecture du buffer, puis les lectures du buffer
+        """
+        times_view, values_view = self.view()
+        first = float(times_view[0]) if len(times_view) else None
+        hw = HoltWintersState()
+        for ts, value in zip(times, values):
+            if first is None or ts + width / 2 <= first:
+                hw.update(ts, value)
+        for ts, value in zip(times_view.tolist(), values_view.tolist()):
+            hw.update(ts, value)
+        self.hw = hw
+        self.hw_seeded = True
+
+    def window_fit(self, n: int) -> Optional[Fit]:
+        """Ajustement incrémental si les n dernières lectures sont exactement la fenêtre suivie, sinon None"""
+        if n != self.ols.n:
+            return None
+        return self.ols.fit()
+
+    def view(self, n: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """(times, values) des n dernières lectures, ordre chronologique (vues en lecture seule)"""
+        n = self.size if n is None else min(n, self.size)
+        end = self.pos + self.depth
+        times = self.times[end - n:end]
+        values = self.values[end - n:end]
+        times.flags.writeable = False
+        values.flags.writeable = False
+        return times, values
+
+
+class RingBufferStore:
+    """device_id → DeviceRingBuffer, LRU borné à max_devices"""
+
+    def __init__(
+        self,
+        depth: int = RING_BUFFER_DEPTH,
+        max_devices: int = RING_BUFFER_MAX_DEVICES,
+        window: int = REGRESSION_WINDOW,
+        max_age: float = RING_BUFFER_MAX_AGE,
+    ):
+        self.depth = depth
+        self.window = window
+        self.max_devices = max_devices
+        self.max_age = max_age
+        self._buffers: "OrderedDict[str, DeviceRingBuffer]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._buffers)
+
+    def get(self, device_id: str) -> Optional[DeviceRingBuffer]:
+        buf = self._buffers.get(device_id)
+        if buf is not None:
+            self._buffers.move_to_end(device_id)
+        return buf
+
+    def fresh(self, buf: DeviceRingBuffer) -> bool:
+        """Buffer alimenté ou rechargé depuis moins de max_age s (0 = toujours à jour)"""
+        return self.max_age <= 0 or time.monotonic() - buf.refreshed_at <= self.max_age
+
+    def items(self) -> List[Tuple[str, DeviceRingBuffer]]:
+        """Copie des (device_id, buffer) suivis, sans toucher à l'ordre LRU"""
+        return list(self._buffers.items())
+
+    def _get_or_create(self, device_id: str) -> DeviceRingBuffer:
+        buf = self.get(device_id)
+        if buf is None:
+            buf = DeviceRingBuffer(self.depth, self.window)
+            self._buffers[device_id] = buf
+            while len(self._buffers) > self.max_devices:
+                self._buffers.popitem(last=False)
+        return buf
+
+    def append(self, doc: Dict[str, Any]) -> bool:
+        """Ajoute une lecture (document stocké) si elle a une température et un timestamp lisible"""
+        device_id = doc.get("device_id")
+        value = doc.get("temperature")
+        if not device_id or value is None:
+            return False
+        ts = to_epoch_seconds(doc.get("timestamp"))
+        if ts is None:
+            return False
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            return False
+        if not math.isfinite(value):
+            return False
+        return self._get_or_create(device_id).append(ts, value)
+
+    def append_many(self, documents: Iterable[Dict[str, Any]]):
+        for doc in documents:
+            self.append(doc)
+
+    def warm(self, device_id: str, times: Iterable[float], values: Iterable[float]) -> DeviceRingBuffer:
+        """
+        Complète le buffer avec l'historique MongoDB (ordre chronologique). Les lectures reçues
+        entre-temps par le consumer (plus récentes que l'historique) sont conservées.
+        """
+        old = self._buffers.get(device_id)
+        buf = DeviceRingBuffer(self.depth, self.window)
+        for ts, value in zip(times, values):
+            buf.append(ts, value)
+        if old is not None:
+            last = buf.last_time()
+            old_times, old_values = old.view()
+            for ts, value in zip(old_times, old_values):
+                if last is None or ts > last:
+                    buf.append(float(ts), float(value))
+        buf.warmed = True
+        self._buffers[device_id] = buf
+        self._buffers.move_to_end(device_id)
+        while len(self._buffers) > self.max_devices:
+            self._buffers.popitem(last=False)
+        return buf
+
+
+ring_buffers = RingBufferStore()
@@ -0,0 +1,68 @@
+"""
+Timestamps : stockés en datetime BSON (UTC naïf, convention pymongo), exposés en ISO 8601.
+Les anciens documents (chaînes ISO naïves ou "+00:00") sont convertis par dal/timestamp_migration.py.
+"""
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+
+def to_utc_datetime(value: Any) -> Optional[datetime]:
+    """
+    Convertit une chaîne ISO ("Z", "+00:00" ou naïve = UTC) ou un datetime en datetime UTC naïf.
+    Retourne None si la valeur est absente ou illisible.
+    """
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        dt = value
+    elif isinstance(value, str):
+        try:
+            dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    else:
+        return None
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+def to_iso(value: Any) -> Any:
+    """datetime UTC naïf → ISO 8601 explicite ("+00:00"); les autres valeurs sont renvoyées telles quelles"""
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.isoformat()
+    return value
+
+
+def to_epoch_seconds(value: Any) -> Optional[float]:
+    """Timestamp (datetime ou chaîne ISO) → secondes epoch (float), None si illisible"""
+    dt = to_utc_datetime(value)
+    if dt is None:
+        return None
+    return dt.replace(tzinfo=timezone.utc).timestamp()
+
+
+def serialize_document(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Document Mongo → dict JSON-compatible (ObjectId en str, timestamp en ISO)"""
+    if "_id" in doc:
+        doc["_id"] = str(doc["_id"])
+    if "timestamp" in doc:
+        doc["timestamp"] = to_iso(doc["timestamp"])
+    return doc
+
+
+def timestamp_range_filter(start_time: datetime, end_time: datetime) -> Dict[str, Any]:
+    """
+    Filtre sur timestamp entre deux bornes. Tant que la migration n'est pas terminée,
+    les documents encore en chaîne sont comparés (lexicalement) à la borne ISO équivalente.
+    """
+    start = to_utc_datetime(start_time)
+    end = to_utc_datetime(end_time)
+    return {
+        "$or": [
+            {"timestamp": {"$gte": start, "$lte": end}},
+            {"timestamp": {"$gte": start.isoformat(), "$lte": end.isoformat(), "$type": "string"}},
+        ]
+    }
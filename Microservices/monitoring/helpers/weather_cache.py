@@ -0,0 +1,151 @@
+"""
+Cache des réponses Open-Meteo, clé (type de donnée, cellule lat/lon arrondie à
+WEATHER_CACHE_GRID_DECIMALS décimales, paramètres) :
+- frais (âge < TTL du type : météo actuelle, prévisions) : servi directement ;
+- périmé mais dans la fenêtre WEATHER_CACHE_STALE_WINDOW : servi immédiatement, un
+  rafraîchissement part en arrière-plan (stale-while-revalidate) ;
+- échec de l'API : la dernière valeur reste servie tant qu'elle est dans la fenêtre (panne de
+  l'API sans 503), sinon l'échec est mis en cache WEATHER_CACHE_NEGATIVE_TTL secondes pour ne
+  pas solliciter l'API à chaque requête pendant une panne.
+LRU borné à WEATHER_CACHE_MAX_ENTRIES. Compteurs exportés sur /metrics.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from prometheus_client import Counter
+
+from helpers.config import (
+    WEATHER_CACHE_ENABLED,
+    WEATHER_CACHE_GRID_DECIMALS,
+    WEATHER_CACHE_MAX_ENTRIES,
+    WEATHER_CACHE_NEGATIVE_TTL,
+    WEATHER_CACHE_STALE_WINDOW,
+    logger,
+)
+
+Fetch = Callable[[], Awaitable[Optional[Dict[str, Any]]]]
+
+WEATHER_CACHE_REQUESTS = Counter(
+    "monitoring_weather_cache_requests",
+    "Weather lookups by data kind and cache outcome (fresh, stale, negative, miss)",
+    ["kind", "result"],
+)
+WEATHER_UPSTREAM_FAILURES = Counter(
+    "monitoring_weather_upstream_failures",
+    "Failed Open-Meteo calls, by data kind and whether a stale value was served instead",
+    ["kind", "served_stale"],
+)
+
+
+def grid_cell(lat: float, lon: float) -> Tuple[float, float]:
+    """Cellule de la grille (lat, lon arrondies) : deux points proches partagent la même entrée"""
+    return round(lat, WEATHER_CACHE_GRID_DECIMALS), round(lon, WEATHER_CACHE_GRID_DECIMALS)
+
+
+class _Entry:
+    __slots__ = ("value", "fetched_at", "retry_at")
+
+    def __init__(self, value: Optional[Dict[str, Any]], fetched_at: float, retry_at: float = 0.0):
+        self.value = value  # None = échec en cache (négatif)
+        self.fetched_at = fetched_at  # dernier appel réussi (ou échec, pour une entrée négative)
+        self.retry_at = retry_at  # pas de nouvel appel avant (après un échec)
+
+
+class WeatherCache:
+    def __init__(
+        self,
+        max_entries: int = WEATHER_CACHE_MAX_ENTRIES,
+        negative_ttl: float = WEATHER_CACHE_NEGATIVE_TTL,
+        stale_window: float = WEATHER_CACHE_STALE_WINDOW,
+        enabled: bool = WEATHER_CACHE_ENABLED,
+    ):
+        self.max_entries = max_entries
+        self.negative_ttl = negative_ttl
+        self.stale_window = stale_window
+        self.enabled = enabled
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._refreshing: Dict[Hashable, asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get(self, key: Tuple[Any, ...], ttl: float, fetch: Fetch) -> Optional[Dict[str, Any]]:
+        """
+        Valeur pour `key` (key[0] = type de donnée, label des compteurs), obtenue par `fetch`
+        (coroutine, None en cas d'échec) si le cache n'a rien d'utilisable. Le résultat est
+        partagé : l'appelant le copie avant de le modifier.
+        """
+        if not self.enabled:
+            return await fetch()
+        kind = key[0]
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None:
+            age = now - entry.fetched_at
+            if entry.value is None:
+                if now < entry.retry_at:
+                    WEATHER_CACHE_REQUESTS.labels(kind, "negative").inc()
+                    return None
+            elif age < ttl:
+                WEATHER_CACHE_REQUESTS.labels(kind, "fresh").inc()
+                self._entries.move_to_end(key)
+                return entry.value
+            elif age < ttl + self.stale_window:
+                WEATHER_CACHE_REQUESTS.labels(kind, "stale").inc()
+                self._entries.move_to_end(key)
+                if now >= entry.retry_at:
+                    self._schedule_refresh(key, ttl, fetch)
+                return entry.value
+        WEATHER_CACHE_REQUESTS.labels(kind, "miss").inc()
+        return await self._fetch_and_store(key, ttl, fetch)
+
+    async def _fetch_and_store(self, key: Tuple[Any, ...], ttl: float, fetch: Fetch) -> Optional[Dict[str, Any]]:
+        value = await fetch()
+        now = time.monotonic()
+        if value is not None:
+            self._store(key, _Entry(value, now))
+            return value
+        previous = self._entries.get(key)
+        if previous is not None and previous.value is not None and now - previous.fetched_at < ttl + self.stale_window:
+            # Panne de l'API : on garde la dernière valeur et on espace les nouveaux essais
+            WEATHER_UPSTREAM_FAILURES.labels(key[0], "true").inc()
+            previous.retry_at = now + self.negative_ttl
+            return previous.value
+        WEATHER_UPSTREAM_FAILURES.labels(key[0], "false").inc()
+        self._store(key, _Entry(None, now, now + self.negative_ttl))
+        return None
+
+    def _schedule_refresh(self, key: Tuple[Any, ...], ttl: float, fetch: Fetch):
+        task = self._refreshing.get(key)
+        if task is not None and not task.done() and not task.get_loop().is_closed():
+            return
+        self._refreshing[key] = asyncio.create_task(self._refresh(key, ttl, fetch))
+
+    async def _refresh(self, key: Tuple[Any, ...], ttl: float, fetch: Fetch):
+        try:
+            await self._fetch_and_store(key, ttl, fetch)
+        except Exception as e:
+            logger.warning(f"[WEATHER] Background refresh of {key} failed: {e}")
+        finally:
+            self._refreshing.pop(key, None)
+
+    def _store(self, key: Tuple[Any, ...], entry: _Entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def cancel_refreshes(self):
+        """Annule les rafraîchissements en cours (arrêt de l'application)"""
+        for task in self._refreshing.values():
+            task.cancel()
+        self._refreshing.clear()
+
+    def clear(self):
+        self.cancel_refreshes()
+        self._entries.clear()
+
+
+weather_cache = WeatherCache()
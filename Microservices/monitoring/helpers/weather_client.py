@@ -1,57 +1,251 @@
-"""Client Open-Meteo pour la météo (sans clé API)."""
+"""
+Client Open-Meteo pour la météo (sans clé API).
+
+Un seul httpx.AsyncClient partagé par le processus : connexions TCP/TLS conservées (keep-alive)
+et réutilisées entre les requêtes, HTTP/2 si le paquet h2 est installé, pool borné par
+WEATHER_HTTP_MAX_CONNECTIONS. Créé au premier appel, fermé à l'arrêt de l'application
+(close_client). Météo actuelle et prévisions passent par le cache helpers/weather_cache.py
+(cellule lat/lon arrondie, TTL par type, stale-while-revalidate).
+
+Appels regroupés (single-flight) : les appelants simultanés pour une même clé (type, cellule ou
+recherche) attendent la même requête en cours au lieu d'en émettre chacun une, par exemple
+quand les widgets du dashboard demandent tous la météo de la même ville à l'ouverture.
+
+Les URLs sont configurables (OPEN_METEO_URL, OPEN_METEO_GEOCODING_URL), par exemple pour
+pointer vers le serveur de test test/open_meteo_stub.py.
+"""
+import asyncio
+import importlib.util
+import math
 import os
-from typing import Any, Dict, Optional, List
+from array import array
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, List, Tuple
 from datetime import datetime, timezone
 import httpx
-from helpers.config import logger
+from prometheus_client import Counter, Gauge
+from helpers.config import (
+    WEATHER_HTTP_TIMEOUT,
+    WEATHER_HTTP_MAX_CONNECTIONS,
+    WEATHER_HTTP_MAX_KEEPALIVE,
+    WEATHER_HTTP_KEEPALIVE_EXPIRY,
+    WEATHER_HTTP2_ENABLED,
+    WEATHER_CURRENT_TTL,
+    WEATHER_FORECAST_TTL,
+    CITY_SEARCH_TTL,
+    logger,
+)
+from helpers.weather_cache import weather_cache, grid_cell
+from helpers.city_index import local_geocoder, merge_suggestions, normalize, CITY_SEARCH_REQUESTS
 
-OPEN_METEO_URL = "https://api.open-meteo.com/v1/forecast"
-OPEN_METEO_GEOCODING_URL = "https://geocoding-api.open-meteo.com/v1/search"
+OPEN_METEO_URL = os.getenv("OPEN_METEO_URL", "https://api.open-meteo.com/v1/forecast")
+OPEN_METEO_GEOCODING_URL = os.getenv("OPEN_METEO_GEOCODING_URL", "https://geocoding-api.open-meteo.com/v1/search")
 DEFAULT_LAT = float(os.getenv("WEATHER_LAT", "48.8566"))
 DEFAULT_LON = float(os.getenv("WEATHER_LON", "2.3522"))
 DEFAULT_CITY = os.getenv("WEATHER_CITY", "Paris")
 
 
+WEATHER_COALESCED_REQUESTS = Counter(
+    "monitoring_weather_coalesced_requests",
+    "Weather lookups that joined an upstream request already in flight for the same key",
+    ["kind"],
+)
+WEATHER_IN_FLIGHT_WAITERS = Gauge(
+    "monitoring_weather_in_flight_waiters",
+    "Callers currently waiting on an in-flight upstream weather request",
+    ["kind"],
+)
+
+_client: Optional[httpx.AsyncClient] = None
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """
+    Client HTTP partagé, créé au premier appel. Ses connexions sont liées à la boucle
+    d'événements courante : une autre boucle (tests, scripts) obtient son propre client.
+    """
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client.is_closed or _client_loop is not loop:
+        # httpx refuse http2=True sans le paquet h2 : HTTP/1.1 keep-alive dans ce cas
+        http2 = WEATHER_HTTP2_ENABLED and importlib.util.find_spec("h2") is not None
+        _client = httpx.AsyncClient(
+            timeout=WEATHER_HTTP_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=WEATHER_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=WEATHER_HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=WEATHER_HTTP_KEEPALIVE_EXPIRY,
+            ),
+            http2=http2,
+        )
+        _client_loop = loop
+        logger.info(f"[WEATHER] HTTP client started (http2={http2}, max_connections={WEATHER_HTTP_MAX_CONNECTIONS})")
+    return _client
+
+
+async def close_client():
+    """Ferme les connexions du client partagé (arrêt de l'application)"""
+    global _client, _client_loop
+    weather_cache.cancel_refreshes()
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+        _client_loop = None
+
+
+# clé -> requête en cours, partagée par les appelants simultanés
+_in_flight: Dict[Hashable, "asyncio.Future[Any]"] = {}
+
+
+async def _single_flight(key: Tuple[Any, ...], fetch: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    Résultat de fetch() ; un appel déjà en cours pour `key` (key[0] = type, label des métriques)
+    est rejoint au lieu d'être relancé. Le résultat est partagé entre les appelants.
+    """
+    task = _in_flight.get(key)
+    if task is None or task.get_loop() is not asyncio.get_running_loop():
+        task = asyncio.ensure_future(fetch())
+        _in_flight[key] = task
+
+        def _done(finished: "asyncio.Future[Any]"):
+            if _in_flight.get(key) is finished:
+                del _in_flight[key]
+
+        task.add_done_callback(_done)
+    else:
+        WEATHER_COALESCED_REQUESTS.labels(key[0]).inc()
+    waiters = WEATHER_IN_FLIGHT_WAITERS.labels(key[0])
+    waiters.inc()
+    try:
+        # shield : l'annulation d'un appelant (client déconnecté) n'annule pas la requête partagée
+        return await asyncio.shield(task)
+    finally:
+        waiters.dec()
+
+
+# Codes météo WMO -> description
+_WEATHER_CODES = {
+    0: "Ciel dégagé",
+    1: "Principalement dégagé",
+    2: "Partiellement nuageux",
+    3: "Nuageux",
+    45: "Brouillard",
+    48: "Brouillard givrant",
+    51: "Bruine légère",
+    61: "Pluie légère",
+    71: "Neige légère",
+    80: "Averses de pluie",
+    95: "Orage",
+}
+
+# Heures de prévision horaire conservées (hourly_24 / hourly_48)
+HOURLY_HOURS = 48
+
+
 def _weather_code_to_description(code: int) -> str:
     """Convertit le code météo WMO en description."""
-    codes = {
-        0: "Ciel dégagé",
-        1: "Principalement dégagé",
-        2: "Partiellement nuageux",
-        3: "Nuageux",
-        45: "Brouillard",
-        48: "Brouillard givrant",
-        51: "Bruine légère",
-        61: "Pluie légère",
-        71: "Neige légère",
-        80: "Averses de pluie",
-        95: "Orage",
-    }
-    return codes.get(code, f"Code {code}")
+    description = _WEATHER_CODES.get(code)
+    return description if description is not None else f"Code {code}"
+
+
+def _float_or_nan(value: Any) -> float:
+    return math.nan if value is None else float(value)
+
+
+def _none_if_nan(value: float) -> Optional[float]:
+    return None if math.isnan(value) else value
 
 
-def fetch_current_weather(
+class HourlyForecast:
+    """
+    Prévisions horaires en colonnes parallèles (heure i : times[i], temperatures[i], ...),
+    décodées une seule fois par réponse de l'API. Valeurs manquantes = NaN ; code manquant = 0.
+    Les tableaux `array` exposent le protocole buffer : np.asarray(temperatures) sans copie.
+    """
+
+    __slots__ = ("times", "temperatures", "codes", "precipitation")
+
+    def __init__(self, times: List[str], temperatures: array, codes: array, precipitation: array):
+        self.times = times
+        self.temperatures = temperatures
+        self.codes = codes
+        self.precipitation = precipitation
+
+    @classmethod
+    def from_response(cls, hourly: Dict[str, Any], hours: int = HOURLY_HOURS) -> "HourlyForecast":
+        times = list((hourly.get("time") or [])[:hours])
+        n = len(times)
+        columns = []
+        for name in ("temperature_2m", "precipitation"):
+            values = (hourly.get(name) or [])[:n]
+            column = array("d", map(_float_or_nan, values))
+            column.extend([math.nan] * (n - len(column)))
+            columns.append(column)
+        codes = array("i", (int(c) if c is not None else 0 for c in (hourly.get("weather_code") or [])[:n]))
+        codes.extend([0] * (n - len(codes)))
+        return cls(times, columns[0], codes, columns[1])
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def rows(self, hours: int) -> List[Dict[str, Any]]:
+        """Les `hours` premières heures au format de l'API (hourly_24, hourly_48)"""
+        return [
+            {
+                "time": t,
+                "temperature": _none_if_nan(temperature),
+                "description": _weather_code_to_description(code),
+                "precipitation": _none_if_nan(precipitation),
+            }
+            for t, temperature, code, precipitation in zip(
+                self.times[:hours], self.temperatures[:hours], self.codes[:hours], self.precipitation[:hours]
+            )
+        ]
+
+    def next_hour_temperature(self) -> Optional[float]:
+        """Température prévue pour la prochaine heure (index 1), None si absente"""
+        return _none_if_nan(self.temperatures[1]) if len(self.times) >= 2 else None
+
+    def next_hour(self) -> Optional[Dict[str, Any]]:
+        if len(self.times) < 2:
+            return None
+        return {
+            "time": self.times[1],
+            "temperature": self.next_hour_temperature(),
+            "description": _weather_code_to_description(self.codes[1]),
+        }
+
+
+async def fetch_current_weather(
     lat: float = DEFAULT_LAT,
     lon: float = DEFAULT_LON,
     city: str = DEFAULT_CITY,
 ) -> Optional[Dict[str, Any]]:
     """
-    Récupère la météo actuelle via Open-Meteo (gratuit, sans clé).
+    Récupère la météo actuelle via Open-Meteo (gratuit, sans clé), en cache WEATHER_CURRENT_TTL s.
     Retourne { temperature, humidity, description, city, updated_at,
                pressure, wind_speed, wind_direction, precipitation } ou None.
     """
+    lat, lon = grid_cell(lat, lon)
+    key = ("current", lat, lon)
+    result = await weather_cache.get(
+        key, WEATHER_CURRENT_TTL, lambda: _single_flight(key, lambda: _fetch_current_weather(lat, lon))
+    )
+    return dict(result, city=city) if result is not None else None
+
+
+async def _fetch_current_weather(lat: float, lon: float) -> Optional[Dict[str, Any]]:
     try:
-        with httpx.Client(timeout=10.0) as client:
-            r = client.get(
-                OPEN_METEO_URL,
-                params={
-                    "latitude": lat,
-                    "longitude": lon,
-                    "current": "temperature_2m,relative_humidity_2m,weather_code,surface_pressure,wind_speed_10m,wind_direction_10m,precipitation",
-                },
-            )
-            r.raise_for_status()
-            data = r.json()
+        r = await get_client().get(
+            OPEN_METEO_URL,
+            params={
+                "latitude": lat,
+                "longitude": lon,
+                "current": "temperature_2m,relative_humidity_2m,weather_code,surface_pressure,wind_speed_10m,wind_direction_10m,precipitation",
+            },
+        )
+        r.raise_for_status()
+        data = r.json()
     except Exception as e:
         logger.warning(f"[WEATHER] Open-Meteo fetch failed: {e}")
         return None
@@ -69,7 +263,6 @@ def fetch_current_weather(
         "temperature": float(temp) if temp is not None else None,
         "humidity": float(humidity) if humidity is not None else None,
         "description": _weather_code_to_description(int(code)),
-        "city": city,
         "updated_at": datetime.now(timezone.utc).isoformat(),
         "pressure": float(pressure) if pressure is not None else None,
         "wind_speed": float(wind_speed) if wind_speed is not None else None,
@@ -78,26 +271,51 @@ def fetch_current_weather(
     }
 
 
-def search_cities(query: str, count: int = 5) -> Optional[List[Dict[str, Any]]]:
+async def search_cities(query: str, count: int = 5) -> Optional[List[Dict[str, Any]]]:
     """
-    Utilise l'API de géocodage Open-Meteo pour suggérer des villes dans le monde entier.
-    Retourne une liste de lieux { name, country, latitude, longitude } ou None en cas d'erreur.
+    Suggère des villes depuis l'index local (helpers/city_index.py), complétées par l'API de
+    géocodage Open-Meteo (villes du monde entier, mémorisées ensuite localement) quand l'index
+    en a moins que `count`. Réponse de l'API en cache CITY_SEARCH_TTL s par recherche.
+    Retourne une liste de lieux { name, country, latitude, longitude } ou None en cas d'erreur
+    (sans résultat local).
     """
     if not query.strip():
         return []
+    # Index local (quelques µs) ; l'API seulement s'il ne remplit pas la liste
+    local = local_geocoder.search(query, count)
+    if len(local) >= count:
+        CITY_SEARCH_REQUESTS.labels("local").inc()
+        return local
+    CITY_SEARCH_REQUESTS.labels("upstream").inc()
+    key = ("search", normalize(query), count)
+    results = await weather_cache.get(
+        key, CITY_SEARCH_TTL, lambda: _single_flight(key, lambda: _search_and_learn(query, count))
+    )
+    if results is None:
+        return local or None
+    return merge_suggestions(count, local, results)
+
+
+async def _search_and_learn(query: str, count: int) -> Optional[List[Dict[str, Any]]]:
+    results = await _search_cities(query, count)
+    if results is not None:
+        local_geocoder.add(results)
+    return results
+
+
+async def _search_cities(query: str, count: int) -> Optional[List[Dict[str, Any]]]:
     try:
-        with httpx.Client(timeout=10.0) as client:
-            r = client.get(
-                OPEN_METEO_GEOCODING_URL,
-                params={
-                    "name": query,
-                    "count": count,
-                    "language": "fr",
-                    "format": "json",
-                },
-            )
-            r.raise_for_status()
-            data = r.json()
+        r = await get_client().get(
+            OPEN_METEO_GEOCODING_URL,
+            params={
+                "name": query,
+                "count": count,
+                "language": "fr",
+                "format": "json",
+            },
+        )
+        r.raise_for_status()
+        data = r.json()
     except Exception as e:
         logger.warning(f"[WEATHER] Open-Meteo geocoding failed: {e}")
         return None
@@ -111,12 +329,22 @@ def search_cities(query: str, count: int = 5) -> Optional[List[Dict[str, Any]]]:
                 "country": item.get("country"),
                 "latitude": item.get("latitude"),
                 "longitude": item.get("longitude"),
+                "population": item.get("population"),
             }
         )
     return suggestions
 
 
-def fetch_forecast(
+async def _cached_forecast(lat: float, lon: float) -> Optional[Dict[str, Any]]:
+    """{ daily[], hourly: HourlyForecast } de la cellule, depuis le cache (7 jours, WEATHER_FORECAST_TTL s)"""
+    lat, lon = grid_cell(lat, lon)
+    key = ("forecast", lat, lon)
+    return await weather_cache.get(
+        key, WEATHER_FORECAST_TTL, lambda: _single_flight(key, lambda: _fetch_forecast(lat, lon))
+    )
+
+
+async def fetch_forecast(
     lat: float = DEFAULT_LAT,
     lon: float = DEFAULT_LON,
     city: str = DEFAULT_CITY,
@@ -124,32 +352,53 @@ def fetch_forecast(
 ) -> Optional[Dict[str, Any]]:
     """
     Récupère les prévisions sur 7 jours + données horaires (pour prédiction 1h).
-    Retourne { city, daily[], hourly_24[], next_hour } ou None.
+    Retourne { city, daily[], hourly_24[], hourly_48[], next_hour } ou None.
+    Une seule entrée de cache par cellule (prévisions 7 jours) sert toutes les valeurs de `days`.
     """
+    forecast = await _cached_forecast(lat, lon)
+    if forecast is None:
+        return None
+    hourly: HourlyForecast = forecast["hourly"]
+    return {
+        "city": city,
+        "daily": forecast["daily"][:min(max(days, 1), 7)],
+        "hourly_24": hourly.rows(24),
+        "hourly_48": hourly.rows(48),
+        "next_hour": hourly.next_hour(),
+    }
+
+
+async def fetch_hourly_forecast(lat: float = DEFAULT_LAT, lon: float = DEFAULT_LON) -> Optional[HourlyForecast]:
+    """Prévisions horaires en colonnes (routes de prédiction : températures sans liste de dicts)"""
+    forecast = await _cached_forecast(lat, lon)
+    return forecast["hourly"] if forecast is not None else None
+
+
+async def _fetch_forecast(lat: float, lon: float) -> Optional[Dict[str, Any]]:
     try:
-        with httpx.Client(timeout=10.0) as client:
-            r = client.get(
-                OPEN_METEO_URL,
-                params={
-                    "latitude": lat,
-                    "longitude": lon,
-                    "daily": "temperature_2m_max,temperature_2m_min,weather_code,precipitation_sum,wind_speed_10m_max",
-                    "hourly": "temperature_2m,weather_code,precipitation",
-                    "forecast_days": min(max(days, 1), 7),
-                },
-            )
-            r.raise_for_status()
-            data = r.json()
+        r = await get_client().get(
+            OPEN_METEO_URL,
+            params={
+                "latitude": lat,
+                "longitude": lon,
+                "daily": "temperature_2m_max,temperature_2m_min,weather_code,precipitation_sum,wind_speed_10m_max",
+                "hourly": "temperature_2m,weather_code,precipitation",
+                "forecast_days": 7,
+            },
+        )
+        r.raise_for_status()
+        data = r.json()
     except Exception as e:
         logger.warning(f"[WEATHER] Open-Meteo forecast failed: {e}")
         return None
 
-    daily_times = data.get("daily", {}).get("time") or []
-    daily_max = data.get("daily", {}).get("temperature_2m_max") or []
-    daily_min = data.get("daily", {}).get("temperature_2m_min") or []
-    daily_codes = data.get("daily", {}).get("weather_code") or []
-    daily_precip = data.get("daily", {}).get("precipitation_sum") or []
-    daily_wind = data.get("daily", {}).get("wind_speed_10m_max") or []
+    daily_data = data.get("daily") or {}
+    daily_times = daily_data.get("time") or []
+    daily_max = daily_data.get("temperature_2m_max") or []
+    daily_min = daily_data.get("temperature_2m_min") or []
+    daily_codes = daily_data.get("weather_code") or []
+    daily_precip = daily_data.get("precipitation_sum") or []
+    daily_wind = daily_data.get("wind_speed_10m_max") or []
 
     daily: List[Dict[str, Any]] = []
     for i, t in enumerate(daily_times):
@@ -162,43 +411,5 @@ def fetch_forecast(
             "wind_speed_max": float(daily_wind[i]) if i < len(daily_wind) else None,
         })
 
-    hourly_times = data.get("hourly", {}).get("time") or []
-    hourly_temps = data.get("hourly", {}).get("temperature_2m") or []
-    hourly_codes = data.get("hourly", {}).get("weather_code") or []
-    hourly_precip = data.get("hourly", {}).get("precipitation") or []
-
-    hourly_24: List[Dict[str, Any]] = []
-    for i, t in enumerate(hourly_times[:24]):
-        hourly_24.append({
-            "time": t,
-            "temperature": float(hourly_temps[i]) if i < len(hourly_temps) else None,
-            "description": _weather_code_to_description(int(hourly_codes[i]) if i < len(hourly_codes) else 0),
-            "precipitation": float(hourly_precip[i]) if i < len(hourly_precip) else None,
-        })
-
-    # Prévisions 48h (2 jours) pour horizon plus long que 1h
-    hourly_48: List[Dict[str, Any]] = []
-    for i, t in enumerate(hourly_times[:48]):
-        hourly_48.append({
-            "time": t,
-            "temperature": float(hourly_temps[i]) if i < len(hourly_temps) else None,
-            "description": _weather_code_to_description(int(hourly_codes[i]) if i < len(hourly_codes) else 0),
-            "precipitation": float(hourly_precip[i]) if i < len(hourly_precip) else None,
-        })
-
-    # Prédiction "prochaine heure" = première heure future (index 1)
-    next_hour: Optional[Dict[str, Any]] = None
-    if len(hourly_times) >= 2 and len(hourly_temps) >= 2:
-        next_hour = {
-            "time": hourly_times[1],
-            "temperature": float(hourly_temps[1]) if hourly_temps[1] is not None else None,
-            "description": _weather_code_to_description(int(hourly_codes[1]) if len(hourly_codes) > 1 else 0),
-        }
-
-    return {
-        "city": city,
-        "daily": daily,
-        "hourly_24": hourly_24,
-        "hourly_48": hourly_48,
-        "next_hour": next_hour,
-    }
+    # Horaires : une seule passe, en colonnes (hourly_24 / hourly_48 / next_hour en sont des vues)
+    return {"daily": daily, "hourly": HourlyForecast.from_response(data.get("hourly") or {})}
@@ -4,10 +4,33 @@ from fastapi.responses import Response
 import socketio
 from prometheus_client import REGISTRY, generate_latest, CONTENT_TYPE_LATEST
 
-from controllers.monitoring_controller import router
-from helpers.rabbitmq_consumer import start_rabbitmq_consumer
+from controllers.monitoring_controller import router, monitoring_service
+from helpers.rabbitmq_consumer import start_rabbitmq_consumer, publish_documents
+from helpers.consumer_pool import ConsumerPool
+from helpers.model_executor import model_executor
+from helpers.weather_client import close_client as close_weather_client
+from helpers.city_index import local_geocoder
+from helpers.anomaly_detector import anomaly_detector
+from helpers.weather_client import fetch_current_weather
+from helpers.lazy_import import warm_up
+from helpers.config import (
+    INGEST_WORKERS,
+    TIMESTAMP_MIGRATION_ENABLED,
+    USE_TIMESERIES,
+    RETENTION_ENABLED,
+    RETENTION_PURGE_INTERVAL,
+    IMPORT_WARMUP_ENABLED,
+    IMPORT_WARMUP_DELAY,
+    ANOMALY_DETECTION_ENABLED,
+    ANOMALY_WEATHER_REFRESH,
+    ANOMALY_WEATHER_LAT,
+    ANOMALY_WEATHER_LON,
+    logger,
+)
+from dal.indexes import ensure_indexes_async
+from dal.timestamp_migration import migrate_string_timestamps
+from dal.retention_dao import purge_expired
 import asyncio
-import threading
 
 app = FastAPI(
     title="Monitoring app",
@@ -20,9 +43,13 @@ sio = socketio.AsyncServer(cors_allowed_origins="*", async_mode="asgi")
 socket_app = socketio.ASGIApp(sio, app)
 
 # Store socket manager globally for RabbitMQ consumer
-from helpers.socket_manager import set_socket_manager, set_event_loop
+from helpers.socket_manager import set_socket_manager
 set_socket_manager(sio)
 
+_consumer_task = None
+_consumer_pool = None
+_background_tasks = []
+
 # Include router
 app.include_router(router)
 
@@ -33,15 +60,99 @@ def metrics():
     return Response(content=generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
 
 
-# Start RabbitMQ consumer in background thread
+# Start RabbitMQ consumer as a task on the app's event loop
 @app.on_event("startup")
 async def startup_event():
-    """Start RabbitMQ consumer when app starts"""
-    set_event_loop(asyncio.get_running_loop())
-    consumer_thread = threading.Thread(target=start_rabbitmq_consumer, daemon=True)
-    consumer_thread.start()
+    """Ensure MongoDB indexes, warm caches, then start RabbitMQ consumer (or the multi-process consumer pool)"""
+    global _consumer_task, _consumer_pool
+    try:
+        await ensure_indexes_async()
+    except Exception as e:
+        logger.error(f"[MONGO] Could not ensure indexes: {e}")
+    try:
+        warmed = await monitoring_service.warm_latest_cache()
+        logger.info(f"[CACHE] Latest-value cache warmed with {warmed} device(s)")
+    except Exception as e:
+        logger.error(f"[CACHE] Could not warm latest-value cache: {e}")
+    # Map the city index (built from CITY_INDEX_SOURCE if missing) off the event loop
+    await asyncio.to_thread(local_geocoder.open)
+    # Time-series collections only accept datetime timestamps: nothing to migrate there
+    if TIMESTAMP_MIGRATION_ENABLED and not USE_TIMESERIES:
+        _background_tasks.append(asyncio.create_task(_run_timestamp_migration()))
+    if RETENTION_ENABLED:
+        _background_tasks.append(asyncio.create_task(_run_retention()))
+    if IMPORT_WARMUP_ENABLED:
+        _background_tasks.append(asyncio.create_task(_warm_up_imports()))
+    if ANOMALY_DETECTION_ENABLED:
+        if ANOMALY_WEATHER_LAT is not None and ANOMALY_WEATHER_LON is not None:
+            _background_tasks.append(asyncio.create_task(_refresh_anomaly_weather()))
+        else:
+            logger.info("[ANOMALY] ANOMALY_WEATHER_LAT/LON not set: weather deviation rule disabled")
+    if INGEST_WORKERS > 0:
+        _consumer_pool = ConsumerPool(INGEST_WORKERS)
+        _consumer_pool.start()
+        _consumer_task = asyncio.create_task(_consumer_pool.run(publish_documents))
+        print(f"[OK] RabbitMQ consumer pool started ({INGEST_WORKERS} worker processes)")
+        return
+    _consumer_task = asyncio.create_task(start_rabbitmq_consumer())
     print("[OK] RabbitMQ consumer started in background")
 
 
+async def _run_timestamp_migration():
+    """Convert legacy string timestamps in the background"""
+    try:
+        await migrate_string_timestamps()
+    except Exception as e:
+        logger.error(f"[MIGRATION] Timestamp migration failed: {e}")
+
+
+async def _warm_up_imports():
+    """Import the lazily loaded modules (NumPy) off the event loop, once startup is done"""
+    await asyncio.sleep(IMPORT_WARMUP_DELAY)
+    try:
+        await asyncio.to_thread(warm_up)
+    except Exception as e:
+        logger.error(f"[WARMUP] Import warm-up failed: {e}")
+
+
+async def _refresh_anomaly_weather():
+    """Keep the anomaly detector's reference weather temperature current (served from the weather cache)"""
+    while True:
+        try:
+            weather = await fetch_current_weather(ANOMALY_WEATHER_LAT, ANOMALY_WEATHER_LON)
+            anomaly_detector.set_weather(weather.get("temperature") if weather else None)
+        except Exception as e:
+            logger.error(f"[ANOMALY] Could not refresh reference weather: {e}")
+        await asyncio.sleep(ANOMALY_WEATHER_REFRESH)
+
+
+async def _run_retention():
+    """Apply retention policies every RETENTION_PURGE_INTERVAL seconds"""
+    while True:
+        try:
+            await purge_expired()
+        except Exception as e:
+            logger.error(f"[RETENTION] Purge failed: {e}")
+        await asyncio.sleep(RETENTION_PURGE_INTERVAL)
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop RabbitMQ consumer and background tasks when app stops"""
+    for task in [_consumer_task, *_background_tasks]:
+        if task is None:
+            continue
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    if _consumer_pool is not None:
+        _consumer_pool.stop()
+    model_executor.shutdown()
+    await close_weather_client()
+    local_geocoder.close()
+
+
 if __name__ == "__main__":
     uvicorn.run(socket_app, host="0.0.0.0", port=8002, reload=True)
@@ -1,11 +1,13 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import List, Literal, Optional, Union
 from datetime import datetime
+from enum import Enum
 
 
 class DeviceDataResponse(BaseModel):
     _id: Optional[str] = None
     device_id: str
+    device_type: Optional[str] = None
     temperature: Optional[float] = None
     humidity: Optional[float] = None
     cpu: Optional[float] = None
@@ -18,7 +20,41 @@ class DeviceDataResponse(BaseModel):
 
 class DeviceDataRequest(BaseModel):
     device_id: str
+    device_type: Optional[str] = None
     temperature: Optional[float] = None
     humidity: Optional[float] = None
     status: Optional[str] = None
     timestamp: Optional[str] = None
+
+
+class RollupMetric(BaseModel):
+    min: Optional[float] = None
+    max: Optional[float] = None
+    avg: Optional[float] = None
+    count: int = 0
+    last: Optional[float] = None
+
+
+class DeviceRollupResponse(BaseModel):
+    device_id: str
+    resolution: str
+    bucket_start: str
+    count: int = 0
+    last_timestamp: Optional[str] = None
+    temperature: Optional[RollupMetric] = None
+    humidity: Optional[RollupMetric] = None
+    cpu: Optional[RollupMetric] = None
+    memory_percent: Optional[RollupMetric] = None
+    disk_percent: Optional[RollupMetric] = None
+
+
+class PredictionMethod(str, Enum):
+    linear_regression = "linear_regression"
+    holt_winters = "holt_winters"
+
+
+class BatchPredictionRequest(BaseModel):
+    device_ids: Union[List[str], Literal["all"]] = "all"
+    horizon_seconds: float = Field(default=60.0, ge=1.0, le=3600.0)
+    limit: int = Field(default=30, ge=2, le=100)
+    method: PredictionMethod = PredictionMethod.linear_regression
@@ -0,0 +1,88 @@
+"""
+Benchmark : régression par requête (sklearn LinearRegression, comme avant) vs forme close
+sur les tableaux du buffer vs sommes incrémentales de la fenêtre glissante (DeviceRingBuffer).
+Vérifie aussi que pente et ordonnée sont identiques (aux arrondis flottants près).
+
+Usage (depuis Microservices/monitoring, après pip install -r requirements-bench.txt) :
+    python -m scripts.bench_regression [--window 30] [--readings 5000] [--repeat 2000]
+"""
+import argparse
+import sys
+import time
+from typing import Callable
+
+import numpy as np
+from sklearn.linear_model import LinearRegression
+
+from helpers.regression import ols_fit, predict_at
+from helpers.ring_buffer import DeviceRingBuffer
+
+
+def _per_call_us(fn: Callable[[], object], repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--window", type=int, default=30, help="Nombre de points de la régression")
+    parser.add_argument("--readings", type=int, default=5000, help="Lectures simulées (ingestion)")
+    parser.add_argument("--repeat", type=int, default=2000, help="Appels mesurés par méthode")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    # Une lecture toutes les ~10 s autour de 21 °C avec une dérive lente
+    times = 1.7e9 + np.cumsum(rng.uniform(5.0, 15.0, args.readings))
+    values = 21.0 + 0.0005 * (times - times[0]) + rng.normal(0.0, 0.3, args.readings)
+
+    buf = DeviceRingBuffer(depth=max(200, args.window), window=args.window)
+    start = time.perf_counter()
+    for ts, value in zip(times.tolist(), values.tolist()):
+        buf.append(ts, value)
+    ingest_us = (time.perf_counter() - start) / args.readings * 1e6
+
+    t_win, y_win = buf.view(args.window)
+    next_ts = float(t_win[-1]) + 60.0
+
+    def sklearn_path():
+        model = LinearRegression()
+        model.fit(np.asarray(t_win).reshape(-1, 1), y_win)
+        return float(model.predict([[next_ts]])[0])
+
+    def closed_form_path():
+        return predict_at(ols_fit(t_win, y_win), next_ts)
+
+    def streaming_path():
+        return predict_at(buf.window_fit(args.window), next_ts)
+
+    model = LinearRegression().fit(np.asarray(t_win).reshape(-1, 1), y_win)
+    ref_slope = float(model.coef_[0])
+    ref_pred = sklearn_path()
+    ok = True
+    print(f"Fenêtre de {args.window} points, {args.readings} lectures ingérées")
+    print(f"{'méthode':<14}{'µs/appel':>12}{'Δ pente':>14}{'Δ prédiction':>16}")
+    for name, fn, fit in (
+        ("sklearn", sklearn_path, None),
+        ("forme close", closed_form_path, ols_fit(t_win, y_win)),
+        ("incrémental", streaming_path, buf.window_fit(args.window)),
+    ):
+        us = _per_call_us(fn, args.repeat)
+        if fit is None:
+            print(f"{name:<14}{us:>12.1f}{'-':>14}{'-':>16}")
+            continue
+        d_slope = abs(fit[0] - ref_slope)
+        d_pred = abs(predict_at(fit, next_ts) - ref_pred)
+        ok = ok and d_slope <= 1e-9 * max(1.0, abs(ref_slope)) and d_pred <= 1e-6
+        print(f"{name:<14}{us:>12.1f}{d_slope:>14.2e}{d_pred:>16.2e}")
+    print(f"Mise à jour incrémentale à l'ingestion : {ingest_us:.2f} µs/lecture (buffer + sommes)")
+    if not ok:
+        print("[FAIL] Écart avec sklearn au-delà des arrondis flottants", file=sys.stderr)
+        return 1
+    print("[OK] Pente et prédiction identiques à sklearn")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""
+Benchmark du démarrage à froid de chaque microservice : temps d'import de main.py (ce que
+paie chaque démarrage de pod ou --reload) dans un interpréteur neuf, et modules lourds
+(numpy) chargés dès le démarrage.
+
+Usage (depuis Microservices/monitoring) :
+    python -m scripts.bench_startup [--runs 5] [--services monitoring signing]
+        [--no-bytecode-cache] [--csv startup_times.csv]
+
+--csv ajoute une ligne par service (date, commit, médianes) pour suivre l'évolution.
+"""
+import argparse
+import csv
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+MICROSERVICES_DIR = Path(__file__).resolve().parents[2]
+HEAVY_MODULES = ("numpy",)
+
+# Exécuté dans le répertoire du service par un interpréteur neuf
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import main
+elapsed = time.perf_counter() - start
+print(json.dumps({"import_s": elapsed, "modules": [m for m in %r if m in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+
+def _services() -> List[str]:
+    return sorted(p.parent.name for p in MICROSERVICES_DIR.glob("*/main.py"))
+
+
+def _run_once(service: str, no_bytecode_cache: bool) -> Dict[str, Any]:
+    env = dict(os.environ)
+    with tempfile.TemporaryDirectory() as pycache:
+        if no_bytecode_cache:
+            # Recompile tout le code (premier démarrage d'une image sans .pyc)
+            env["PYTHONPYCACHEPREFIX"] = pycache
+        start = time.perf_counter()
+        proc = subprocess.run(
+            [sys.executable, "-c", _PROBE],
+            cwd=MICROSERVICES_DIR / service,
+            env=env,
+            capture_output=True,
+            text=True,
+            timeout=120,
+        )
+        wall = time.perf_counter() - start
+    if proc.returncode != 0:
+        lines = proc.stderr.strip().splitlines()
+        raise RuntimeError(lines[-1] if lines else f"exit code {proc.returncode}")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result["wall_s"] = wall
+    return result
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=MICROSERVICES_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Démarrages mesurés par service")
+    parser.add_argument("--services", nargs="*", default=None, help="Services (défaut : tous)")
+    parser.add_argument("--no-bytecode-cache", action="store_true", help="Sans cache .pyc")
+    parser.add_argument("--csv", default=None, help="Fichier CSV auquel ajouter les résultats")
+    args = parser.parse_args()
+
+    rows = []
+    failed = False
+    print(f"{'service':<20}{'import main (ms)':>18}{'processus (ms)':>16}  modules lourds au démarrage")
+    for service in args.services or _services():
+        try:
+            runs = [_run_once(service, args.no_bytecode_cache) for _ in range(args.runs)]
+        except (RuntimeError, subprocess.TimeoutExpired) as e:
+            print(f"{service:<20}{'échec':>18}{'':>16}  {e}")
+            failed = True
+            continue
+        import_ms = statistics.median(r["import_s"] for r in runs) * 1000
+        wall_ms = statistics.median(r["wall_s"] for r in runs) * 1000
+        modules = sorted(set().union(*(r["modules"] for r in runs)))
+        print(f"{service:<20}{import_ms:>18.0f}{wall_ms:>16.0f}  {', '.join(modules) or '-'}")
+        rows.append({
+            "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "revision": _git_revision() or "",
+            "service": service,
+            "runs": args.runs,
+            "bytecode_cache": not args.no_bytecode_cache,
+            "import_main_ms": round(import_ms, 1),
+            "process_ms": round(wall_ms, 1),
+            "heavy_modules": " ".join(modules),
+        })
+
+    if args.csv and rows:
+        path = Path(args.csv)
+        new_file = not path.exists()
+        with path.open("a", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            if new_file:
+                writer.writeheader()
+            writer.writerows(rows)
+        print(f"Résultats ajoutés à {path}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+"""
+Construit l'index local des villes (autocomplétion de /weather/search-city) à partir d'un export
+GeoNames : https://download.geonames.org/export/dump/ (cities500.zip, cities15000.zip, ...,
+décompressé). Sans --dump, l'extrait fourni data/cities_sample.tsv est utilisé.
+
+Usage (depuis Microservices/monitoring) :
+    python -m scripts.build_city_index [--dump cities15000.txt] [--output data/cities.idx]
+        [--min-population 1000] [--country-info countryInfo.txt] [--max-alternate-names 10]
+
+Les workers déjà lancés gardent l'ancien index mappé jusqu'à leur redémarrage (le fichier est
+remplacé atomiquement). Pensez à pointer CITY_INDEX_PATH vers le fichier produit et à vider
+CITY_INDEX_SOURCE pour qu'il ne soit pas reconstruit depuis l'extrait.
+"""
+import argparse
+import os
+import sys
+import time
+from typing import Dict
+
+from helpers.city_index import COUNTRY_NAMES_FR, CityIndex, read_geonames, write_index
+from helpers.config import CITY_INDEX_PATH, CITY_INDEX_SOURCE
+
+
+def _read_country_info(path: str) -> Dict[str, str]:
+    """countryInfo.txt de GeoNames : code ISO (colonne 0) -> nom (colonne 4), noms français prioritaires"""
+    names: Dict[str, str] = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("#"):
+                continue
+            cols = line.rstrip("\n").split("\t")
+            if len(cols) > 4:
+                names[cols[0]] = cols[4]
+    names.update(COUNTRY_NAMES_FR)
+    return names
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Construit l'index local des villes")
+    parser.add_argument("--dump", default=CITY_INDEX_SOURCE, help="Export GeoNames (TSV)")
+    parser.add_argument("--output", default=CITY_INDEX_PATH)
+    parser.add_argument("--min-population", type=int, default=0)
+    parser.add_argument("--country-info", default=None, help="countryInfo.txt de GeoNames")
+    parser.add_argument("--max-alternate-names", type=int, default=10)
+    args = parser.parse_args()
+
+    country_names = _read_country_info(args.country_info) if args.country_info else None
+    start = time.perf_counter()
+    count = write_index(
+        read_geonames(args.dump, args.min_population, country_names, args.max_alternate_names),
+        args.output,
+    )
+    elapsed = time.perf_counter() - start
+    size = os.path.getsize(args.output)
+    print(f"{count} ville(s) indexée(s) dans {args.output} ({size / 1024:.0f} Kio) en {elapsed:.1f} s")
+
+    index = CityIndex(args.output)
+    try:
+        for query in ("pa", "tun", "lon"):
+            start = time.perf_counter()
+            for _ in range(1000):
+                results = index.search(query, 5)
+            per_query = (time.perf_counter() - start) * 1000
+            names = ", ".join(r["name"] for r in results)
+            print(f"  '{query}' : {per_query:.0f} µs/recherche -> {names or '-'}")
+    finally:
+        index.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+"""
+Copie la collection device_data (stockage standard) vers la collection time-series
+(MONGO_STORAGE_BACKEND=timeseries), par lots, en convertissant les timestamps en datetime.
+Les documents sont parcourus par _id croissant et le dernier _id copié est enregistré après
+chaque lot (collection migration_checkpoints) : une copie interrompue reprend après ce point.
+Le premier lot d'une exécution est dédoublonné sur (device_id, timestamp, _id) contre la cible,
+car il a pu être inséré en partie avant l'interruption (une collection time-series n'impose pas
+l'unicité de _id). --restart repart du début.
+Les documents sans timestamp lisible sont ignorés (refusés par une collection time-series).
+
+Usage (depuis Microservices/monitoring) :
+    MONGO_STORAGE_BACKEND=timeseries python -m scripts.copy_to_timeseries [--batch-size 5000] [--restart]
+"""
+import argparse
+import sys
+from typing import Any, Dict, List
+
+from pymongo.errors import BulkWriteError
+
+from helpers.config import db, collection, USE_TIMESERIES, DEVICE_DATA_COLLECTION
+from helpers.timeutils import to_utc_datetime
+from dal.indexes import ensure_indexes
+
+SOURCE_COLLECTION = "device_data"
+CHECKPOINT_ID = "copy_to_timeseries"
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Copie device_data vers la collection time-series")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--restart", action="store_true", help="Ignorer le point de reprise")
+    args = parser.parse_args()
+    if not USE_TIMESERIES:
+        print("MONGO_STORAGE_BACKEND doit valoir 'timeseries'")
+        return 1
+    ensure_indexes()
+
+    source = db[SOURCE_COLLECTION]
+    checkpoints = db["migration_checkpoints"]
+    if args.restart:
+        checkpoints.delete_one({"_id": CHECKPOINT_ID})
+    state = checkpoints.find_one({"_id": CHECKPOINT_ID})
+    last_id = state["last_id"] if state else None
+    if last_id is not None:
+        print(f"Reprise après _id {last_id}")
+    copied = skipped = 0
+    first_batch = True
+    while True:
+        query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+        docs = list(source.find(query).sort("_id", 1).limit(args.batch_size))
+        if not docs:
+            break
+        last_id = docs[-1]["_id"]
+        batch = []
+        for doc in docs:
+            doc["timestamp"] = to_utc_datetime(doc.get("timestamp"))
+            if doc["timestamp"] is None:
+                skipped += 1
+                continue
+            batch.append(doc)
+        if first_batch:
+            batch = _not_copied(batch)
+            first_batch = False
+        if batch:
+            copied += _insert(batch)
+        checkpoints.update_one({"_id": CHECKPOINT_ID}, {"$set": {"last_id": last_id}}, upsert=True)
+    print(f"{copied} document(s) copiés vers {DEVICE_DATA_COLLECTION}, {skipped} ignoré(s)")
+    return 0
+
+
+def _not_copied(batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Documents du lot absents de la cible (recherche par l'index device_id / timestamp)"""
+    if not batch:
+        return batch
+    existing = {
+        doc["_id"]
+        for doc in collection.find(
+            {
+                "device_id": {"$in": list({d.get("device_id") for d in batch})},
+                "timestamp": {
+                    "$gte": min(d["timestamp"] for d in batch),
+                    "$lte": max(d["timestamp"] for d in batch),
+                },
+                "_id": {"$in": [d["_id"] for d in batch]},
+            },
+            {"_id": 1},
+        )
+    }
+    return [d for d in batch if d["_id"] not in existing]
+
+
+def _insert(batch) -> int:
+    try:
+        return len(collection.insert_many(batch, ordered=False).inserted_ids)
+    except BulkWriteError as e:
+        return e.details.get("nInserted", 0)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+"""
+Diagnostic : exécute explain() sur chaque requête du DAL, construite par les mêmes fonctions
+que le DAL (dal/queries.py), agrégations comprises, et échoue si l'une d'elles fait un
+COLLSCAN (index manquant), y compris dans les sous-pipelines $lookup.
+Non vérifiée : le comptage par device_type du rapport de rétention (scan complet, optionnel).
+
+Usage (depuis Microservices/monitoring) :
+    python -m scripts.explain_queries [--device-id device_001] [--create-indexes]
+"""
+import argparse
+import sys
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Tuple
+
+from helpers.config import db, collection, rollup_collection, anomaly_collection
+from dal import queries
+from dal.indexes import ensure_indexes
+from dal.retention_dao import raw_policies
+from dal.rollup_dao import ACTIVE_RESOLUTIONS
+
+
+def _stages(plan: Any) -> List[str]:
+    """Liste récursive des stages d'un plan (winningPlan classique ou SBE queryPlan)"""
+    stages: List[str] = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(_stages(item))
+    return stages
+
+
+def _collection_scans(explain: Any) -> int:
+    """Collection scans des sous-pipelines $lookup (explain executionStats, MongoDB >= 5.0)"""
+    scans = 0
+    if isinstance(explain, dict):
+        scans += explain.get("collectionScans", 0) or 0
+        for value in explain.values():
+            scans += _collection_scans(value)
+    elif isinstance(explain, list):
+        for item in explain:
+            scans += _collection_scans(item)
+    return scans
+
+
+def _dal_queries(device_id: str) -> Dict[str, Tuple[Any, Any]]:
+    """nom -> (collection, FindQuery ou pipeline d'agrégation)"""
+    end = datetime.utcnow()
+    start = end - timedelta(days=1)
+    checks: Dict[str, Tuple[Any, Any]] = {
+        "get_all_data": (collection, queries.all_data(100)),
+        "get_data_by_device_id": (collection, queries.device_data(device_id, 100)),
+        "get_latest_data_by_device_id": (collection, queries.latest_device_data(device_id)),
+        "get_data_by_time_range": (collection, queries.data_by_time_range(device_id, start, end)),
+        "get_recent_temperatures": (collection, queries.recent_temperatures(device_id, 100)),
+        "get_latest_data_per_device": (collection, queries.latest_per_device_pipeline(1000)),
+        "iter_recent_temperatures": (collection, queries.recent_temperatures_pipeline(100)),
+        "iter_recent_temperatures(device_ids)": (
+            collection, queries.recent_temperatures_pipeline(100, device_ids=[device_id])
+        ),
+        "get_temperature_stats": (collection, queries.temperature_stats_pipeline(20.0, 15)),
+        "get_anomalies": (anomaly_collection, queries.anomalies(limit=100)),
+        "get_anomalies(device_id)": (anomaly_collection, queries.anomalies(device_id, limit=100)),
+        "get_anomalies(rule)": (anomaly_collection, queries.anomalies(rule="zscore", limit=100)),
+    }
+    for resolution in ACTIVE_RESOLUTIONS:
+        checks[f"get_rollups({resolution})"] = (
+            rollup_collection, queries.rollups(device_id, resolution, start, end)
+        )
+        checks[f"purge rollups({resolution})"] = (rollup_collection, queries.rollups_expired(resolution, start))
+        checks[f"get_bucket_averages({resolution})"] = (
+            rollup_collection, queries.rollup_series([device_id], resolution, start, "temperature")
+        )
+        checks[f"rollup coverage({resolution})"] = (rollup_collection, queries.rollup_bucket(device_id, resolution, start))
+    for name, policy_filter, _ in raw_policies():
+        checks[f"purge raw({name})"] = (collection, queries.raw_expired(policy_filter, start))
+        checks[f"purge raw coverage({name})"] = (collection, queries.oldest_raw_expired(policy_filter, start))
+    return checks
+
+
+def _explain(coll: Any, query: Any) -> Tuple[List[str], int]:
+    """(stages du plan retenu, collection scans des $lookup)"""
+    if isinstance(query, queries.FindQuery):
+        explain = query.cursor(coll).explain()
+        return _stages(explain["queryPlanner"]["winningPlan"]), 0
+    explain = db.command(
+        "explain", {"aggregate": coll.name, "pipeline": query, "cursor": {}}, verbosity="executionStats"
+    )
+    return _stages(explain), _collection_scans(explain)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Vérifie les plans d'exécution des requêtes du DAL")
+    parser.add_argument("--device-id", default=None, help="Device utilisé pour les requêtes (défaut : un device existant)")
+    parser.add_argument("--create-indexes", action="store_true", help="Crée les index avant la vérification")
+    args = parser.parse_args()
+
+    if args.create_indexes:
+        ensure_indexes()
+    device_id = args.device_id
+    if device_id is None:
+        sample = collection.find_one({}, {"device_id": 1})
+        device_id = sample["device_id"] if sample else "device_001"
+
+    failures = 0
+    for name, (coll, query) in _dal_queries(device_id).items():
+        stages, lookup_scans = _explain(coll, query)
+        status = "COLLSCAN" if "COLLSCAN" in stages or lookup_scans else "OK"
+        if status != "OK":
+            failures += 1
+        print(f"[{status}] {name}: {' <- '.join(stages)}")
+    if failures:
+        print(f"{failures} requête(s) sans index (COLLSCAN)")
+        return 1
+    print("Toutes les requêtes du DAL utilisent un index")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
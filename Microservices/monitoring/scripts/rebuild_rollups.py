@@ -0,0 +1,42 @@
+"""
+Reconstruit les rollups (device_rollups) à partir des lectures brutes, par lots.
+À lancer pour initialiser les rollups sur un historique existant, avant la première purge :
+la rétention ne supprime les lectures brutes que si leurs buckets de rollup existent.
+Les rollups des devices concernés sont supprimés puis recalculés : les lectures ingérées
+pendant la reconstruction peuvent être comptées deux fois, mieux vaut arrêter l'ingestion.
+
+Usage (depuis Microservices/monitoring) :
+    python -m scripts.rebuild_rollups [--device-id device_001] [--batch-size 5000]
+"""
+import argparse
+import sys
+
+from helpers.config import collection, rollup_collection
+from dal.rollup_dao import apply_rollups
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Reconstruit les rollups depuis les lectures brutes")
+    parser.add_argument("--device-id", default=None, help="Limiter à un device")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    query = {"device_id": args.device_id} if args.device_id else {}
+    deleted = rollup_collection.delete_many(query).deleted_count
+    readings = 0
+    batch = []
+    for doc in collection.find(query).batch_size(args.batch_size):
+        batch.append(doc)
+        if len(batch) >= args.batch_size:
+            apply_rollups(batch)
+            readings += len(batch)
+            batch = []
+    if batch:
+        apply_rollups(batch)
+        readings += len(batch)
+    print(f"{deleted} rollup(s) supprimé(s), {readings} lecture(s) agrégée(s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,33 @@
+"""
+Rétention des données : rapport des tailles par tier et purge manuelle.
+
+Usage (depuis Microservices/monitoring) :
+    python -m scripts.retention report [--by-device-type]
+    python -m scripts.retention purge
+"""
+import argparse
+import asyncio
+import json
+import sys
+
+from dal.retention_dao import purge_expired, tier_sizes
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Rétention des données brutes et des rollups")
+    sub = parser.add_subparsers(dest="command", required=True)
+    report = sub.add_parser("report", help="Tailles par tier (brut, rollups 1m/1h/1d)")
+    report.add_argument("--by-device-type", action="store_true", help="Compte les lectures brutes par device_type (scan complet)")
+    sub.add_parser("purge", help="Applique les politiques de rétention une fois")
+    args = parser.parse_args()
+
+    if args.command == "report":
+        result = asyncio.run(tier_sizes(by_device_type=args.by_device_type))
+    else:
+        result = asyncio.run(purge_expired())
+    print(json.dumps(result, indent=2, default=str))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+"""
+Vérification exécutable du client météo (helpers/weather_client.py) contre le serveur
+test/open_meteo_stub.py, sans accès réseau ni service lancé : le stub est démarré sur un port
+libre, le cache et l'index local des villes sont désactivés pour que chaque appel atteigne
+le stub. Contrôle la forme des réponses (météo actuelle, prévisions, recherche de villes) et
+la réutilisation des connexions (en-tête X-Stub-Requests-On-Connection > 1).
+
+Usage (depuis Microservices/monitoring) :
+    PYTHONPATH=. python test/check_weather_client.py
+
+Code de sortie 0 si toutes les vérifications passent, 1 sinon.
+"""
+import asyncio
+import os
+import sys
+import threading
+from http.server import ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from open_meteo_stub import OpenMeteoStubHandler  # noqa: E402
+
+ROUNDS = 3
+
+
+def _start_stub() -> ThreadingHTTPServer:
+    """Stub sur un port libre, servi dans un thread (arrêté par server.shutdown())"""
+    OpenMeteoStubHandler.log_message = lambda self, format, *args: None
+    server = ThreadingHTTPServer(("127.0.0.1", 0), OpenMeteoStubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def _check(weather_client) -> None:
+    ranks = []
+
+    async def on_response(response):
+        ranks.append(int(response.headers.get("X-Stub-Requests-On-Connection", 0)))
+
+    weather_client.get_client().event_hooks["response"].append(on_response)
+    try:
+        for _ in range(ROUNDS):
+            current = await weather_client.fetch_current_weather(36.8065, 10.1815, "Tunis")
+            assert current is not None, "météo actuelle : pas de réponse"
+            assert current["city"] == "Tunis", current
+            for field in ("temperature", "humidity", "description", "updated_at"):
+                assert field in current, f"météo actuelle : champ {field} absent"
+
+            forecast = await weather_client.fetch_forecast(48.8566, 2.3522, "Paris", days=3)
+            assert forecast is not None, "prévisions : pas de réponse"
+            assert len(forecast["daily"]) == 3, forecast["daily"]
+            assert len(forecast["hourly_24"]) == 24, len(forecast["hourly_24"])
+            assert len(forecast["hourly_48"]) == 48, len(forecast["hourly_48"])
+            assert forecast["next_hour"] is not None, "prévisions : next_hour absent"
+
+            cities = await weather_client.search_cities("Sf", 5)
+            assert cities and cities[0]["name"] == "Sfax", cities
+            assert await weather_client.search_cities("Zzz", 5) == [], "recherche sans résultat"
+    finally:
+        await weather_client.close_client()
+    assert ranks, "aucune réponse du stub"
+    assert max(ranks) > 1, f"connexions non réutilisées (rangs {ranks})"
+    print(f"[CHECK] {len(ranks)} requête(s), jusqu'à {max(ranks)} par connexion")
+
+
+def main() -> int:
+    server = _start_stub()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ["OPEN_METEO_URL"] = f"{base}/v1/forecast"
+    os.environ["OPEN_METEO_GEOCODING_URL"] = f"{base}/v1/search"
+    os.environ["WEATHER_CACHE_ENABLED"] = "false"
+    os.environ["CITY_INDEX_ENABLED"] = "false"
+    # Après la configuration : les URLs sont lues à l'import
+    from helpers import weather_client
+
+    try:
+        asyncio.run(_check(weather_client))
+    except AssertionError as e:
+        print(f"[CHECK] ÉCHEC : {e}")
+        return 1
+    finally:
+        server.shutdown()
+    print("[CHECK] OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
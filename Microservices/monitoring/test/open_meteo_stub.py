@@ -0,0 +1,148 @@
+"""
+Serveur local imitant Open-Meteo (prévisions + géocodage) pour tester les routes /weather/*
+sans accès réseau, de façon déterministe.
+
+Usage (depuis Microservices/monitoring) :
+    python test/open_meteo_stub.py [--port 8099] [--delay 0.0] [--fail-rate 0.0]
+
+puis lancer le service avec :
+    OPEN_METEO_URL=http://localhost:8099/v1/forecast
+    OPEN_METEO_GEOCODING_URL=http://localhost:8099/v1/search
+
+et exécuter les requêtes /weather/* de test/api_test.http. Chaque réponse porte l'en-tête
+X-Stub-Requests-On-Connection (rang de la requête sur sa connexion TCP) : une valeur > 1
+confirme que le client du service réutilise ses connexions (keep-alive). --delay simule la
+latence de l'API, --fail-rate une proportion de réponses 503.
+
+test/check_weather_client.py démarre ce stub lui-même et vérifie automatiquement le client
+météo (forme des réponses et réutilisation des connexions).
+"""
+import argparse
+import json
+import math
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+from urllib.parse import parse_qs, urlparse
+
+CITIES = [
+    {"name": "Paris", "country": "France", "latitude": 48.8566, "longitude": 2.3522},
+    {"name": "Lyon", "country": "France", "latitude": 45.7640, "longitude": 4.8357},
+    {"name": "Marseille", "country": "France", "latitude": 43.2965, "longitude": 5.3698},
+    {"name": "Tunis", "country": "Tunisie", "latitude": 36.8065, "longitude": 10.1815},
+    {"name": "Sfax", "country": "Tunisie", "latitude": 34.7406, "longitude": 10.7603},
+]
+
+
+def _temperature(lat: float, hour: int) -> float:
+    """Température synthétique : plus chaud vers l'équateur, cycle journalier (max à 15 h)"""
+    return round(25.0 - abs(lat) / 3.0 + 5.0 * math.cos((hour - 15) * math.pi / 12), 1)
+
+
+def _current(lat: float) -> Dict[str, Any]:
+    hour = datetime.now(timezone.utc).hour
+    return {
+        "time": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:00"),
+        "temperature_2m": _temperature(lat, hour),
+        "relative_humidity_2m": 65,
+        "weather_code": 2,
+        "surface_pressure": 1013.2,
+        "wind_speed_10m": 12.4,
+        "wind_direction_10m": 240,
+        "precipitation": 0.0,
+    }
+
+
+def _forecast(lat: float, days: int) -> Dict[str, Any]:
+    start = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    hours = [start + timedelta(hours=i) for i in range(24 * days)]
+    hourly_temps = [_temperature(lat, h.hour) for h in hours]
+    dates: List[str] = sorted({h.strftime("%Y-%m-%d") for h in hours})[:days]
+    return {
+        "daily": {
+            "time": dates,
+            "temperature_2m_max": [max(hourly_temps[i * 24:(i + 1) * 24]) for i in range(len(dates))],
+            "temperature_2m_min": [min(hourly_temps[i * 24:(i + 1) * 24]) for i in range(len(dates))],
+            "weather_code": [2] * len(dates),
+            "precipitation_sum": [0.4] * len(dates),
+            "wind_speed_10m_max": [18.0] * len(dates),
+        },
+        "hourly": {
+            "time": [h.strftime("%Y-%m-%dT%H:00") for h in hours],
+            "temperature_2m": hourly_temps,
+            "weather_code": [2] * len(hours),
+            "precipitation": [0.0] * len(hours),
+        },
+    }
+
+
+class OpenMeteoStubHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 : connexions conservées entre les requêtes (keep-alive)
+    protocol_version = "HTTP/1.1"
+    delay = 0.0
+    fail_rate = 0.0
+
+    def setup(self):
+        super().setup()
+        self.requests_on_connection = 0
+
+    def do_GET(self):
+        self.requests_on_connection += 1
+        if self.delay > 0:
+            time.sleep(self.delay)
+        if random.random() < self.fail_rate:
+            self._send(503, {"error": True, "reason": "stub failure"})
+            return
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        if url.path == "/v1/forecast":
+            lat = float(params.get("latitude", 48.8566))
+            body: Dict[str, Any] = {"latitude": lat, "longitude": float(params.get("longitude", 2.3522))}
+            if "current" in params:
+                body["current"] = _current(lat)
+            if "daily" in params or "hourly" in params:
+                body.update(_forecast(lat, min(max(int(params.get("forecast_days", 7)), 1), 16)))
+            self._send(200, body)
+        elif url.path == "/v1/search":
+            name = params.get("name", "").lower()
+            count = int(params.get("count", 10))
+            results = [c for c in CITIES if c["name"].lower().startswith(name)][:count]
+            self._send(200, {"results": results} if results else {})
+        else:
+            self._send(404, {"error": True, "reason": f"unknown path {url.path}"})
+
+    def _send(self, status: int, body: Dict[str, Any]):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.send_header("X-Stub-Requests-On-Connection", str(self.requests_on_connection))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        print(f"[STUB] {self.client_address[0]}:{self.client_address[1]} {format % args}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serveur Open-Meteo de test")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--delay", type=float, default=0.0, help="Latence simulée (s)")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Proportion de réponses 503")
+    args = parser.parse_args()
+    OpenMeteoStubHandler.delay = args.delay
+    OpenMeteoStubHandler.fail_rate = args.fail_rate
+    server = ThreadingHTTPServer(("0.0.0.0", args.port), OpenMeteoStubHandler)
+    print(f"[STUB] Open-Meteo stub listening on http://localhost:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
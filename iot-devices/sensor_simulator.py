@@ -88,6 +88,8 @@ class SensorSimulator:
                 body=json.dumps(message),
                 properties=pika.BasicProperties(
                     delivery_mode=2,  # Message persistant
+                    # Clé de partitionnement du monitoring (x-consistent-hash sur l'en-tête device_id)
+                    headers={"device_id": message["device_id"]},
                 ),
             )
             print(f"[SENT] Device {self.device_id}: {json.dumps(data)}")
@@ -111,7 +113,10 @@ class SensorSimulator:
                     exchange=self.exchange,
                     routing_key="device.data",
                     body=json.dumps(message),
-                    properties=pika.BasicProperties(delivery_mode=2),
+                    properties=pika.BasicProperties(
+                        delivery_mode=2,
+                        headers={"device_id": message["device_id"]},
+                    ),
                 )
             except Exception as retry_error:
                 print(f"[ERROR] Réessai échoué: {retry_error}")